@@ -1,6 +1,96 @@
 import opensmile
 import librosa
+import numpy as np
 import json
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from instrumentation import profiled
+
+
+class SmileExtractorPool:
+    """
+    A process-wide pool of reusable OpenSMILE extractors.
+
+    Building an `opensmile.Smile` parses its configuration and sets up the native
+    extractor, which costs more than processing a short clip. Extractors are kept
+    per (feature set, feature level) and lent out one borrower at a time, so
+    several threads can extract concurrently without sharing an extractor.
+
+    Attributes
+    ----------
+    hits : int
+        Number of borrows served by an idle extractor.
+    misses : int
+        Number of borrows that had to build a new extractor.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = defaultdict(list)
+        self.hits = 0
+        self.misses = 0
+
+    @contextmanager
+    def borrow(self, feature_set, feature_level):
+        """
+        Lends an extractor for the given configuration and takes it back afterwards.
+
+        Parameters
+        ----------
+        feature_set : opensmile.FeatureSet
+            The OpenSMILE feature set.
+        feature_level : opensmile.FeatureLevel
+            The OpenSMILE feature level.
+
+        Yields
+        ------
+        opensmile.Smile
+            An extractor no other borrower is using.
+        """
+        key = (feature_set, feature_level)
+        with self._lock:
+            smile = self._idle[key].pop() if self._idle[key] else None
+            if smile is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if smile is None:
+            smile = opensmile.Smile(
+                feature_set=feature_set, feature_level=feature_level
+            )
+
+        try:
+            yield smile
+        finally:
+            with self._lock:
+                self._idle[key].append(smile)
+
+    def stats(self):
+        """
+        Returns the hit/miss counts and the number of idle extractors.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "idle": sum(len(extractors) for extractors in self._idle.values()),
+            }
+
+    def clear(self):
+        """
+        Drops every idle extractor and resets the counters.
+        """
+        with self._lock:
+            self._idle.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Shared by every AudioAnalysis instance in this process
+SMILE_POOL = SmileExtractorPool()
 
 
 class AudioAnalysis:
@@ -18,6 +108,12 @@ class AudioAnalysis:
         The feature set configuration for OpenSMILE, by default opensmile.FeatureSet.eGeMAPSv02.
     opensmile_feature_level : opensmile.FeatureLevel, optional
         The feature level for feature extraction, by default opensmile.FeatureLevel.LowLevelDescriptors.
+        Use opensmile.FeatureLevel.Functionals for one row of per-clip statistics.
+    feature_columns : list of str, optional
+        Descriptors to keep, by default None which keeps all of them. The others are
+        dropped right after extraction.
+    feature_dtype : np.dtype, optional
+        Dtype the features are stored as, by default np.float32.
 
     Attributes
     ----------
@@ -30,13 +126,15 @@ class AudioAnalysis:
     spectrogram_path : str or None
         Path to the spectrogram data file.
     audio_data : np.ndarray or None
-        Loaded audio data.
+        Loaded audio data. Read from `audio_file_path` on first access unless a
+        signal was given with `load_signal`.
     segment_data : dict or None
         Loaded segmentation data.
     spectrogram_data : np.ndarray or None
-        Loaded spectrogram data.
+        Loaded spectrogram data. Read from `spectrogram_path` on first access.
     feature_data : pd.DataFrame or None
-        Extracted feature data.
+        Extracted feature data. Extracted on first access if not computed yet,
+        None without retrying once an extraction failed.
     default_figsize : tuple
         Default figure size for all plots.
     sample_rate : int or None
@@ -45,6 +143,10 @@ class AudioAnalysis:
         OpenSMILE feature set used for feature extraction.
     opensmile_feature_level : opensmile.FeatureLevel
         OpenSMILE feature level for feature extraction.
+    feature_columns : list of str or None
+        Descriptors kept in `feature_data`, None for all of them.
+    feature_dtype : np.dtype
+        Dtype of `feature_data`.
     """
 
     def __init__(
@@ -53,21 +155,72 @@ class AudioAnalysis:
         sample_rate=None,
         opensmile_feature_set=opensmile.FeatureSet.eGeMAPSv02,
         opensmile_feature_level=opensmile.FeatureLevel.LowLevelDescriptors,
+        feature_columns=None,
+        feature_dtype=np.float32,
     ):
         # Initialize attributes with default values or provided parameters
         self.audio_file_path = None
         self.segment_info_path = None
         self.mapping_file_path = None  # Placeholder for future use
         self.spectrogram_path = None
-        self.audio_data = None
+        # Audio, spectrogram and features are loaded lazily, see the properties below
+        self._audio_data = None
+        self._signal_loaded = False  # True when the audio came from load_signal
         self.segment_data = None
-        self.spectrogram_data = None
-        self.feature_data = None  # To store the extracted features
+        self._spectrogram_data = None
+        self._feature_data = None  # To store the extracted features
+        # Set when extraction failed, so reading feature_data does not retry it
+        self._extraction_failed = False
         self.default_figsize = default_figsize
         self.sample_rate = sample_rate
         self.opensmile_feature_set = opensmile_feature_set
         self.opensmile_feature_level = opensmile_feature_level
+        self.feature_columns = (
+            None if feature_columns is None else list(feature_columns)
+        )
+        self.feature_dtype = feature_dtype
+
+    @property
+    def audio_data(self):
+        if self._audio_data is None and self.audio_file_path is not None:
+            self._audio_data = self._load_data(self.audio_file_path, "audio")
+        return self._audio_data
+
+    @audio_data.setter
+    def audio_data(self, value):
+        self._audio_data = value
+
+    @property
+    def spectrogram_data(self):
+        if self._spectrogram_data is None and self.spectrogram_path is not None:
+            self._spectrogram_data = self._load_data(
+                self.spectrogram_path, "spectrogram"
+            )
+        return self._spectrogram_data
+
+    @spectrogram_data.setter
+    def spectrogram_data(self, value):
+        self._spectrogram_data = value
+
+    @property
+    def feature_data(self):
+        if (
+            self._feature_data is None
+            and not self._extraction_failed
+            and (self._signal_loaded or self.audio_file_path is not None)
+        ):
+            self.extract_features()
+        return self._feature_data
 
+    @feature_data.setter
+    def feature_data(self, value):
+        self._feature_data = value
+        self._extraction_failed = False
+
+    def _log_error(self, message):
+        print(message)
+
+    @profiled
     def _load_data(self, file_path, data_type):
         """
         Loads data from a file path and handles errors uniformly.
@@ -93,6 +246,62 @@ class AudioAnalysis:
             self._log_error(f"Failed to load {data_type} data: {e}")
             return None
 
+    def load_signal(self, signal, sampling_rate):
+        """
+        Loads an in-memory signal instead of reading it from `audio_file_path`.
+
+        Parameters
+        ----------
+        signal : np.ndarray
+            Float samples in [-1, 1], shaped (samples,) or (channels, samples).
+        sampling_rate : int
+            Sampling rate of the signal in Hz.
+        """
+        self._audio_data = signal
+        self._signal_loaded = True
+        self.sampling_rate = sampling_rate
+
+    def release_audio(self):
+        """
+        Drops the waveform so only the (much smaller) features stay in memory.
+
+        The features are extracted first if they have not been computed yet. Accessing
+        `audio_data` afterwards reloads it from `audio_file_path`.
+        """
+        if self._feature_data is None and not self._extraction_failed:
+            self.extract_features()
+        self._audio_data = None
+        self._signal_loaded = False
+
+    def project_features(self, feature_data):
+        """
+        Keeps only `feature_columns` of a feature DataFrame, as `feature_dtype`.
+
+        Parameters
+        ----------
+        feature_data : pd.DataFrame
+            Features as returned by OpenSMILE, or loaded from a cache.
+
+        Returns
+        -------
+        pd.DataFrame
+            The projected features, `feature_data` itself if nothing changes.
+
+        Raises
+        ------
+        KeyError
+            If a column of `feature_columns` is not in `feature_data`.
+        """
+        if (
+            self.feature_columns is not None
+            and list(feature_data.columns) != self.feature_columns
+        ):
+            feature_data = feature_data[self.feature_columns]
+        if (feature_data.dtypes != self.feature_dtype).any():
+            feature_data = feature_data.astype(self.feature_dtype)
+        return feature_data
+
+    @profiled
     def extract_features(self):
         """
         Extracts audio features from the loaded audio file using the OpenSMILE tool.
@@ -111,9 +320,13 @@ class AudioAnalysis:
         Notes
         -----
         - The method relies on the OpenSMILE configuration determined by `opensmile_feature_set`
-          and `opensmile_feature_level` attributes.
+          and `opensmile_feature_level` attributes. The extractor is borrowed from the
+          shared `SMILE_POOL` rather than built for every clip.
         - Extracted features are stored in `self.feature_data`, a pandas DataFrame, which
-          can be used for subsequent analysis or visualization.
+          can be used for subsequent analysis or visualization. Only `feature_columns`
+          are kept, as `feature_dtype`, see `project_features`.
+        - If a signal was loaded with `load_signal`, it is passed straight to OpenSMILE
+          and the audio file is never read.
         - A message indicating the shape of the extracted feature DataFrame is printed to
           standard output.
         """
@@ -121,14 +334,25 @@ class AudioAnalysis:
         # if not self._ensure_audio_data_loaded():
         #     return
 
-        # Initialize opensmile feature extractor with class attributes
+        # Borrow an opensmile feature extractor configured with class attributes
         try:
-            smile = opensmile.Smile(
-                feature_set=self.opensmile_feature_set,
-                feature_level=self.opensmile_feature_level,
-            )
-
-            self.feature_data = smile.process_file(self.audio_file_path)
+            with SMILE_POOL.borrow(
+                self.opensmile_feature_set, self.opensmile_feature_level
+            ) as smile:
+                if self._signal_loaded:
+                    file = (
+                        str(self.audio_file_path)
+                        if self.audio_file_path is not None
+                        else None
+                    )
+                    feature_data = smile.process_signal(
+                        self._audio_data, self.sampling_rate, file=file
+                    )
+                else:
+                    feature_data = smile.process_file(self.audio_file_path)
+            # Unused descriptors are dropped before anything else holds on to them
+            self.feature_data = self.project_features(feature_data)
             # print(f"Features extracted: {self.feature_data.shape}")
         except Exception as e:
+            self._extraction_failed = True
             self._log_error(f"Failed to extract features: {e}")
@@ -1,25 +1,31 @@
 from pathlib import Path
-from pydub import AudioSegment
 
-import pandas as pd
-import matplotlib.pyplot as plt
 import csv
-from statistics import mean
-import seaborn as sns
-
-import textgrids
 
 import os
-import re
+import math
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 
 import numpy as np
-from scipy.io import wavfile
-from scipy.signal import periodogram
-
+import pandas as pd
+import opensmile
 
 # Provided py file from Jens
 from audio_analysis import AudioAnalysis
+from corpus import Corpus
+from feature_store import METADATA_COLUMNS, FeatureStore
+from instrumentation import profiled
+from prefetch import prefetch
+from recording_features import (
+    RecordingFeatures,
+    extract_recording_features,
+    get_recording_cache_key,
+)
+from textgrid_index import get_tier_index, load_textgrid
+from wav_reader import WavReader
 
 
 # File paths
@@ -28,16 +34,16 @@ VOWEL_AUDIO_FILES_DIR = Path("./audio_files/vowels")
 FRIC_AUDIO_FILES_DIR = Path("./audio_files/frics")
 ORIGINAL_AUDIO_DIR = Path("./original_audio")
 PLOT_FILES_DIR = Path("./plots")
+# Output directories are created when something is first written to them, so
+# importing this module has no side effects
 
-# Ensure newdirectories exists
-VOWEL_AUDIO_FILES_DIR.mkdir(exist_ok=True)
-FRIC_AUDIO_FILES_DIR.mkdir(exist_ok=True)
-
-# Ensure audio_files directory exists
-PLOT_FILES_DIR.mkdir(exist_ok=True)
+# Tier of the extra vowel TextGrids ({speaker}_{condition}_*.TextGrid) with vowels
+EXTRA_VOWEL_TIER = "Mary"
 
-# Hardcoded convenience
-SPEAKER_NAMES = {"KS": "Kayla", "SD": "Samuele", "SL": "Stella"}
+# How many annotations the streaming pipeline reads ahead of the clip it is cutting
+STREAM_BUFFER_SIZE = 16
+# How many clips the streaming pipeline summarizes together
+STREAM_BATCH_SIZE = 32
 
 
 # Find original audio folder
@@ -45,39 +51,191 @@ def get_audio_path(speaker, condition):
     return ORIGINAL_AUDIO_DIR / f"{speaker}_{condition}.wav"
 
 
-# Takes in file path to audio and trims it according to the dataset
-def split_audio(path_to_audio, clip_data, type):
-    full_audio = AudioSegment.from_wav(path_to_audio)
-    audio_file_segment = full_audio[
-        float(clip_data["start"]) * 1000 : float(clip_data["end"]) * 1000
-    ]
+class SourceAudioCache:
+    """
+    Opens each ``{speaker}_{condition}.wav`` recording once and hands out clips
+    read straight from it.
+
+    Recordings are memory-mapped with `WavReader`, so cutting a clip only reads
+    its own frames from disk, however long the recording is. Callers announce
+    the clips they are about to cut with ``expect``. A recording stays open only
+    while it still has pending clips and is closed as soon as the last one has
+    been handed out. Clips own their samples, they do not pin the recording.
+    """
+
+    def __init__(self):
+        self._recordings = {}
+        self._pending = Counter()
+
+    def expect(self, items):
+        for item in items:
+            self._pending[(item["speaker"], item["hotneutral"])] += 1
+
+    def _get_recording(self, speaker, condition):
+        key = (speaker, condition)
+        reader = self._recordings.get(key)
+        if reader is None:
+            reader = WavReader(get_audio_path(speaker, condition))
+            if self._pending[key] > 0:
+                self._recordings[key] = reader
+        return reader
 
+    def _release(self, key):
+        self._pending[key] -= 1
+        if self._pending[key] <= 0:
+            del self._pending[key]
+            reader = self._recordings.pop(key, None)
+            if reader is not None:
+                reader.close()
+
+    def get_clip(self, speaker, condition, start, end):
+        key = (speaker, condition)
+        reader = self._get_recording(speaker, condition)
+        try:
+            return reader.read_segment(start, end)
+        finally:
+            if key in self._recordings:
+                self._release(key)
+            else:
+                # A clip nobody announced, its recording is not kept open
+                reader.close()
+
+    def close(self):
+        """
+        Closes every open recording and forgets the pending clips, e.g. after a
+        failed run left some of them uncut.
+        """
+        for reader in self._recordings.values():
+            reader.close()
+        self._recordings.clear()
+        self._pending.clear()
+
+
+# Raw samples of a clip as a (frames, channels) array sharing the clip's buffer
+def audio_segment_samples(audio_segment):
+    # pydub stores 8-bit audio as signed and widens 24-bit audio to 32-bit
+    dtype = {1: np.int8, 2: np.int16, 4: np.int32}[audio_segment.sample_width]
+    samples = np.frombuffer(audio_segment.raw_data, dtype=dtype)
+    return samples.reshape(-1, audio_segment.channels)
+
+
+# Float signal in [-1, 1] as OpenSMILE reads it from a WAV file
+def audio_segment_signal(audio_segment):
+    samples = audio_segment_samples(audio_segment)
+    scale = float(2 ** (8 * audio_segment.sample_width - 1))
+    signal = samples.T.astype(np.float32) / scale
+    if audio_segment.channels == 1:
+        signal = signal[0]
+    return signal
+
+
+# Path a clip is (or would be) exported to
+def get_clip_path(clip_data, type):
     if type == "vowel":
-        new_audio_path = (
-            VOWEL_AUDIO_FILES_DIR
-            / f"{clip_data['word']}_{clip_data['speaker']}_{clip_data['hotneutral']}.wav"
-        )
+        clip_dir = VOWEL_AUDIO_FILES_DIR
     elif type == "fric":
-        new_audio_path = (
-            FRIC_AUDIO_FILES_DIR
-            / f"{clip_data['word']}_{clip_data['speaker']}_{clip_data['hotneutral']}.wav"
+        clip_dir = FRIC_AUDIO_FILES_DIR
+    return (
+        clip_dir
+        / f"{clip_data['word']}_{clip_data['speaker']}_{clip_data['hotneutral']}.wav"
+    )
+
+
+# Cuts a clip out of the original recording according to the dataset
+@profiled
+def cut_audio(path_to_audio, clip_data, audio_cache=None):
+    if audio_cache is not None:
+        return audio_cache.get_clip(
+            clip_data["speaker"],
+            clip_data["hotneutral"],
+            clip_data["start"],
+            clip_data["end"],
         )
+
+    # Only the clip's frames are read, not the whole recording
+    reader = WavReader(path_to_audio)
+    try:
+        return reader.read_segment(clip_data["start"], clip_data["end"])
+    finally:
+        reader.close()
+
+
+# Takes in file path to audio and trims it according to the dataset
+@profiled
+def split_audio(path_to_audio, clip_data, type, audio_cache=None):
+    audio_file_segment = cut_audio(path_to_audio, clip_data, audio_cache)
+    new_audio_path = get_clip_path(clip_data, type)
     # Uncomment the next line to export segments
-    audio_file_segment.export(new_audio_path, format="WAV")
+    new_audio_path.parent.mkdir(parents=True, exist_ok=True)
+    audio_file_segment.export(new_audio_path, format="wav")
     return new_audio_path
 
 
+# Key of a clip's features in the feature cache
+def get_feature_cache_key(feature_cache, clip_data, audio_analysis):
+    return feature_cache.make_key(
+        get_audio_path(clip_data["speaker"], clip_data["hotneutral"]),
+        clip_data["start"],
+        clip_data["end"],
+        audio_analysis.opensmile_feature_set,
+        audio_analysis.opensmile_feature_level,
+        audio_analysis.feature_columns,
+        audio_analysis.feature_dtype,
+    )
+
+
+# AudioAnalysis settings of the dataset builders. feature_columns keeps only those
+# descriptors, functionals computes one row of statistics per clip instead of LLD
+# frames (their columns are named like "jitterLocal_sma3nz_amean").
+def get_analysis_options(
+    feature_columns=None, feature_dtype=np.float32, functionals=False
+):
+    options = {"feature_columns": feature_columns, "feature_dtype": feature_dtype}
+    if functionals:
+        options["opensmile_feature_level"] = opensmile.FeatureLevel.Functionals
+    return options
+
+
 # Creates the AudioAnalysis object for an audio clip
-def create_audio_data_object(path_to_audio):
+@profiled
+def create_audio_data_object(
+    path_to_audio,
+    audio_segment=None,
+    feature_cache=None,
+    clip_data=None,
+    release_audio=True,
+    analysis_options=None,
+):
     # Create an instance of the AudioAnalysis object
-    audio_analysis = AudioAnalysis()
+    audio_analysis = AudioAnalysis(**(analysis_options or {}))
     # Load audio file path
     audio_analysis.audio_file_path = path_to_audio
-    # Load the audio data
-    audio_analysis._load_data(path_to_audio, "audio")
-    # Get the data
+
+    # A warm cache skips loading and OpenSMILE altogether
+    cache_key = None
+    if feature_cache is not None and clip_data is not None:
+        cache_key = get_feature_cache_key(feature_cache, clip_data, audio_analysis)
+        # Checked on a local, reading the lazy property would extract right away
+        feature_data = feature_cache.load(cache_key, file=path_to_audio)
+        if feature_data is not None:
+            audio_analysis.feature_data = audio_analysis.project_features(feature_data)
+            return audio_analysis
+
+    if audio_segment is not None:
+        # Hand the sliced buffer straight to the analysis, no file round-trip
+        audio_analysis.load_signal(
+            audio_segment_signal(audio_segment), audio_segment.frame_rate
+        )
+    # Get the data, a clip on disk is read by OpenSMILE without loading it here
     audio_analysis.extract_features()
 
+    if cache_key is not None and audio_analysis.feature_data is not None:
+        feature_cache.store(cache_key, audio_analysis.feature_data)
+
+    # Only the features are needed from here on
+    if release_audio:
+        audio_analysis.release_audio()
+
     return audio_analysis
 
 
@@ -88,91 +246,658 @@ the data ASAP.
 """
 
 
-def process_vowel_data_item(item, clip_type="vowel"):
+@profiled
+def process_vowel_data_item(
+    item,
+    clip_type="vowel",
+    audio_cache=None,
+    in_memory=False,
+    export_clips=True,
+    feature_cache=None,
+    analysis_options=None,
+):
+    if not in_memory:
+        audio_path = get_audio_path(item["speaker"], item["hotneutral"])
+        new_audio_path = split_audio(audio_path, item, clip_type, audio_cache)
+        item["audiofilepath"] = new_audio_path
+        item["analysisobj"] = create_audio_data_object(
+            new_audio_path,
+            feature_cache=feature_cache,
+            clip_data=item,
+            analysis_options=analysis_options,
+        )
+        return item
+
+    # In-memory mode: the clip never has to be read back from disk
+    audio_clip = attach_audio_clip(item, clip_type, audio_cache, export_clips)
+    item["analysisobj"] = create_audio_data_object(
+        item["audiofilepath"],
+        audio_clip,
+        feature_cache=feature_cache,
+        clip_data=item,
+        analysis_options=analysis_options,
+    )
+    return item
+
+
+# The item's clip as an AudioSegment, cut again if it wasn't kept on the item
+def get_item_clip(item):
+    return get_item_clips([item])[0]
+
+
+# Clips of many items, opening each needed source recording only once
+def get_item_clips(items):
+    audio_cache = SourceAudioCache()
+    audio_cache.expect([item for item in items if "audioclip" not in item])
+    return [
+        (
+            item["audioclip"]
+            if "audioclip" in item
+            else audio_cache.get_clip(
+                item["speaker"], item["hotneutral"], item["start"], item["end"]
+            )
+        )
+        for item in items
+    ]
+
+
+# Writes a clip to audio_files/, as the clip files of the WAV round-trip mode
+def export_audio_clip(audio_clip, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    audio_clip.export(path, format="wav")
+
+
+# Cuts an item's clip, optionally exports it, and keeps a copy on the item
+@profiled
+def attach_audio_clip(item, clip_type="vowel", audio_cache=None, export_clips=True):
     audio_path = get_audio_path(item["speaker"], item["hotneutral"])
-    new_audio_path = split_audio(audio_path, item, clip_type)
+    audio_clip = cut_audio(audio_path, item, audio_cache)
+    new_audio_path = get_clip_path(item, clip_type)
+    if export_clips:
+        export_audio_clip(audio_clip, new_audio_path)
     item["audiofilepath"] = new_audio_path
-    item["analysisobj"] = create_audio_data_object(new_audio_path)
-    return item
+    item["audioclip"] = audio_clip
+    return audio_clip
 
 
-def read_and_process_vowel_data(csv_file_path, clip_type="vowel"):
-    full_dataset = []
-    with open(csv_file_path, mode="r", newline="", encoding="utf-8") as csvfile:
-        csv_vowel_file = csv.DictReader(csvfile)
-        for item in csv_vowel_file:
-            full_dataset.append(process_vowel_data_item(item, clip_type))
+# Worker side of the parallel mode, processes a chunk of items from one recording
+def _process_item_chunk(chunk, clip_type, in_memory, feature_cache, analysis_options):
+    audio_cache = SourceAudioCache()
+    audio_cache.expect([item for _, item, _ in chunk])
 
-    return full_dataset
+    processed = []
+    for index, item, export_clip in chunk:
+        # Always analysed in memory, two workers could be writing the same clip path
+        item = process_vowel_data_item(
+            item,
+            clip_type,
+            audio_cache,
+            in_memory=True,
+            export_clips=export_clip,
+            feature_cache=feature_cache,
+            analysis_options=analysis_options,
+        )
+        if not in_memory:
+            del item["audioclip"]
+        processed.append((index, item))
+    return processed
 
 
-def get_all_vowel_data():
-    full_dataset = read_and_process_vowel_data(DATASET_FILE_PATH)
-    extra_data = get_extra_vowel_file()
-    for item in extra_data:
-        full_dataset.append(process_vowel_data_item(item))
+# Positions of the items whose clips are written to disk. Clips sharing a path
+# overwrite each other, so only the last one is exported, which is what remains
+# on disk after the serial mode too.
+def _get_export_indices(items, clip_type, in_memory, export_clips):
+    if in_memory and not export_clips:
+        return set()
+    last_for_path = {
+        get_clip_path(item, clip_type): index for index, item in enumerate(items)
+    }
+    return set(last_for_path.values())
 
-    return full_dataset
 
+def _process_data_items_parallel(
+    items,
+    clip_type,
+    in_memory,
+    export_clips,
+    feature_cache,
+    workers,
+    chunksize,
+    analysis_options,
+):
+    export_indices = _get_export_indices(items, clip_type, in_memory, export_clips)
 
-def get_extra_vowel_file():
-    # read in TextGrid
-    praat_audio_textgrid = textgrids.TextGrid(
-        "./original_audio/TextGrids/SL_hot_a_i_u.TextGrid"
+    # Chunks never mix recordings, so each worker opens a recording once per chunk
+    recordings = defaultdict(list)
+    for index, item in enumerate(items):
+        recordings[(item["speaker"], item["hotneutral"])].append(
+            (index, item, index in export_indices)
+        )
+    if chunksize is None:
+        chunksize = max(1, math.ceil(len(items) / (workers * 4)))
+    chunks = [
+        recording_items[i : i + chunksize]
+        for recording_items in recordings.values()
+        for i in range(0, len(recording_items), chunksize)
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for processed in executor.map(
+            _process_item_chunk,
+            chunks,
+            repeat(clip_type),
+            repeat(in_memory),
+            repeat(feature_cache),
+            repeat(analysis_options),
+        ):
+            # Fill in the caller's dicts, like the serial path does
+            for index, item in processed:
+                items[index].update(item)
+
+    return items
+
+
+# Fills in an unchanged item from the outputs recorded in the manifest. Items
+# sliced from a whole recording are sliced again from its cached frames, loaded
+# once per recording into `recordings`.
+def _reuse_item_outputs(
+    item,
+    clip_type,
+    outputs,
+    feature_cache,
+    export_clips,
+    recordings=None,
+    analysis_options=None,
+):
+    if export_clips and not outputs.get("clip"):
+        return False
+    if outputs.get("clip") and not os.path.exists(outputs["clip"]):
+        return False
+
+    new_audio_path = get_clip_path(item, clip_type)
+    if "recording" in outputs:
+        if recordings is None:
+            recordings = {}
+        key = (item["speaker"], item["hotneutral"])
+        if key not in recordings:
+            feature_data = feature_cache.load(outputs["recording"])
+            recordings[key] = (
+                None if feature_data is None else RecordingFeatures(feature_data)
+            )
+        if recordings[key] is None:
+            return False
+        feature_data = recordings[key].clip_feature_data(
+            item["start"], item["end"], file=new_audio_path
+        )
+    else:
+        feature_data = feature_cache.load(outputs["features"], file=new_audio_path)
+    if feature_data is None:
+        return False
+
+    audio_analysis = AudioAnalysis(**(analysis_options or {}))
+    audio_analysis.audio_file_path = new_audio_path
+    audio_analysis.feature_data = audio_analysis.project_features(feature_data)
+    item["audiofilepath"] = new_audio_path
+    item["analysisobj"] = audio_analysis
+    return True
+
+
+# How an item's features differ from all LLD frames of the clip on its own, None
+# if they don't
+def get_feature_variant(whole_recording, analysis_options):
+    variant = {}
+    if whole_recording:
+        variant["frames"] = "recording"
+    options = analysis_options or {}
+    if options.get("feature_columns") is not None:
+        variant["columns"] = list(options["feature_columns"])
+    if "opensmile_feature_level" in options:
+        variant["level"] = str(options["opensmile_feature_level"].value)
+    return variant or None
+
+
+# Only items whose annotation or source recording changed are split and extracted
+def _process_data_items_incremental(
+    items,
+    clip_type,
+    manifest,
+    feature_cache,
+    in_memory,
+    export_clips,
+    whole_recording=False,
+    analysis_options=None,
+    **kwargs,
+):
+    if feature_cache is None:
+        raise ValueError("Incremental builds need a feature_cache to reuse features")
+
+    # Features computed another way are fingerprinted apart, so switching modes
+    # or projections redoes the items and redraws their plots
+    variant = get_feature_variant(whole_recording, analysis_options)
+    recordings = {}
+    changed_items = []
+    for item in items:
+        source_path = get_audio_path(item["speaker"], item["hotneutral"])
+        source_hash = feature_cache.file_hash(source_path)
+        manifest.record_source(source_path, source_hash)
+        fingerprint = manifest.fingerprint_item(item, clip_type, source_hash, variant)
+
+        outputs = manifest.item_outputs(fingerprint)
+        if outputs is None or not _reuse_item_outputs(
+            item,
+            clip_type,
+            outputs,
+            feature_cache,
+            export_clips,
+            recordings,
+            analysis_options,
+        ):
+            changed_items.append(item)
+
+    process_data_items(
+        changed_items,
+        clip_type,
+        in_memory=in_memory,
+        export_clips=export_clips,
+        feature_cache=feature_cache,
+        whole_recording=whole_recording,
+        analysis_options=analysis_options,
+        **kwargs,
     )
 
-    vowel_list = []
+    for item in changed_items:
+        exported = export_clips or not in_memory
+        audio_analysis = item["analysisobj"]
+        if whole_recording:
+            source_path = get_audio_path(item["speaker"], item["hotneutral"])
+            outputs = {
+                "recording": get_recording_cache_key(
+                    feature_cache, source_path, audio_analysis
+                )
+            }
+        else:
+            outputs = {
+                "features": get_feature_cache_key(feature_cache, item, audio_analysis)
+            }
+        outputs["clip"] = str(item["audiofilepath"]) if exported else None
+        manifest.record_item(item["fingerprint"], outputs)
 
-    # iterate through first tier, which contains duration info
-    for item in praat_audio_textgrid["Mary"]:
-        # convert Praat to Unicode in the label
-        vowel = item.text.transcode()
+    return items
 
-        if vowel != "":
-            start = item.xmin
-            end = item.xmax
-            word_label = vowel
 
-            vowel_list.append(
-                {
-                    "vowel": vowel,
-                    "word": word_label,
-                    "start": start,
-                    "end": end,
-                    "hotneutral": "hot",
-                    "speaker": "SL",
-                }
+# Whole-recording mode: OpenSMILE runs once per source recording (on `workers`
+# processes) and each item's frames are sliced out of it by time. Clips are still
+# cut, and exported like in the per-clip modes.
+def _process_data_items_by_recording(
+    items,
+    clip_type,
+    audio_cache,
+    in_memory,
+    export_clips,
+    feature_cache,
+    workers,
+    analysis_options,
+):
+    recording_keys = list(
+        dict.fromkeys((item["speaker"], item["hotneutral"]) for item in items)
+    )
+    recording_paths = [get_audio_path(*key) for key in recording_keys]
+    if workers > 1 and len(recording_keys) > 1:
+        max_workers = min(workers, len(recording_keys))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            features = list(
+                executor.map(
+                    extract_recording_features,
+                    recording_paths,
+                    repeat(feature_cache),
+                    repeat(analysis_options),
+                )
             )
+    else:
+        features = [
+            extract_recording_features(path, feature_cache, analysis_options)
+            for path in recording_paths
+        ]
+    recordings = dict(zip(recording_keys, features))
 
-    return vowel_list
+    audio_cache.expect(items)
+    for item in items:
+        if in_memory:
+            attach_audio_clip(item, clip_type, audio_cache, export_clips)
+        else:
+            audio_path = get_audio_path(item["speaker"], item["hotneutral"])
+            item["audiofilepath"] = split_audio(
+                audio_path, item, clip_type, audio_cache
+            )
 
+        audio_analysis = AudioAnalysis(**(analysis_options or {}))
+        audio_analysis.audio_file_path = item["audiofilepath"]
+        feature_data = recordings[
+            (item["speaker"], item["hotneutral"])
+        ].clip_feature_data(item["start"], item["end"], file=item["audiofilepath"])
+        audio_analysis.feature_data = audio_analysis.project_features(feature_data)
+        item["analysisobj"] = audio_analysis
+    return items
 
-def get_all_the_fric_data():
-    full_dataset = []
-    speaker_initials = SPEAKER_NAMES.keys()
-    fricatives_data = []
 
-    for temp in ["hot", "neutral"]:
-        for speaker in speaker_initials:
-            textgrid_path = f"./original_audio/TextGrids/{speaker}_{temp}.TextGrid"
-            fric_list = get_fricative_start_stops(textgrid_path, temp, speaker)
-            fricatives_data.extend(fric_list)
+# Reader side of the prefetching mode, cuts (and exports) the clips of one recording
+def _read_recording_clips(recording_items, clip_type, export_indices):
+    audio_cache = SourceAudioCache()
+    audio_cache.expect([item for _, item in recording_items])
+    try:
+        for index, item in recording_items:
+            attach_audio_clip(item, clip_type, audio_cache, index in export_indices)
+            yield item
+    finally:
+        # The recording stays open if the reader stops before its last clip
+        audio_cache.close()
 
-    for item in fricatives_data:
-        audio_path = get_audio_path(item["speaker"], item["hotneutral"])
-        new_audio_path = split_audio(audio_path, item, "fric")
-        item["audiofilepath"] = new_audio_path
-        item["analysisobj"] = create_audio_data_object(new_audio_path)
 
-        full_dataset.append(item)
+# Prefetching mode: reader threads cut the clips of upcoming recordings while the
+# features of the current ones are extracted, at most prefetch_depth clips ahead.
+# Busy and stall times of both sides add up in prefetch.PREFETCH_STATS.
+def _process_data_items_prefetch(
+    items,
+    clip_type,
+    in_memory,
+    export_clips,
+    feature_cache,
+    analysis_options,
+    prefetch_depth,
+    reader_threads,
+):
+    # Always analysed in memory, a reader could be overwriting the clip path of
+    # an item still waiting for extraction
+    export_indices = _get_export_indices(items, clip_type, in_memory, export_clips)
+
+    recordings = defaultdict(list)
+    for index, item in enumerate(items):
+        recordings[(item["speaker"], item["hotneutral"])].append((index, item))
+
+    def read_clips(recording_items):
+        return _read_recording_clips(recording_items, clip_type, export_indices)
+
+    for item in prefetch(
+        recordings.values(), read_clips, prefetch_depth, reader_threads
+    ):
+        item["analysisobj"] = create_audio_data_object(
+            item["audiofilepath"],
+            item["audioclip"],
+            feature_cache=feature_cache,
+            clip_data=item,
+            analysis_options=analysis_options,
+        )
+        if not in_memory:
+            del item["audioclip"]
+    return items
+
+
+# Processes a list of dataset items, opening each source recording only once.
+# workers > 1 spreads the items over a process pool, keeping the serial order.
+# With a manifest, unchanged items are taken from the feature cache instead.
+# whole_recording extracts each source recording once and slices the clips'
+# frames out of it, instead of extracting every clip on its own.
+# analysis_options are passed on to every AudioAnalysis, see get_analysis_options.
+# prefetch_depth > 0 cuts clips on reader_threads threads ahead of the extraction,
+# with one worker and per-clip extraction only.
+@profiled
+def process_data_items(
+    items,
+    clip_type="vowel",
+    audio_cache=None,
+    in_memory=False,
+    export_clips=True,
+    feature_cache=None,
+    workers=1,
+    chunksize=None,
+    manifest=None,
+    whole_recording=False,
+    analysis_options=None,
+    prefetch_depth=0,
+    reader_threads=1,
+):
+    if prefetch_depth > 0 and (workers > 1 or whole_recording):
+        raise ValueError(
+            "Prefetching needs workers=1 and per-clip extraction, "
+            f"got workers={workers}, whole_recording={whole_recording}"
+        )
+
+    # Each call gets its own cache unless one is passed in, so the recordings of
+    # a failed call are closed instead of staying open for the next one
+    own_audio_cache = audio_cache is None
+    if own_audio_cache:
+        audio_cache = SourceAudioCache()
+    try:
+        if manifest is not None:
+            return _process_data_items_incremental(
+                items,
+                clip_type,
+                manifest,
+                feature_cache,
+                in_memory,
+                export_clips,
+                whole_recording,
+                analysis_options,
+                audio_cache=audio_cache,
+                workers=workers,
+                chunksize=chunksize,
+                prefetch_depth=prefetch_depth,
+                reader_threads=reader_threads,
+            )
+
+        if whole_recording:
+            return _process_data_items_by_recording(
+                items,
+                clip_type,
+                audio_cache,
+                in_memory,
+                export_clips,
+                feature_cache,
+                workers,
+                analysis_options,
+            )
+
+        if workers > 1:
+            return _process_data_items_parallel(
+                items,
+                clip_type,
+                in_memory,
+                export_clips,
+                feature_cache,
+                workers,
+                chunksize,
+                analysis_options,
+            )
+
+        if prefetch_depth > 0:
+            return _process_data_items_prefetch(
+                items,
+                clip_type,
+                in_memory,
+                export_clips,
+                feature_cache,
+                analysis_options,
+                prefetch_depth,
+                reader_threads,
+            )
+
+        audio_cache.expect(items)
+        return [
+            process_vowel_data_item(
+                item,
+                clip_type,
+                audio_cache,
+                in_memory,
+                export_clips,
+                feature_cache,
+                analysis_options,
+            )
+            for item in items
+        ]
+
+    finally:
+        if own_audio_cache:
+            audio_cache.close()
+
+
+@profiled
+def read_vowel_data(csv_file_path):
+    with open(csv_file_path, mode="r", newline="", encoding="utf-8") as csvfile:
+        return list(csv.DictReader(csvfile))
+
+
+def read_and_process_vowel_data(
+    csv_file_path,
+    clip_type="vowel",
+    in_memory=False,
+    export_clips=True,
+    feature_cache=None,
+    workers=1,
+    manifest=None,
+    whole_recording=False,
+    feature_columns=None,
+    feature_dtype=np.float32,
+    functionals=False,
+    prefetch_depth=0,
+    reader_threads=1,
+):
+    return process_data_items(
+        read_vowel_data(csv_file_path),
+        clip_type,
+        in_memory=in_memory,
+        export_clips=export_clips,
+        feature_cache=feature_cache,
+        workers=workers,
+        manifest=manifest,
+        whole_recording=whole_recording,
+        analysis_options=get_analysis_options(
+            feature_columns, feature_dtype, functionals
+        ),
+        prefetch_depth=prefetch_depth,
+        reader_threads=reader_threads,
+    )
+
+
+# in_memory=True skips the WAV round-trip; export_clips keeps audio_files/ filled.
+# feature_columns, feature_dtype and functionals set what is kept of every clip's
+# features, see get_analysis_options.
+# prefetch_depth > 0 overlaps cutting the clips with extracting their features,
+# see process_data_items.
+@profiled
+def get_all_vowel_data(
+    in_memory=False,
+    export_clips=True,
+    feature_cache=None,
+    workers=1,
+    manifest=None,
+    whole_recording=False,
+    feature_columns=None,
+    feature_dtype=np.float32,
+    functionals=False,
+    corpus=None,
+    prefetch_depth=0,
+    reader_threads=1,
+):
+    vowel_data = read_vowel_data(DATASET_FILE_PATH)
+    vowel_data.extend(get_extra_vowel_file(corpus))
+
+    return process_data_items(
+        vowel_data,
+        in_memory=in_memory,
+        export_clips=export_clips,
+        feature_cache=feature_cache,
+        workers=workers,
+        manifest=manifest,
+        whole_recording=whole_recording,
+        analysis_options=get_analysis_options(
+            feature_columns, feature_dtype, functionals
+        ),
+        prefetch_depth=prefetch_depth,
+        reader_threads=reader_threads,
+    )
+
+
+# Vowels of the extra TextGrids of every recording that have a vowel tier
+@profiled
+def get_extra_vowel_file(corpus=None):
+    if corpus is None:
+        corpus = Corpus.discover(ORIGINAL_AUDIO_DIR)
+
+    vowel_list = []
+    for recording in corpus:
+        for textgrid_path in recording.extra_textgrid_paths:
+            # read in TextGrid
+            praat_audio_textgrid = load_textgrid(textgrid_path)
+            if EXTRA_VOWEL_TIER not in praat_audio_textgrid:
+                continue
+
+            # iterate through first tier, which contains duration info
+            for item in praat_audio_textgrid[EXTRA_VOWEL_TIER]:
+                # convert Praat to Unicode in the label
+                vowel = item.text.transcode()
+
+                if vowel != "":
+                    start = item.xmin
+                    end = item.xmax
+                    word_label = vowel
+
+                    vowel_list.append(
+                        {
+                            "vowel": vowel,
+                            "word": word_label,
+                            "start": start,
+                            "end": end,
+                            "hotneutral": recording.condition,
+                            "speaker": recording.speaker,
+                        }
+                    )
+
+    return vowel_list
+
+
+@profiled
+def get_all_the_fric_data(
+    in_memory=False,
+    export_clips=True,
+    feature_cache=None,
+    workers=1,
+    manifest=None,
+    whole_recording=False,
+    feature_columns=None,
+    feature_dtype=np.float32,
+    functionals=False,
+    corpus=None,
+    prefetch_depth=0,
+    reader_threads=1,
+):
+    fricatives_data = list(iter_fric_annotations(corpus))
+
+    full_dataset = process_data_items(
+        fricatives_data,
+        "fric",
+        in_memory=in_memory,
+        export_clips=export_clips,
+        feature_cache=feature_cache,
+        workers=workers,
+        manifest=manifest,
+        whole_recording=whole_recording,
+        analysis_options=get_analysis_options(
+            feature_columns, feature_dtype, functionals
+        ),
+        prefetch_depth=prefetch_depth,
+        reader_threads=reader_threads,
+    )
 
     return full_dataset
 
 
 # Gets the start/stop times for each fricative from a TextGrid file
+@profiled
 def get_fricative_start_stops(path_to_textgrid, hot_or_cold, speaker):
     # read in TextGrid
-    praat_audio_textgrid = textgrids.TextGrid(path_to_textgrid)
+    praat_audio_textgrid = load_textgrid(path_to_textgrid)
+    # Binary search for the containing word instead of scanning the whole tier
+    word_index = get_tier_index(path_to_textgrid, "ORT-MAU")
 
     fric_list = []
 
@@ -186,9 +911,9 @@ def get_fricative_start_stops(path_to_textgrid, hot_or_cold, speaker):
             end = item.xmax
             word_label = ""
 
-            for word in praat_audio_textgrid["ORT-MAU"]:
-                if start > word.xmin and end < word.xmax:
-                    word_label = word.text.transcode()
+            word = word_index.containing(start, end)
+            if word is not None:
+                word_label = word.text.transcode()
 
             fric_list.append(
                 {
@@ -202,3 +927,194 @@ def get_fricative_start_stops(path_to_textgrid, hot_or_cold, speaker):
             )
 
     return fric_list
+
+
+"""
+Streaming pipeline: annotation rows -> clips -> features -> summaries.
+
+Every stage is a generator that pulls from the previous one, so consumers get the
+first items as soon as they are ready and memory stays bounded by the read-ahead
+buffer and the summary batch, not by the size of the corpus.
+"""
+
+
+def iter_vowel_annotations(
+    csv_file_path=DATASET_FILE_PATH, include_extra=True, corpus=None
+):
+    with open(csv_file_path, mode="r", newline="", encoding="utf-8") as csvfile:
+        yield from csv.DictReader(csvfile)
+    if include_extra:
+        yield from get_extra_vowel_file(corpus)
+
+
+# Fricatives of every annotated recording of the corpus, found on disk by default
+def iter_fric_annotations(corpus=None):
+    if corpus is None:
+        corpus = Corpus.discover(ORIGINAL_AUDIO_DIR)
+    for recording in corpus.annotated_recordings():
+        yield from get_fricative_start_stops(
+            recording.textgrid_path, recording.condition, recording.speaker
+        )
+
+
+# Cuts the clip of each annotation. The read-ahead buffer tells the source cache
+# which recordings are still needed, so a recording is opened once per run of
+# consecutive annotations and closed as soon as the buffer no longer refers to it.
+def stream_clips(
+    annotations, clip_type="vowel", export_clips=False, buffer_size=STREAM_BUFFER_SIZE
+):
+    audio_cache = SourceAudioCache()
+    pending = deque()
+    try:
+        for item in annotations:
+            audio_cache.expect([item])
+            pending.append(item)
+            if len(pending) >= buffer_size:
+                item = pending.popleft()
+                attach_audio_clip(item, clip_type, audio_cache, export_clips)
+                yield item
+
+        while pending:
+            item = pending.popleft()
+            attach_audio_clip(item, clip_type, audio_cache, export_clips)
+            yield item
+    finally:
+        # Also when the consumer stops early, with recordings still expected
+        audio_cache.close()
+
+
+# Extracts the features of every streamed clip. export_clips writes each clip to
+# audio_files/ first, analysis_options are those of process_data_items. The clip
+# is dropped once extracted, keep_clips leaves it on the item for later stages.
+def stream_features(
+    clips,
+    feature_cache=None,
+    export_clips=False,
+    analysis_options=None,
+    keep_clips=False,
+):
+    for item in clips:
+        if export_clips:
+            export_audio_clip(item["audioclip"], item["audiofilepath"])
+        item["analysisobj"] = create_audio_data_object(
+            item["audiofilepath"],
+            item["audioclip"],
+            feature_cache=feature_cache,
+            clip_data=item,
+            analysis_options=analysis_options,
+        )
+        if not keep_clips:
+            del item["audioclip"]
+        yield item
+
+
+# Summarizes clips in batches and attaches each clip's row as item["summary"].
+# With release_features the frames are dropped once summarized. Functionals-level
+# features already are one row per clip, functionals=True passes that row on.
+def stream_summaries(
+    items,
+    batch_size=STREAM_BATCH_SIZE,
+    release_features=True,
+    percentiles=None,
+    functionals=False,
+):
+    clip_count = 0
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield from _summarize_batch(
+                batch, clip_count, release_features, percentiles, functionals
+            )
+            clip_count += len(batch)
+            batch = []
+
+    if batch:
+        yield from _summarize_batch(
+            batch, clip_count, release_features, percentiles, functionals
+        )
+
+
+def _summarize_batch(
+    batch, first_clip_index, release_features, percentiles, functionals
+):
+    store = FeatureStore.from_dataset(batch, release_features=release_features)
+    if functionals:
+        summary = store.clip_table()
+    elif percentiles is None:
+        summary = store.summarize()
+    else:
+        summary = store.summarize(percentiles)
+    summary_columns = [
+        column
+        for column in summary.columns
+        if column != "clipindex" and column not in METADATA_COLUMNS
+    ]
+    # Rows of numpy scalars, so a table built from them keeps the store's dtypes
+    for item, values in zip(batch, summary[summary_columns].to_numpy()):
+        # Number the clips across batches, not within this batch's store
+        item["clipindex"] = first_clip_index + item["clipindex"]
+        item["summary"] = dict(zip(summary_columns, values))
+        yield item
+
+
+# Table of the summaries of streamed items, laid out like FeatureStore.summarize:
+# clipindex and the metadata columns first, then extra_columns of the items last
+def get_summary_table(items, extra_columns=()):
+    rows = []
+    for item in items:
+        row = {"clipindex": item["clipindex"]}
+        row.update((name, str(item.get(name, ""))) for name in METADATA_COLUMNS)
+        row.update(item["summary"])
+        row.update((name, item[name]) for name in extra_columns)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+# The vowel pipeline as generators, taking the options of get_all_vowel_data
+def stream_vowel_data(
+    csv_file_path=DATASET_FILE_PATH,
+    export_clips=False,
+    feature_cache=None,
+    summarize=True,
+    buffer_size=STREAM_BUFFER_SIZE,
+    feature_columns=None,
+    feature_dtype=np.float32,
+    functionals=False,
+    corpus=None,
+    keep_clips=False,
+):
+    items = stream_features(
+        stream_clips(
+            iter_vowel_annotations(csv_file_path, corpus=corpus),
+            "vowel",
+            buffer_size=buffer_size,
+        ),
+        feature_cache,
+        export_clips,
+        get_analysis_options(feature_columns, feature_dtype, functionals),
+        keep_clips,
+    )
+    return stream_summaries(items, functionals=functionals) if summarize else items
+
+
+# The fricative pipeline as generators, taking the options of get_all_the_fric_data
+def stream_fric_data(
+    export_clips=False,
+    feature_cache=None,
+    summarize=True,
+    buffer_size=STREAM_BUFFER_SIZE,
+    feature_columns=None,
+    feature_dtype=np.float32,
+    functionals=False,
+    corpus=None,
+    keep_clips=False,
+):
+    items = stream_features(
+        stream_clips(iter_fric_annotations(corpus), "fric", buffer_size=buffer_size),
+        feature_cache,
+        export_clips,
+        get_analysis_options(feature_columns, feature_dtype, functionals),
+        keep_clips,
+    )
+    return stream_summaries(items, functionals=functionals) if summarize else items
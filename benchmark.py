@@ -0,0 +1,475 @@
+from pathlib import Path
+import argparse
+import csv
+import json
+import os
+import platform
+import shutil
+import sys
+import time
+
+import numpy as np
+from scipy.io import wavfile
+import textgrids
+
+from corpus import Corpus
+
+
+# Where the synthetic corpus is generated and the results are written
+BENCHMARK_CORPUS_DIR = Path("./benchmark_corpus")
+BENCHMARK_RESULTS_PATH = Path("./benchmark_results.json")
+
+# Bump when the stages or the corpus layout change, results are only compared
+# against baselines of the same version
+BENCHMARK_VERSION = 2
+
+# A stage regresses when it is this much slower than its baseline
+REGRESSION_TOLERANCE = 0.25
+
+BENCHMARK_STAGES = [
+    "split_audio",
+    "create_audio_data_object",
+    "process_dataset",
+    "do_plot_calcs",
+    "plotting",
+]
+
+# Synthetic speakers and conditions are named like the study's, extra ones get
+# numbered names
+STUDY_SPEAKERS = ["KS", "SD", "SL"]
+STUDY_CONDITIONS = ["hot", "neutral"]
+
+# Written into every generated corpus, a directory without it is never cleared
+CORPUS_MARKER = "benchmark_corpus.json"
+
+# (word, vowel, fricative) of every synthetic interval, cycled through. Every
+# cycle numbers its words, so each token of a recording has its own clip file.
+SYNTHETIC_WORDS = [
+    ("just", "ʌ", "s"),
+    ("before", "ɪ", "f"),
+    ("bath", "æ", "θ"),
+    ("fish", "ɪ", "ʃ"),
+    ("sea", "i", "s"),
+    ("that", "æ", "ð"),
+    ("five", "aɪ", "f"),
+    ("house", "aʊ", "s"),
+]
+
+SAMPLE_RATE = 16000
+
+
+def get_speaker_codes(n_speakers):
+    extra = [f"S{number}" for number in range(len(STUDY_SPEAKERS) + 1, n_speakers + 1)]
+    return (STUDY_SPEAKERS + extra)[:n_speakers]
+
+
+def get_condition_names(n_conditions):
+    extra = [
+        f"cond{number}" for number in range(len(STUDY_CONDITIONS) + 1, n_conditions + 1)
+    ]
+    return (STUDY_CONDITIONS + extra)[:n_conditions]
+
+
+# One synthetic recording: a voiced harmonic tone with a noise burst for the
+# fricative of every interval, so both the vowel and the fricative clips carry
+# something opensmile and the spectral tilt can measure
+def synthesize_recording(slots, slot_seconds, rng, f0=140.0):
+    slot_samples = int(slot_seconds * SAMPLE_RATE)
+    signal = np.empty(slots * slot_samples, dtype=np.int16)
+    t = np.arange(slot_samples) / SAMPLE_RATE
+
+    for slot in range(slots):
+        pitch = f0 * (1 + 0.02 * rng.standard_normal())
+        voiced = sum(
+            np.sin(2 * np.pi * pitch * harmonic * t) / harmonic
+            for harmonic in range(1, 6)
+        )
+        slot_signal = 0.25 * voiced + 0.01 * rng.standard_normal(slot_samples)
+
+        fric = slice(int(0.2 * slot_samples), int(0.4 * slot_samples))
+        slot_signal[fric] = 0.3 * rng.standard_normal(fric.stop - fric.start)
+
+        start = slot * slot_samples
+        signal[start : start + slot_samples] = (slot_signal * 20000).astype(np.int16)
+    return signal
+
+
+def generate_corpus(
+    corpus_dir=BENCHMARK_CORPUS_DIR,
+    speakers=3,
+    conditions=2,
+    minutes=0.5,
+    intervals_per_minute=60,
+    seed=0,
+):
+    """
+    Writes a synthetic corpus laid out like the real one.
+
+    Every ``{speaker}_{condition}`` pair gets a WAV recording in
+    ``original_audio/`` and a TextGrid with ``ORT-MAU`` and ``fricatives`` tiers
+    in ``original_audio/TextGrids/``. The vowel of every interval is listed in
+    ``test_dataset.csv``. A corpus generated earlier in `corpus_dir` is deleted
+    first, so no recording of another configuration is left behind.
+
+    Parameters
+    ----------
+    corpus_dir : str or Path, optional
+        Where the corpus is written, by default ``./benchmark_corpus``.
+    speakers : int, optional
+        Number of speakers, by default 3.
+    conditions : int, optional
+        Number of recording conditions per speaker, by default 2 (hot, neutral).
+    minutes : float, optional
+        Length of every recording in minutes, by default 0.5.
+    intervals_per_minute : int, optional
+        Annotated words per minute of audio, by default 60.
+    seed : int, optional
+        Seed of the random generator, by default 0.
+
+    Returns
+    -------
+    dict
+        The corpus size: recordings, seconds of audio and annotated intervals.
+
+    Raises
+    ------
+    FileExistsError
+        If `corpus_dir` is not empty and was not generated by the benchmark.
+    """
+    corpus_dir = Path(corpus_dir)
+    if corpus_dir.is_dir() and any(corpus_dir.iterdir()):
+        if not (corpus_dir / CORPUS_MARKER).exists():
+            raise FileExistsError(
+                f"{corpus_dir} is not empty and was not generated by the benchmark"
+            )
+        shutil.rmtree(corpus_dir)
+    textgrid_dir = corpus_dir / "original_audio" / "TextGrids"
+    textgrid_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    slot_seconds = 60 / intervals_per_minute
+    slots = max(1, int(minutes * intervals_per_minute))
+    vowel_rows = []
+    fricative_intervals = 0
+
+    for speaker in get_speaker_codes(speakers):
+        for condition in get_condition_names(conditions):
+            signal = synthesize_recording(slots, slot_seconds, rng)
+            wavfile.write(
+                corpus_dir / "original_audio" / f"{speaker}_{condition}.wav",
+                SAMPLE_RATE,
+                signal,
+            )
+
+            praat_audio_textgrid = textgrids.TextGrid()
+            praat_audio_textgrid.xmin = 0.0
+            praat_audio_textgrid.xmax = slots * slot_seconds
+            word_tier = textgrids.Tier()
+            fricative_tier = textgrids.Tier()
+
+            for slot in range(slots):
+                cycle, position = divmod(slot, len(SYNTHETIC_WORDS))
+                word, vowel, fricative = SYNTHETIC_WORDS[position]
+                word = f"{word}{cycle + 1}"
+                start = slot * slot_seconds
+
+                def at(fraction):
+                    return round(start + fraction * slot_seconds, 6)
+
+                word_tier.append(textgrids.Interval(word, at(0.0), at(0.8)))
+                word_tier.append(textgrids.Interval("", at(0.8), at(1.0)))
+                fricative_tier.append(textgrids.Interval("", at(0.0), at(0.2)))
+                fricative_tier.append(textgrids.Interval(fricative, at(0.2), at(0.4)))
+                fricative_intervals += 1
+                fricative_tier.append(textgrids.Interval("", at(0.4), at(1.0)))
+                vowel_rows.append(
+                    {
+                        "vowel": vowel,
+                        "word": word,
+                        "start": at(0.45),
+                        "end": at(0.65),
+                        "slice": at(0.55),
+                        "hotneutral": condition,
+                        "speaker": speaker,
+                        "long/short": "long",
+                    }
+                )
+
+            praat_audio_textgrid["ORT-MAU"] = word_tier
+            praat_audio_textgrid["fricatives"] = fricative_tier
+            praat_audio_textgrid.write(
+                str(textgrid_dir / f"{speaker}_{condition}.TextGrid")
+            )
+
+    with open(corpus_dir / "test_dataset.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(vowel_rows[0]))
+        writer.writeheader()
+        writer.writerows(vowel_rows)
+
+    corpus = {
+        "recordings": speakers * conditions,
+        "seconds_per_recording": slots * slot_seconds,
+        "vowel_intervals": len(vowel_rows),
+        "fricative_intervals": fricative_intervals,
+    }
+    with open(corpus_dir / CORPUS_MARKER, "w", encoding="utf-8") as f:
+        json.dump(corpus, f, indent=2)
+    return corpus
+
+
+class StageTimer:
+    """
+    Collects the wall time and call count of every benchmarked stage.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+
+    def time(self, stage, function, items):
+        """
+        Calls `function` on every item, timing the whole stage.
+        """
+        start = time.perf_counter()
+        results = [function(item) for item in items]
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + time.perf_counter() - start
+        self.calls[stage] = self.calls.get(stage, 0) + len(items)
+        return results
+
+
+# Runs every stage once over the corpus in the working directory, the way the
+# file-based pipeline does: cut and export the clips, extract their features,
+# summarize them, fit the spectral tilts and draw the plots
+def run_stages():
+    import audio_processing
+    import plot_spectraltilt
+    import plot_vowel_plots
+
+    timer = StageTimer()
+
+    vowel_items = audio_processing.read_vowel_data(audio_processing.DATASET_FILE_PATH)
+    fric_items = list(audio_processing.iter_fric_annotations())
+
+    audio_cache = audio_processing.SourceAudioCache()
+    for clip_type, items in [("vowel", vowel_items), ("fric", fric_items)]:
+        audio_cache.expect(items)
+
+        def split(item):
+            audio_path = audio_processing.get_audio_path(
+                item["speaker"], item["hotneutral"]
+            )
+            item["audiofilepath"] = audio_processing.split_audio(
+                audio_path, item, clip_type, audio_cache
+            )
+
+        timer.time("split_audio", split, items)
+
+    def analyse(item):
+        item["analysisobj"] = audio_processing.create_audio_data_object(
+            item["audiofilepath"]
+        )
+
+    timer.time("create_audio_data_object", analyse, vowel_items)
+
+    measures = list(plot_vowel_plots.MEASURE_KEYS)
+    processed = timer.time(
+        "process_dataset",
+        lambda feature_data: plot_vowel_plots.process_dataset(
+            vowel_items, feature_data
+        ),
+        measures,
+    )
+
+    timer.time(
+        "do_plot_calcs",
+        lambda item: plot_spectraltilt.do_plot_calcs(item["audiofilepath"]),
+        fric_items,
+    )
+
+    def plot_vowels(measure_type):
+        plot_vowel_plots.plot_vowel_data(measure_type, processed[0])
+
+    def plot_obstruent(obstruent):
+        obstruent_label, obstruent_items = obstruent
+        plot_spectraltilt.plot_obstruent(
+            {label: item["audiofilepath"] for label, item in obstruent_items.items()},
+            obstruent_label,
+        )
+
+    timer.time("plotting", plot_vowels, list(plot_vowel_plots.MEASURE_KEYS.values()))
+    # Like the study's plots, one per word: the first occurrence of every word
+    obstruent_labels = plot_spectraltilt.get_obstruent_labels(fric_items)
+    obstruents = plot_spectraltilt.get_obstruents_from_dataset(
+        fric_items, obstruent_labels[: len(SYNTHETIC_WORDS)]
+    )
+    timer.time("plotting", plot_obstruent, list(obstruents.items()))
+
+    return timer
+
+
+def run_benchmark(
+    corpus_dir=BENCHMARK_CORPUS_DIR,
+    speakers=3,
+    conditions=2,
+    minutes=0.5,
+    intervals_per_minute=60,
+    repeat=1,
+    tolerance=REGRESSION_TOLERANCE,
+):
+    """
+    Generates a corpus and times every stage of the pipeline on it.
+
+    Each stage keeps its fastest time over `repeat` runs. The threshold of a
+    stage is its time plus `tolerance`, so the results can serve as the baseline
+    of a later run (see `check_regressions`).
+
+    Returns
+    -------
+    dict
+        The machine-readable results, as written by ``python benchmark.py``.
+    """
+    config = {
+        "speakers": speakers,
+        "conditions": conditions,
+        "minutes": minutes,
+        "intervals_per_minute": intervals_per_minute,
+        "repeat": repeat,
+    }
+    generate_start = time.perf_counter()
+    corpus = generate_corpus(
+        corpus_dir, speakers, conditions, minutes, intervals_per_minute
+    )
+    generate_seconds = time.perf_counter() - generate_start
+    # What the stages will find on disk, to tell the results' corpora apart
+    recordings = Corpus.discover(Path(corpus_dir) / "original_audio")
+    corpus["speakers"] = recordings.speakers
+    corpus["conditions"] = recordings.conditions
+
+    # The pipeline resolves its inputs and outputs relative to the working directory
+    working_dir = os.getcwd()
+    os.chdir(corpus_dir)
+    try:
+        # Nothing is shown on screen, and Agg needs no display
+        import matplotlib
+
+        matplotlib.use("Agg")
+
+        import_start = time.perf_counter()
+        import audio_processing
+        import plot_spectraltilt
+        import plot_vowel_plots
+
+        import_seconds = time.perf_counter() - import_start
+
+        runs = [run_stages() for _ in range(repeat)]
+    finally:
+        os.chdir(working_dir)
+
+    stages = {}
+    for stage in BENCHMARK_STAGES:
+        if stage not in runs[0].seconds:
+            stages[stage] = {"skipped": True}
+            continue
+        seconds = min(run.seconds[stage] for run in runs)
+        calls = runs[0].calls[stage]
+        stages[stage] = {
+            "seconds": seconds,
+            "calls": calls,
+            "ms_per_call": 1000 * seconds / calls if calls else None,
+            "runs": [run.seconds[stage] for run in runs],
+            "threshold_seconds": seconds * (1 + tolerance),
+        }
+
+    return {
+        "version": BENCHMARK_VERSION,
+        "config": config,
+        "corpus": corpus,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "generate_seconds": generate_seconds,
+        "import_seconds": import_seconds,
+        "tolerance": tolerance,
+        "stages": stages,
+    }
+
+
+def check_regressions(results, baseline):
+    """
+    Lists the stages slower than the thresholds recorded in `baseline`.
+
+    Baselines of another benchmark version or corpus configuration are not
+    comparable and raise a ValueError.
+    """
+    if baseline.get("version") != results["version"]:
+        raise ValueError("Baseline was written by another benchmark version")
+    if baseline.get("config") != results["config"]:
+        raise ValueError("Baseline was run on a different corpus configuration")
+
+    regressions = []
+    for stage, timing in results["stages"].items():
+        threshold = baseline["stages"].get(stage, {}).get("threshold_seconds")
+        if threshold is None or "seconds" not in timing:
+            continue
+        if timing["seconds"] > threshold:
+            regressions.append(
+                {
+                    "stage": stage,
+                    "seconds": timing["seconds"],
+                    "baseline_seconds": baseline["stages"][stage]["seconds"],
+                    "threshold_seconds": threshold,
+                }
+            )
+    return regressions
+
+
+# Command line: `python benchmark.py --minutes 5 --baseline old_results.json`
+# exits with status 1 when a stage regressed
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time the pipeline stages on a synthetic corpus."
+    )
+    parser.add_argument("--corpus-dir", default=BENCHMARK_CORPUS_DIR, type=Path)
+    parser.add_argument("--speakers", default=3, type=int)
+    parser.add_argument("--conditions", default=2, type=int)
+    parser.add_argument("--minutes", default=0.5, type=float)
+    parser.add_argument("--intervals-per-minute", default=60, type=int)
+    parser.add_argument("--repeat", default=1, type=int)
+    parser.add_argument("--tolerance", default=REGRESSION_TOLERANCE, type=float)
+    parser.add_argument("--output", default=BENCHMARK_RESULTS_PATH, type=Path)
+    parser.add_argument("--baseline", type=Path)
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        args.corpus_dir,
+        args.speakers,
+        args.conditions,
+        args.minutes,
+        args.intervals_per_minute,
+        args.repeat,
+        args.tolerance,
+    )
+    if args.baseline is not None:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            results["regressions"] = check_regressions(results, json.load(f))
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    for stage, timing in results["stages"].items():
+        if timing.get("skipped"):
+            print(f"{stage:<26} skipped")
+        else:
+            print(
+                f"{stage:<26} {timing['seconds']:8.3f} s  "
+                f"{timing['calls']:6d} calls  {timing['ms_per_call']:8.2f} ms/call"
+            )
+    for regression in results.get("regressions", []):
+        print(
+            f"REGRESSION {regression['stage']}: {regression['seconds']:.3f} s > "
+            f"{regression['threshold_seconds']:.3f} s",
+            file=sys.stderr,
+        )
+    sys.exit(1 if results.get("regressions") else 0)
@@ -0,0 +1,212 @@
+from pathlib import Path
+from collections import defaultdict
+import re
+
+
+# Where the recordings are looked for, annotations are in TextGrids/ below it
+ORIGINAL_AUDIO_DIR = Path("./original_audio")
+TEXTGRID_DIR_NAME = "TextGrids"
+
+# Recordings are named {speaker}_{condition}.wav
+RECORDING_NAME = re.compile(r"(?P<speaker>[^_]+)_(?P<condition>[^_]+)")
+
+# Dataset fields ItemIndex keeps a hash index for
+INDEX_FIELDS = ["speaker", "hotneutral", "vowel", "fricative", "word"]
+
+
+class Recording:
+    """
+    One ``{speaker}_{condition}.wav`` recording and its annotations.
+
+    Parameters
+    ----------
+    speaker : str
+        Speaker code, e.g. ``"KS"``.
+    condition : str
+        Room condition, e.g. ``"hot"``, stored as ``hotneutral`` on dataset items.
+    audio_path : Path
+        The recording.
+    textgrid_path : Path or None
+        ``TextGrids/{speaker}_{condition}.TextGrid``, None if it does not exist.
+    extra_textgrid_paths : list of Path
+        Other annotations of the recording, ``{speaker}_{condition}_*.TextGrid``.
+    """
+
+    def __init__(
+        self,
+        speaker,
+        condition,
+        audio_path,
+        textgrid_path=None,
+        extra_textgrid_paths=(),
+    ):
+        self.speaker = speaker
+        self.condition = condition
+        self.audio_path = audio_path
+        self.textgrid_path = textgrid_path
+        self.extra_textgrid_paths = list(extra_textgrid_paths)
+
+    def __repr__(self):
+        return (
+            f"Recording({self.speaker!r}, {self.condition!r}, {str(self.audio_path)!r})"
+        )
+
+
+class Corpus:
+    """
+    The recordings of the study, found on disk instead of listed in the code.
+
+    Every ``{speaker}_{condition}.wav`` in the audio directory is a recording, and
+    its annotations are the TextGrids of the same name in ``TextGrids/``.
+    Recordings are indexed by speaker and by condition, so adding a speaker or a
+    room condition only means adding its files. They are listed condition by
+    condition, speakers in alphabetical order within each.
+
+    Parameters
+    ----------
+    recordings : iterable of Recording
+        The recordings, see `discover` to find them on disk.
+    """
+
+    def __init__(self, recordings):
+        self.recordings = sorted(
+            recordings, key=lambda recording: (recording.condition, recording.speaker)
+        )
+        self._by_speaker = defaultdict(list)
+        self._by_condition = defaultdict(list)
+        for recording in self.recordings:
+            self._by_speaker[recording.speaker].append(recording)
+            self._by_condition[recording.condition].append(recording)
+
+    @classmethod
+    def discover(cls, audio_dir=ORIGINAL_AUDIO_DIR):
+        """
+        Finds every ``{speaker}_{condition}.wav`` in `audio_dir` and its TextGrids.
+        """
+        audio_dir = Path(audio_dir)
+        textgrid_dir = audio_dir / TEXTGRID_DIR_NAME
+        textgrids = defaultdict(list)
+        if textgrid_dir.is_dir():
+            for textgrid_path in sorted(textgrid_dir.glob("*.TextGrid")):
+                match = RECORDING_NAME.match(textgrid_path.stem)
+                if match is not None:
+                    textgrids[match.group(0)].append(textgrid_path)
+
+        recordings = []
+        for audio_path in sorted(audio_dir.glob("*.wav")):
+            match = RECORDING_NAME.fullmatch(audio_path.stem)
+            if match is None:
+                continue
+            textgrid_path = None
+            extra_textgrid_paths = []
+            for path in textgrids[audio_path.stem]:
+                if path.stem == audio_path.stem:
+                    textgrid_path = path
+                else:
+                    extra_textgrid_paths.append(path)
+            recordings.append(
+                Recording(
+                    match.group("speaker"),
+                    match.group("condition"),
+                    audio_path,
+                    textgrid_path,
+                    extra_textgrid_paths,
+                )
+            )
+        return cls(recordings)
+
+    def __len__(self):
+        return len(self.recordings)
+
+    def __iter__(self):
+        return iter(self.recordings)
+
+    @property
+    def speakers(self):
+        return sorted(self._by_speaker)
+
+    @property
+    def conditions(self):
+        return sorted(self._by_condition)
+
+    def annotated_recordings(self):
+        """
+        Returns the recordings with a ``{speaker}_{condition}.TextGrid``.
+        """
+        return [
+            recording
+            for recording in self.recordings
+            if recording.textgrid_path is not None
+        ]
+
+
+class ItemIndex:
+    """
+    Hash indexes over dataset items for grouped access without rescanning.
+
+    Each field in `fields` maps every value it takes to the positions of the items
+    holding it, so a group is one dictionary lookup and a selection on several
+    fields only walks the smallest of their groups. Items without a field (e.g.
+    the ``fricative`` of a vowel) are left out of that field's index.
+
+    Parameters
+    ----------
+    items : iterable of dict, optional
+        Dataset items to index, more can be added with `extend`.
+    fields : list of str, optional
+        Fields to index, by default `INDEX_FIELDS`.
+    """
+
+    def __init__(self, items=(), fields=INDEX_FIELDS):
+        self.items = []
+        self.fields = list(fields)
+        self._index = {field: defaultdict(list) for field in self.fields}
+        self.extend(items)
+
+    def extend(self, items):
+        for item in items:
+            position = len(self.items)
+            self.items.append(item)
+            for field in self.fields:
+                if field in item:
+                    self._index[field][item[field]].append(position)
+
+    def __len__(self):
+        return len(self.items)
+
+    def values(self, field):
+        """
+        Returns the distinct values of a field, in order of first appearance.
+        """
+        return list(self._index[field])
+
+    def group(self, field, value):
+        """
+        Returns the items whose `field` is `value`, in dataset order.
+        """
+        return [self.items[position] for position in self._index[field].get(value, [])]
+
+    def groups(self, field):
+        """
+        Returns a dict from every value of `field` to its items.
+        """
+        return {
+            value: [self.items[position] for position in positions]
+            for value, positions in self._index[field].items()
+        }
+
+    def select(self, **criteria):
+        """
+        Returns the items matching every ``field=value`` criterion, in dataset order.
+        """
+        if not criteria:
+            return list(self.items)
+        position_lists = sorted(
+            (self._index[field].get(value, []) for field, value in criteria.items()),
+            key=len,
+        )
+        selected = position_lists[0]
+        for positions in position_lists[1:]:
+            matching = set(positions)
+            selected = [position for position in selected if position in matching]
+        return [self.items[position] for position in selected]
@@ -0,0 +1,244 @@
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import opensmile
+
+
+# Default location and size cap of the on-disk cache
+FEATURE_CACHE_DIR = Path("./feature_cache")
+FEATURE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Eviction frees the cache down to this fraction of the cap, so the next few
+# writes do not each have to scan the cache again
+FEATURE_CACHE_EVICT_TO = 0.9
+
+# Bump when the stored layout changes so old entries are never read back
+CACHE_FORMAT_VERSION = 1
+
+
+class FeatureCache:
+    """
+    A persistent, content-addressed cache for `AudioAnalysis.feature_data`.
+
+    Entries are keyed by the SHA-256 of the source recording, the clip start/end
+    and the OpenSMILE feature set/level (plus the OpenSMILE version). Each entry is
+    one compressed ``.npz`` file holding the frame matrix in the features' dtype,
+    its column names and the frame start/end times. The cache is capped at `max_bytes`; when it
+    grows past the cap the least recently used entries are evicted. The size of the
+    cache is scanned once and then kept up to date by this instance's writes, so
+    entries written by other processes are only counted at the next eviction.
+
+    Parameters
+    ----------
+    cache_dir : str or Path, optional
+        Directory holding the cache entries, by default ``./feature_cache``.
+    max_bytes : int, optional
+        Size cap of the cache in bytes, by default 512 MiB.
+
+    Attributes
+    ----------
+    hits : int
+        Number of lookups answered from disk.
+    misses : int
+        Number of lookups that had to be extracted.
+    """
+
+    def __init__(self, cache_dir=FEATURE_CACHE_DIR, max_bytes=FEATURE_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._file_hashes = {}
+        # Bytes on disk as of the last scan plus this instance's writes since
+        self._total_bytes = None
+
+    def file_hash(self, path):
+        """
+        Returns the SHA-256 of a file's content, memoised on its size and mtime.
+        """
+        stat = os.stat(path)
+        memo_key = (str(path), stat.st_size, stat.st_mtime_ns)
+        digest = self._file_hashes.get(memo_key)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    sha.update(block)
+            digest = sha.hexdigest()
+            self._file_hashes[memo_key] = digest
+        return digest
+
+    def make_key(
+        self,
+        source_path,
+        start,
+        end,
+        feature_set,
+        feature_level,
+        columns=None,
+        dtype=np.float32,
+    ):
+        """
+        Builds the cache key of a clip cut from `source_path` between `start` and `end`.
+
+        Features limited to some `columns` are cached apart from the full set, and
+        so are features of another `dtype` than float32.
+        """
+        parts = [
+            CACHE_FORMAT_VERSION,
+            opensmile.__version__,
+            self.file_hash(source_path),
+            repr(float(start)),
+            repr(float(end)),
+            str(getattr(feature_set, "value", feature_set)),
+            str(getattr(feature_level, "value", feature_level)),
+        ]
+        if columns is not None:
+            parts.append(list(columns))
+        if np.dtype(dtype) != np.float32:
+            parts.append(np.dtype(dtype).str)
+        payload = json.dumps(parts)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.npz"
+
+    def load(self, key, file=None):
+        """
+        Returns the cached feature DataFrame for `key`, or None on a miss.
+
+        Parameters
+        ----------
+        key : str
+            Key from `make_key`.
+        file : str or Path, optional
+            Clip path to put in the ``file`` level of the index, as
+            `opensmile.Smile.process_file` would.
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with np.load(entry_path) as entry:
+                values = entry["values"]
+                columns = entry["columns"].tolist()
+                starts = pd.to_timedelta(entry["start"], unit="ns")
+                ends = pd.to_timedelta(entry["end"], unit="ns")
+            # Touch the entry so eviction sees it as recently used
+            os.utime(entry_path)
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            self.misses += 1
+            return None
+
+        if file is not None:
+            index = pd.MultiIndex.from_arrays(
+                [[str(file)] * len(starts), starts, ends],
+                names=["file", "start", "end"],
+            )
+        else:
+            index = pd.MultiIndex.from_arrays([starts, ends], names=["start", "end"])
+
+        self.hits += 1
+        return pd.DataFrame(values, index=index, columns=columns)
+
+    def store(self, key, feature_data):
+        """
+        Writes `feature_data` under `key` and evicts old entries if over the cap.
+        """
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            replaced_bytes = entry_path.stat().st_size
+        except FileNotFoundError:
+            replaced_bytes = 0
+
+        # Write to a temporary file first so readers never see half an entry
+        tmp_path = entry_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                values=feature_data.to_numpy(),
+                columns=np.array(feature_data.columns, dtype=str),
+                start=feature_data.index.get_level_values("start").asi8,
+                end=feature_data.index.get_level_values("end").asi8,
+            )
+        os.replace(tmp_path, entry_path)
+
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, size, _ in self._entries())
+        else:
+            self._total_bytes += entry_path.stat().st_size - replaced_bytes
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        for entry_path in self.cache_dir.glob("*/*.npz"):
+            try:
+                stat = entry_path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry_path))
+        return entries
+
+    def evict(self, target_bytes=None):
+        """
+        Removes least recently used entries until the cache fits in `target_bytes`,
+        by default `FEATURE_CACHE_EVICT_TO` of `max_bytes`.
+        """
+        if target_bytes is None:
+            target_bytes = self.max_bytes * FEATURE_CACHE_EVICT_TO
+        entries = sorted(self._entries())
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, entry_path in entries:
+            if total_bytes <= target_bytes:
+                break
+            try:
+                entry_path.unlink()
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+        self._total_bytes = total_bytes
+
+    def clear(self):
+        """
+        Removes every entry from the cache and returns how many were removed.
+        """
+        removed = 0
+        for _, _, entry_path in self._entries():
+            try:
+                entry_path.unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+        self._total_bytes = None
+        return removed
+
+    def stats(self):
+        """
+        Returns the entry count, size on disk and hit/miss counts.
+        """
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Command line: `python feature_cache.py clear` invalidates the whole cache
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the on-disk feature cache.")
+    parser.add_argument("command", choices=["clear", "info"])
+    parser.add_argument("--cache-dir", default=FEATURE_CACHE_DIR, type=Path)
+    args = parser.parse_args()
+
+    feature_cache = FeatureCache(args.cache_dir)
+    if args.command == "clear":
+        print(f"Removed {feature_cache.clear()} cached feature entries")
+    else:
+        print(json.dumps(feature_cache.stats(), indent=2))
@@ -0,0 +1,422 @@
+import numpy as np
+import pandas as pd
+
+
+# Dataset fields kept next to the frames, missing fields are stored as ""
+METADATA_COLUMNS = ["speaker", "hotneutral", "vowel", "word", "fricative"]
+
+# Percentiles reported by FeatureStore.summarize next to mean, std and median
+SUMMARY_PERCENTILES = (10, 25, 75, 90)
+
+REDUCTIONS = {
+    "sum": np.add,
+    "min": np.minimum,
+    "max": np.maximum,
+}
+
+
+class FeatureStore:
+    """
+    A columnar store holding the LLD frames of every clip in a dataset.
+
+    All frames live in one contiguous float32 matrix, clip ``i`` owning rows
+    ``offsets[i]:offsets[i + 1]``. The dataset fields in `METADATA_COLUMNS` are kept
+    as one array per field, so per-clip and grouped aggregations are single
+    vectorized passes instead of a Python loop over per-item DataFrames.
+
+    Parameters
+    ----------
+    columns : list of str
+        Names of the feature columns.
+    frames : np.ndarray
+        Frame matrix of shape (total frames, len(columns)).
+    frame_times : np.ndarray
+        Frame start/end times in nanoseconds, shape (total frames, 2).
+    offsets : np.ndarray
+        Row offsets of each clip, length number of clips + 1.
+    metadata : dict of str to np.ndarray
+        One array per metadata column, one entry per clip.
+    """
+
+    def __init__(self, columns, frames, frame_times, offsets, metadata):
+        self.columns = list(columns)
+        self.frames = frames
+        self.frame_times = frame_times
+        self.offsets = offsets
+        self.metadata = metadata
+        self._column_positions = {name: i for i, name in enumerate(self.columns)}
+        self._summaries = {}
+
+    @classmethod
+    def from_dataset(cls, dataset, release_features=False):
+        """
+        Builds a store from dataset items carrying an ``analysisobj``.
+
+        Each item gets a ``clipindex`` pointing at its clip in the store. With
+        `release_features` the per-item feature DataFrames are dropped afterwards, so
+        the store is the only copy of the frames. Accessing ``feature_data`` on a
+        released item extracts the features again.
+        """
+        feature_frames = [item["analysisobj"].feature_data for item in dataset]
+        columns = next(
+            (list(frame.columns) for frame in feature_frames if frame is not None), []
+        )
+
+        lengths = np.array(
+            [0 if frame is None else len(frame) for frame in feature_frames],
+            dtype=np.int64,
+        )
+        offsets = np.zeros(len(dataset) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        frames = np.empty((offsets[-1], len(columns)), dtype=np.float32)
+        frame_times = np.empty((offsets[-1], 2), dtype=np.int64)
+        for i, frame in enumerate(feature_frames):
+            if frame is None or len(frame) == 0:
+                continue
+            rows = slice(offsets[i], offsets[i + 1])
+            frames[rows] = frame[columns].to_numpy(dtype=np.float32)
+            frame_times[rows, 0] = frame.index.get_level_values("start").asi8
+            frame_times[rows, 1] = frame.index.get_level_values("end").asi8
+
+        metadata = {
+            name: np.array([str(item.get(name, "")) for item in dataset], dtype=str)
+            for name in METADATA_COLUMNS
+        }
+
+        for i, item in enumerate(dataset):
+            item["clipindex"] = i
+            if release_features:
+                item["analysisobj"].feature_data = None
+
+        return cls(columns, frames, frame_times, offsets, metadata)
+
+    @classmethod
+    def concatenate(cls, stores):
+        """
+        Builds one store holding the clips of every store in turn. Stores without
+        clips are left out, they do not know their columns.
+
+        Raises
+        ------
+        ValueError
+            If the stores do not have the same columns.
+        """
+        stores = [store for store in stores if len(store)]
+        columns = stores[0].columns if stores else []
+        if any(store.columns != columns for store in stores):
+            raise ValueError("Only stores with the same columns can be concatenated")
+
+        lengths = np.concatenate(
+            [store.clip_lengths for store in stores] or [np.zeros(0, dtype=np.int64)]
+        )
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        frames = np.concatenate(
+            [store.frames for store in stores]
+            or [np.empty((0, len(columns)), dtype=np.float32)]
+        )
+        frame_times = np.concatenate(
+            [store.frame_times for store in stores]
+            or [np.empty((0, 2), dtype=np.int64)]
+        )
+        metadata = {
+            name: np.concatenate(
+                [store.metadata[name] for store in stores] or [np.empty(0, dtype=str)]
+            )
+            for name in METADATA_COLUMNS
+        }
+        return cls(columns, frames, frame_times, offsets, metadata)
+
+    def take(self, clip_indices):
+        """
+        Returns a new store with the given clips, in the given order.
+        """
+        clip_indices = np.asarray(clip_indices, dtype=np.int64)
+        lengths = self.clip_lengths[clip_indices]
+        offsets = np.zeros(len(clip_indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # Row of every frame of the new store in this one
+        rows = np.repeat(self.offsets[:-1][clip_indices] - offsets[:-1], lengths)
+        rows += np.arange(offsets[-1])
+        metadata = {
+            name: values[clip_indices] for name, values in self.metadata.items()
+        }
+        return type(self)(
+            self.columns, self.frames[rows], self.frame_times[rows], offsets, metadata
+        )
+
+    def to_arrays(self):
+        """
+        Returns the store as a dict of arrays, e.g. for `np.savez`.
+        """
+        arrays = {
+            "columns": np.array(self.columns, dtype=str),
+            "frames": self.frames,
+            "frame_times": self.frame_times,
+            "offsets": self.offsets,
+        }
+        for name, values in self.metadata.items():
+            arrays[f"metadata_{name}"] = values
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Rebuilds a store from the arrays of `to_arrays`.
+        """
+        metadata = {
+            name: np.asarray(arrays[f"metadata_{name}"]) for name in METADATA_COLUMNS
+        }
+        return cls(
+            np.asarray(arrays["columns"]).tolist(),
+            np.asarray(arrays["frames"]),
+            np.asarray(arrays["frame_times"]),
+            np.asarray(arrays["offsets"]),
+            metadata,
+        )
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def clip_lengths(self):
+        return np.diff(self.offsets)
+
+    @property
+    def nbytes(self):
+        return (
+            self.frames.nbytes
+            + self.frame_times.nbytes
+            + self.offsets.nbytes
+            + sum(values.nbytes for values in self.metadata.values())
+        )
+
+    def column_positions(self, columns=None):
+        if columns is None:
+            return list(range(len(self.columns)))
+        if isinstance(columns, str):
+            columns = [columns]
+        return [self._column_positions[name] for name in columns]
+
+    def clip_frames(self, clip_index, columns=None):
+        """
+        Returns a view of one clip's frames, optionally limited to some columns.
+        """
+        rows = self.frames[self.offsets[clip_index] : self.offsets[clip_index + 1]]
+        if columns is None:
+            return rows
+        return rows[:, self.column_positions(columns)]
+
+    def clip_feature_data(self, clip_index):
+        """
+        Rebuilds one clip's frames as a DataFrame indexed by frame start/end.
+        """
+        rows = slice(self.offsets[clip_index], self.offsets[clip_index + 1])
+        index = pd.MultiIndex.from_arrays(
+            [
+                pd.to_timedelta(self.frame_times[rows, 0], unit="ns"),
+                pd.to_timedelta(self.frame_times[rows, 1], unit="ns"),
+            ],
+            names=["start", "end"],
+        )
+        return pd.DataFrame(self.frames[rows], index=index, columns=self.columns)
+
+    def clip_reduce(self, columns=None, reduction="mean"):
+        """
+        Reduces every clip's frames in one pass.
+
+        Parameters
+        ----------
+        columns : str or list of str, optional
+            Columns to reduce, by default all of them.
+        reduction : {"mean", "sum", "min", "max"}
+            The reduction applied to each clip.
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape (number of clips, number of columns). Clips without
+            frames get NaN.
+        """
+        # Accumulate in float64 so long clips don't lose precision
+        values = self.frames[:, self.column_positions(columns)].astype(np.float64)
+        lengths = self.clip_lengths
+        result = np.full((len(self), values.shape[1]), np.nan)
+        non_empty = lengths > 0
+        if not non_empty.any():
+            return result
+
+        ufunc = REDUCTIONS["sum" if reduction == "mean" else reduction]
+        # reduceat misbehaves on empty segments, so only non-empty starts are used
+        reduced = ufunc.reduceat(values, self.offsets[:-1][non_empty], axis=0)
+        if reduction == "mean":
+            reduced /= lengths[non_empty, None]
+        result[non_empty] = reduced
+        return result
+
+    def _clip_sums(self, values):
+        sums = np.zeros((len(self), values.shape[1]))
+        non_empty = self.clip_lengths > 0
+        if non_empty.any():
+            sums[non_empty] = np.add.reduceat(
+                values, self.offsets[:-1][non_empty], axis=0
+            )
+        return sums
+
+    def _sorted_within_clips(self, values):
+        # Sort every column inside every clip at once: rank the values globally
+        # (NaN ranks last), then sort by (clip, rank) packed into one integer key
+        n_frames = len(values)
+        order = np.argsort(values, axis=0, kind="stable")
+        ranks = np.empty_like(order)
+        np.put_along_axis(
+            ranks,
+            order,
+            np.broadcast_to(np.arange(n_frames)[:, None], order.shape),
+            axis=0,
+        )
+        clip_ids = np.repeat(np.arange(len(self)), self.clip_lengths)
+        keys = clip_ids[:, None] * n_frames + ranks
+        keys.sort(axis=0)
+        return np.take_along_axis(
+            values, np.take_along_axis(order, keys % max(n_frames, 1), axis=0), axis=0
+        )
+
+    def summarize(self, percentiles=SUMMARY_PERCENTILES):
+        """
+        Summarizes every column of every clip in one vectorized pass.
+
+        For each column the table has ``<column>_count``, ``_mean``, ``_std``
+        (population, ddof=0), ``_median`` and ``_p<q>`` for each percentile, using
+        linear interpolation like `np.percentile`. Columns ending in ``nz`` only
+        have values on voiced frames, so their zero (unvoiced) frames are left out.
+        The table is computed once per set of percentiles and then reused.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per clip, with ``clipindex`` and the metadata columns first.
+        """
+        percentiles = tuple(percentiles)
+        if percentiles in self._summaries:
+            return self._summaries[percentiles]
+
+        values = self.frames.astype(np.float64)
+        voiced_only = np.array(
+            [name.endswith("nz") for name in self.columns], dtype=bool
+        )
+        values[:, voiced_only] = np.where(
+            values[:, voiced_only] == 0, np.nan, values[:, voiced_only]
+        )
+        valid = ~np.isnan(values)
+        clip_ids = np.repeat(np.arange(len(self)), self.clip_lengths)
+
+        counts = self._clip_sums(valid.astype(np.float64))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = self._clip_sums(np.where(valid, values, 0.0)) / counts
+            deviations = np.where(valid, values - means[clip_ids], 0.0)
+            stds = np.sqrt(self._clip_sums(deviations**2) / counts)
+
+        # Valid values of each clip now come first in its rows, in ascending order
+        sorted_values = self._sorted_within_clips(values)
+        column_ids = np.arange(len(self.columns))
+
+        def percentile(q):
+            if len(values) == 0:
+                return np.full(counts.shape, np.nan)
+            position = np.maximum(counts - 1, 0) * (q / 100.0)
+            lower = np.floor(position).astype(np.int64)
+            upper = np.ceil(position).astype(np.int64)
+            rows_lower = np.minimum(self.offsets[:-1, None] + lower, len(values) - 1)
+            rows_upper = np.minimum(self.offsets[:-1, None] + upper, len(values) - 1)
+            low_values = sorted_values[rows_lower, column_ids]
+            high_values = sorted_values[rows_upper, column_ids]
+            result = low_values + (high_values - low_values) * (position - lower)
+            return np.where(counts > 0, result, np.nan)
+
+        statistics = {"count": counts, "mean": means, "std": stds}
+        statistics["median"] = percentile(50)
+        for q in percentiles:
+            statistics[f"p{q:g}"] = percentile(q)
+
+        summary = pd.DataFrame(
+            {
+                "clipindex": np.arange(len(self)),
+                **self.metadata,
+                **{
+                    f"{name}_{stat}": stat_values[:, i]
+                    for i, name in enumerate(self.columns)
+                    for stat, stat_values in statistics.items()
+                },
+            }
+        )
+        self._summaries[percentiles] = summary
+        return summary
+
+    def clip_table(self):
+        """
+        Returns the only frame of every clip as a table, for stores of
+        Functionals-level features, which OpenSMILE already summarized per clip.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per clip, with ``clipindex`` and the metadata columns first.
+
+        Raises
+        ------
+        ValueError
+            If a clip does not have exactly one frame.
+        """
+        if np.any(self.clip_lengths != 1):
+            raise ValueError("clip_table needs exactly one frame per clip")
+        return pd.DataFrame(
+            {
+                "clipindex": np.arange(len(self)),
+                **self.metadata,
+                **{name: self.frames[:, i] for i, name in enumerate(self.columns)},
+            }
+        )
+
+    def group_ids(self, by):
+        """
+        Returns the distinct metadata keys for `by` and the group id of each clip.
+        """
+        if isinstance(by, str):
+            by = [by]
+        keys = np.stack([self.metadata[name] for name in by], axis=1)
+        group_keys, group_ids = np.unique(keys, axis=0, return_inverse=True)
+        return group_keys, group_ids.reshape(-1)
+
+    def group_reduce(self, by, columns=None, reduction="mean"):
+        """
+        Averages per-clip reductions over groups of clips, e.g. by speaker and room.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row per group, with the `by` fields followed by the averaged columns.
+        """
+        if isinstance(by, str):
+            by = [by]
+        if columns is None:
+            columns = self.columns
+        elif isinstance(columns, str):
+            columns = [columns]
+
+        per_clip = self.clip_reduce(columns, reduction)
+        group_keys, group_ids = self.group_ids(by)
+
+        # NaN clips (no frames) are left out of their group's average
+        valid = ~np.isnan(per_clip)
+        counts = np.zeros((len(group_keys), len(columns)))
+        sums = np.zeros((len(group_keys), len(columns)))
+        np.add.at(counts, group_ids, valid)
+        np.add.at(sums, group_ids, np.where(valid, per_clip, 0.0))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+
+        grouped = pd.DataFrame(group_keys, columns=by)
+        grouped[columns] = means
+        return grouped
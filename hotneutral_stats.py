@@ -0,0 +1,265 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from feature_store import METADATA_COLUMNS
+from instrumentation import profiled
+
+
+# The two room conditions compared, as stored in the hotneutral field
+HOT = "hot"
+NEUTRAL = "neutral"
+
+# Resamples of every test and confidence interval
+RESAMPLES = 10000
+
+# Two-sided coverage of the bootstrap confidence intervals
+CONFIDENCE = 0.95
+
+# Fixed so every run reports the same p-values and intervals
+RANDOM_SEED = 0
+
+# Resamples drawn per matrix product, bounds the (resamples, clips) index matrices
+RESAMPLE_BATCH = 2000
+
+# Summary columns that are not features of the clip: frame counts follow the length
+# of the annotation, not the voice
+NON_FEATURE_SUFFIXES = ("_count",)
+
+# Result columns after the group fields
+RESULT_COLUMNS = [
+    "feature",
+    "n_hot",
+    "n_neutral",
+    "mean_hot",
+    "mean_neutral",
+    "difference",
+    "ci_low",
+    "ci_high",
+    "p_value",
+]
+
+
+# Numeric columns of a summary table that describe the clips, e.g. every
+# <descriptor>_mean, _std and percentile and the fricative spectral measures
+def get_feature_columns(summary):
+    return [
+        column
+        for column in summary.columns
+        if column != "clipindex"
+        and column not in METADATA_COLUMNS
+        and not column.endswith(NON_FEATURE_SUFFIXES)
+        and pd.api.types.is_numeric_dtype(summary[column])
+    ]
+
+
+# Means of every feature for each row of clip weights (resamples x clips), as one
+# matrix product. Clips without a value (NaN) are left out of their feature's mean.
+def _weighted_means(weights, values, valid):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (weights @ values) / (weights @ valid)
+
+
+# Index matrix of `resamples` permutations of n clips, one permutation per row
+def permutation_indices(rng, resamples, n):
+    return rng.permuted(np.broadcast_to(np.arange(n), (resamples, n)), axis=1)
+
+
+# Index matrix of `resamples` bootstrap samples of n clips, one sample per row
+def bootstrap_indices(rng, resamples, n):
+    return rng.integers(0, n, size=(resamples, n))
+
+
+# How often every clip occurs in each row of an index matrix, shape (rows, n)
+def index_counts(indices, n):
+    rows = len(indices)
+    flat = (indices + n * np.arange(rows)[:, None]).ravel()
+    return np.bincount(flat, minlength=rows * n).reshape(rows, n).astype(np.float64)
+
+
+class HotNeutralTest:
+    """
+    Permutation test and bootstrap confidence interval of the hot minus neutral
+    difference in means of many features of one group of clips.
+
+    Resamples are drawn in batches of index matrices, one resample per row, and
+    turned into clip weights, so the means of every feature in every resample of
+    a batch come out of two matrix products instead of a Python loop. The
+    permutation test shuffles the room labels of the clips, the bootstrap draws
+    the hot and neutral clips with replacement within their own room.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Features of the clips, shape (clips, features), NaN where a clip has none.
+    hot : np.ndarray
+        Boolean mask of the hot clips, the others are neutral.
+    """
+
+    def __init__(self, values, hot):
+        self.valid = (~np.isnan(values)).astype(np.float64)
+        self.values = np.where(self.valid > 0, values, 0.0)
+        self.hot = np.asarray(hot, dtype=bool)
+        self.n_hot = int(self.hot.sum())
+        self.n_neutral = len(self.hot) - self.n_hot
+
+    def means(self, hot_weights):
+        """
+        Hot and neutral means of every feature, for each row of hot clip weights
+        (1 for a hot clip, 0 for a neutral one).
+        """
+        neutral_weights = 1.0 - hot_weights
+        return (
+            _weighted_means(hot_weights, self.values, self.valid),
+            _weighted_means(neutral_weights, self.values, self.valid),
+        )
+
+    def difference(self):
+        mean_hot, mean_neutral = self.means(self.hot[None, :].astype(np.float64))
+        return mean_hot[0], mean_neutral[0]
+
+    def permutation_p_values(self, rng, resamples=RESAMPLES, batch=RESAMPLE_BATCH):
+        """
+        Two-sided p-values, ``(1 + extreme) / (1 + resamples)`` where `extreme`
+        counts the relabelings with a difference at least as large as the observed
+        one. Relabelings leaving a room without a value of a feature do not count
+        as resamples of that feature.
+        """
+        mean_hot, mean_neutral = self.difference()
+        observed = np.abs(mean_hot - mean_neutral)
+        # Tolerance for equal differences summed in another order
+        observed = observed - 1e-12 * np.maximum(observed, 1.0)
+
+        n = len(self.hot)
+        extreme = np.zeros(self.values.shape[1])
+        finite = np.zeros(self.values.shape[1])
+        for start in range(0, resamples, batch):
+            rows = min(batch, resamples - start)
+            # The first n_hot clips of every permutation are labeled hot
+            labels = permutation_indices(rng, rows, n)[:, : self.n_hot]
+            hot_means, neutral_means = self.means(index_counts(labels, n))
+            differences = np.abs(hot_means - neutral_means)
+            finite += np.isfinite(differences).sum(axis=0)
+            extreme += (differences >= observed).sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(np.isfinite(observed), (1 + extreme) / (1 + finite), np.nan)
+
+    def bootstrap_interval(
+        self, rng, resamples=RESAMPLES, confidence=CONFIDENCE, batch=RESAMPLE_BATCH
+    ):
+        """
+        Percentile bootstrap interval of the difference, drawing each room's clips
+        with replacement. Returns the lower and upper bounds of every feature.
+        """
+        hot_positions = np.flatnonzero(self.hot)
+        neutral_positions = np.flatnonzero(~self.hot)
+        n = len(self.hot)
+
+        differences = []
+        for start in range(0, resamples, batch):
+            rows = min(batch, resamples - start)
+            samples = np.concatenate(
+                [
+                    hot_positions[bootstrap_indices(rng, rows, self.n_hot)],
+                    neutral_positions[bootstrap_indices(rng, rows, self.n_neutral)],
+                ],
+                axis=1,
+            )
+            weights = index_counts(samples, n)
+            hot_means = _weighted_means(weights * self.hot, self.values, self.valid)
+            neutral_means = _weighted_means(
+                weights * ~self.hot, self.values, self.valid
+            )
+            differences.append(hot_means - neutral_means)
+        differences = np.concatenate(differences)
+
+        tail = 100 * (1 - confidence) / 2
+        with warnings.catch_warnings():
+            # Features without a value in one of the rooms have no interval
+            warnings.simplefilter("ignore", RuntimeWarning)
+            ci_low, ci_high = np.nanpercentile(
+                np.where(np.isfinite(differences), differences, np.nan),
+                [tail, 100 - tail],
+                axis=0,
+            )
+        return ci_low, ci_high
+
+
+@profiled
+def compare_hot_neutral(
+    summary,
+    by,
+    features=None,
+    resamples=RESAMPLES,
+    confidence=CONFIDENCE,
+    seed=RANDOM_SEED,
+):
+    """
+    Tests the hot vs neutral difference of every feature within groups of clips.
+
+    Parameters
+    ----------
+    summary : pd.DataFrame
+        One row per clip with its metadata and features, e.g. from
+        `FeatureStore.summarize` with the fricative spectral measures added.
+    by : str or list of str
+        Fields the clips are grouped by, e.g. ``"speaker"`` or ``"vowel"``.
+        Groups without both hot and neutral clips are left out.
+    features : list of str, optional
+        Columns to test, by default every feature column of `summary`.
+    resamples : int, optional
+        Permutations and bootstrap samples per group, by default `RESAMPLES`.
+    confidence : float, optional
+        Coverage of the confidence intervals, by default `CONFIDENCE`.
+    seed : int, optional
+        Seed of the resampling, by default `RANDOM_SEED`.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per group and feature, with the `by` fields followed by
+        `RESULT_COLUMNS`. ``difference`` is the hot mean minus the neutral mean.
+    """
+    if isinstance(by, str):
+        by = [by]
+    if features is None:
+        features = get_feature_columns(summary)
+
+    rng = np.random.default_rng(seed)
+    results = []
+    # Clips without a value of a grouping field (e.g. the vowel of a fricative)
+    # are in no group
+    grouped = summary[(summary[by].fillna("") != "").all(axis=1)]
+    for key, group in grouped.groupby(by, sort=True):
+        group = group[group["hotneutral"].isin([HOT, NEUTRAL])]
+        hot = (group["hotneutral"] == HOT).to_numpy()
+        if hot.all() or not hot.any():
+            continue
+
+        test = HotNeutralTest(group[features].to_numpy(dtype=np.float64), hot)
+        mean_hot, mean_neutral = test.difference()
+        p_values = test.permutation_p_values(rng, resamples)
+        ci_low, ci_high = test.bootstrap_interval(rng, resamples, confidence)
+
+        result = pd.DataFrame(
+            {
+                "feature": features,
+                "n_hot": (test.valid[hot]).sum(axis=0).astype(int),
+                "n_neutral": (test.valid[~hot]).sum(axis=0).astype(int),
+                "mean_hot": mean_hot,
+                "mean_neutral": mean_neutral,
+                "difference": mean_hot - mean_neutral,
+                "ci_low": ci_low,
+                "ci_high": ci_high,
+                "p_value": p_values,
+            }
+        )
+        key = key if isinstance(key, tuple) else (key,)
+        for name, value in reversed(list(zip(by, key))):
+            result.insert(0, name, value)
+        results.append(result)
+
+    if not results:
+        return pd.DataFrame(columns=by + RESULT_COLUMNS)
+    return pd.concat(results, ignore_index=True)
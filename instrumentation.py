@@ -0,0 +1,242 @@
+from pathlib import Path
+from contextlib import contextmanager
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+
+# Where `write_chrome_trace` puts the trace by default, open it in
+# chrome://tracing or https://ui.perfetto.dev
+TRACE_PATH = Path("./pipeline_trace.json")
+
+# Item fields copied into every span, so slow clips can be told apart
+ITEM_FIELDS = ["speaker", "hotneutral", "word", "vowel", "fricative", "start", "end"]
+
+
+class _Span:
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start_ns = time.perf_counter_ns()
+        self.cpu_start_ns = time.thread_time_ns()
+        self.memory_base = 0
+        self.memory_peak = 0
+
+
+class StageProfiler:
+    """
+    Opt-in recorder of wall time, CPU time and peak memory per pipeline call.
+
+    Functions decorated with `profiled` report one span per call while the
+    profiler is enabled, and cost a single attribute check otherwise. Spans nest,
+    so a stage's time includes the stages it calls. Peak memory is the highest
+    traced Python allocation (numpy buffers included) above what was allocated
+    when the call started, measured with `tracemalloc`.
+
+    Calls that run in worker processes are not recorded, run with one worker to
+    see every item.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self.spans = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._origin_ns = time.perf_counter_ns()
+
+    def enable(self, trace_memory=True):
+        """
+        Starts recording. With `trace_memory`, tracemalloc measures peak memory,
+        which slows allocation-heavy code down noticeably.
+        """
+        self.enabled = True
+        self.trace_memory = trace_memory
+        self._origin_ns = time.perf_counter_ns()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        self.enabled = False
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def span(self, name, category="pipeline", **args):
+        """
+        Records the enclosed block as one span, when the profiler is enabled.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        stack = self._stack()
+        span = _Span(name, category, args)
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # The enclosing spans keep the peak reached so far before it is reset
+            for outer in stack:
+                outer.memory_peak = max(outer.memory_peak, peak)
+            tracemalloc.reset_peak()
+            span.memory_base = span.memory_peak = current
+        stack.append(span)
+
+        try:
+            yield
+        finally:
+            end_ns = time.perf_counter_ns()
+            cpu_ns = time.thread_time_ns() - span.cpu_start_ns
+            stack.pop()
+            peak_bytes = None
+            if self.trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                span.memory_peak = max(span.memory_peak, peak)
+                if stack:
+                    stack[-1].memory_peak = max(stack[-1].memory_peak, span.memory_peak)
+                peak_bytes = span.memory_peak - span.memory_base
+
+            record = {
+                "name": span.name,
+                "category": span.category,
+                "start_ns": span.start_ns - self._origin_ns,
+                "wall_ns": end_ns - span.start_ns,
+                "cpu_ns": cpu_ns,
+                "peak_bytes": peak_bytes,
+                "thread": threading.get_ident(),
+                "depth": len(stack),
+                "args": span.args,
+            }
+            with self._lock:
+                self.spans.append(record)
+
+    def stage_summary(self):
+        """
+        Returns one row per stage: calls, wall and CPU time, peak memory and the
+        slowest call.
+        """
+        stages = {}
+        for record in self.spans:
+            stage = stages.setdefault(
+                record["name"],
+                {
+                    "stage": record["name"],
+                    "calls": 0,
+                    "wall_s": 0.0,
+                    "cpu_s": 0.0,
+                    "max_wall_s": 0.0,
+                    "peak_mib": None,
+                    "slowest_item": None,
+                },
+            )
+            stage["calls"] += 1
+            stage["wall_s"] += record["wall_ns"] / 1e9
+            stage["cpu_s"] += record["cpu_ns"] / 1e9
+            if record["wall_ns"] / 1e9 >= stage["max_wall_s"]:
+                stage["max_wall_s"] = record["wall_ns"] / 1e9
+                stage["slowest_item"] = record["args"].get("item")
+            if record["peak_bytes"] is not None:
+                peak_mib = record["peak_bytes"] / 2**20
+                stage["peak_mib"] = max(stage["peak_mib"] or 0.0, peak_mib)
+        return sorted(stages.values(), key=lambda stage: -stage["wall_s"])
+
+    def print_summary(self, file=sys.stderr):
+        """
+        Prints the stage summary as a table, slowest stages first.
+        """
+        rows = self.stage_summary()
+        if not rows:
+            return
+        width = max(len(row["stage"]) for row in rows)
+        print(
+            f"{'stage':<{width}} {'calls':>7} {'wall s':>9} {'cpu s':>9} "
+            f"{'max s':>8} {'peak MiB':>9}  slowest item",
+            file=file,
+        )
+        for row in rows:
+            peak = "-" if row["peak_mib"] is None else f"{row['peak_mib']:.1f}"
+            print(
+                f"{row['stage']:<{width}} {row['calls']:>7} {row['wall_s']:>9.3f} "
+                f"{row['cpu_s']:>9.3f} {row['max_wall_s']:>8.3f} {peak:>9}  "
+                f"{row['slowest_item'] or ''}",
+                file=file,
+            )
+
+    def write_chrome_trace(self, path=TRACE_PATH):
+        """
+        Writes every span as a complete ("X") event of the Chrome trace format.
+        """
+        events = []
+        for record in self.spans:
+            args = dict(record["args"])
+            args["cpu_ms"] = record["cpu_ns"] / 1e6
+            if record["peak_bytes"] is not None:
+                args["peak_kib"] = record["peak_bytes"] / 1024
+            events.append(
+                {
+                    "name": record["name"],
+                    "cat": record["category"],
+                    "ph": "X",
+                    "ts": record["start_ns"] / 1000,
+                    "dur": record["wall_ns"] / 1000,
+                    "pid": os.getpid(),
+                    "tid": record["thread"],
+                    "args": args,
+                }
+            )
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return path
+
+
+# Shared by every instrumented module
+PROFILER = StageProfiler()
+
+
+# Short description of the dataset item (or file) a call works on
+def describe_call(args, kwargs):
+    values = list(args) + list(kwargs.values())
+    for value in values:
+        if isinstance(value, dict) and "speaker" in value:
+            return " ".join(
+                str(value[field]) for field in ITEM_FIELDS if field in value
+            )
+    for value in values:
+        if isinstance(value, (str, Path)):
+            return str(value)
+    # Methods of AudioAnalysis work on the clip the object was created for
+    if values and getattr(values[0], "audio_file_path", None) is not None:
+        return str(values[0].audio_file_path)
+    return None
+
+
+# Decorator recording every call of a pipeline function as a span named
+# "<module>.<function>", with the item it processed when there is one
+def profiled(function):
+    module_name = function.__module__
+    name = f"{module_name}.{function.__qualname__}"
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not PROFILER.enabled:
+            return function(*args, **kwargs)
+        item = describe_call(args, kwargs)
+        span_args = {} if item is None else {"item": item}
+        with PROFILER.span(name, module_name, **span_args):
+            return function(*args, **kwargs)
+
+    return wrapper
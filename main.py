@@ -1,39 +1,630 @@
+import time
+
+# Taken before anything else is imported, for the startup time report
+START_TIME = time.perf_counter()
+
 from pathlib import Path
+import argparse
+import importlib
+import os
+import sys
 
-import audio_processing
-import plot_spectraltilt
-import plot_vowel_plots
+# Heavy modules (pydub, pandas, matplotlib, seaborn, scipy, opensmile) are only
+# imported by the subcommands that need them, see import_stage_modules
 
 # File paths
 DATASET_FILE_PATH = Path("./test_dataset.csv")
 ORIGINAL_AUDIO_DIR = Path("./original_audio")
+SUMMARY_FILES_DIR = Path("./summaries")
+SHARD_FILES_DIR = Path("./shards")
+
+# Clips are analysed in memory, set to True to also write them to audio_files/
+EXPORT_CLIPS = False
+
+# Extracted features are cached on disk, run `python feature_cache.py clear` to reset
+USE_FEATURE_CACHE = True
+
+# Only rebuild items and plots whose annotations or recordings changed since the
+# last run (needs the feature cache), delete build_manifest.json to force a rebuild
+INCREMENTAL = True
+
+# Number of processes used for feature extraction, 1 runs everything serially.
+# Defaults to every core, so `summarize` only streams its clips (see can_stream)
+# when asked for --workers 1 explicitly.
+WORKERS = os.cpu_count() or 1
+
+# Run OpenSMILE once per source recording and slice every clip's frames out of it
+WHOLE_RECORDING = False
+
+# Clips cut ahead of the extraction by reader threads (with one worker), 0 disables
+PREFETCH_DEPTH = 0
+READER_THREADS = 1
+
+# Hot vs neutral statistics: resamples per test, interval coverage and seed
+RESAMPLES = 10000
+CONFIDENCE = 0.95
+RANDOM_SEED = 0
+
+# Seconds spent importing each stage module, filled in by import_stage_modules
+IMPORT_TIMES = {}
+
+
+# Imports the modules a stage needs and records how long each import took
+def import_stage_modules(*module_names):
+    modules = []
+    for module_name in module_names:
+        import_start = time.perf_counter()
+        modules.append(importlib.import_module(module_name))
+        IMPORT_TIMES.setdefault(module_name, time.perf_counter() - import_start)
+    return modules if len(modules) > 1 else modules[0]
+
+
+def report_startup_time(cli_ready_time):
+    startup = cli_ready_time - START_TIME
+    print(f"startup: {startup * 1000:.0f} ms until the CLI was ready", file=sys.stderr)
+    for module_name, seconds in IMPORT_TIMES.items():
+        print(f"import {module_name}: {seconds * 1000:.0f} ms", file=sys.stderr)
+    total = sum(IMPORT_TIMES.values())
+    print(f"stage imports total: {total * 1000:.0f} ms", file=sys.stderr)
+
+
+def get_manifest(args):
+    if not (args.incremental and args.feature_cache):
+        return None
+    Manifest = import_stage_modules("manifest").Manifest
+    return Manifest()
+
+
+def build_datasets(args, manifest, vowels=True, frics=True):
+    audio_processing, corpus, feature_cache = import_stage_modules(
+        "audio_processing", "corpus", "feature_cache"
+    )
+    features = feature_cache.FeatureCache() if args.feature_cache else None
+    # Every {speaker}_{condition}.wav with its TextGrids, found once for both datasets
+    recordings = corpus.Corpus.discover(ORIGINAL_AUDIO_DIR)
+    kwargs = dict(
+        in_memory=True,
+        export_clips=args.export_clips,
+        feature_cache=features,
+        workers=args.workers,
+        manifest=manifest,
+        whole_recording=args.whole_recording,
+        feature_columns=args.columns,
+        functionals=getattr(args, "functionals", False),
+        corpus=recordings,
+        prefetch_depth=args.prefetch,
+        reader_threads=args.reader_threads,
+    )
 
+    full_vowel_dataset = []
+    full_fric_dataset = []
+    if vowels:
+        full_vowel_dataset = audio_processing.get_all_vowel_data(**kwargs)
+    if frics:
+        full_fric_dataset = audio_processing.get_all_the_fric_data(**kwargs)
+    if args.prefetch > 0:
+        # Readers stalling means extraction is the bottleneck, and vice versa
+        import_stage_modules("prefetch").PREFETCH_STATS.print_summary()
+    return full_vowel_dataset, full_fric_dataset
 
-# Hardcoded convenience
-SPEAKER_NAMES = {"KS": "Kayla", "SD": "Samuele", "SL": "Stella"}
 
+# Extract (or load from the cache) the features of every vowel and fricative
+def extract(args):
+    manifest = get_manifest(args)
+    full_vowel_dataset, full_fric_dataset = build_datasets(args, manifest)
+    print(
+        f"Extracted {len(full_vowel_dataset)} vowel and "
+        f"{len(full_fric_dataset)} fricative clips"
+    )
+    if manifest is not None:
+        manifest.save(prune=True)
 
-# Split up data by speaker for easier analysis
-def split_dataset_by_speaker(full_dataset):
-    datasets = {
-        speaker: [item for item in full_dataset if item["speaker"] == speaker]
-        for speaker in ["KS", "SD", "SL"]
+
+# Per-clip summaries of both datasets, with the fricative spectral measures
+def get_summary_tables(
+    vowel_dataset, vowel_store, fric_dataset, fric_store, functionals=False
+):
+    spectral_analysis = import_stage_modules("spectral_analysis")
+    summaries = {}
+    for name, dataset, store, extra_columns in [
+        ("vowels", vowel_dataset, vowel_store, []),
+        ("frics", fric_dataset, fric_store, spectral_analysis.SPECTRAL_FEATURES),
+    ]:
+        summary = store.clip_table() if functionals else store.summarize()
+        for column in extra_columns:
+            summary[column] = [item[column] for item in dataset]
+        summaries[name] = summary
+    return summaries
+
+
+# Writes the summaries as summary_vowels.csv and summary_frics.csv in output_dir
+def write_summaries(
+    output_dir, vowel_dataset, vowel_store, fric_dataset, fric_store, functionals=False
+):
+    write_summary_tables(
+        output_dir,
+        get_summary_tables(
+            vowel_dataset, vowel_store, fric_dataset, fric_store, functionals
+        ),
+    )
+
+
+def write_summary_tables(output_dir, summaries):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for name, summary in summaries.items():
+        summary_path = output_dir / f"summary_{name}.csv"
+        summary.to_csv(summary_path, index=False)
+        print(f"Wrote {len(summary)} clip summaries to {summary_path}")
+
+
+# A serial run cuts and extracts one clip after the other anyway, so it can go
+# through the streaming pipeline and only hold a batch of clips at a time. The
+# streaming pipeline cuts every clip and keeps no manifest, so an incremental
+# run (the default with the feature cache) builds the datasets instead.
+def can_stream(args):
+    return (
+        args.workers == 1
+        and not args.whole_recording
+        and args.prefetch == 0
+        and get_manifest(args) is None
+    )
+
+
+# Per-clip summaries of both datasets from the streaming pipeline, like
+# get_summary_tables but without ever building the full datasets
+def stream_summary_tables(args):
+    audio_processing, corpus, feature_cache = import_stage_modules(
+        "audio_processing", "corpus", "feature_cache"
+    )
+    plot_spectraltilt, spectral_analysis = import_stage_modules(
+        "plot_spectraltilt", "spectral_analysis"
+    )
+    kwargs = dict(
+        export_clips=args.export_clips,
+        feature_cache=feature_cache.FeatureCache() if args.feature_cache else None,
+        feature_columns=args.columns,
+        functionals=args.functionals,
+        corpus=corpus.Corpus.discover(ORIGINAL_AUDIO_DIR),
+    )
+
+    # Spectral measures of each fricative while its clip is still on the item,
+    # the clip is dropped before the item waits for its summary batch
+    def add_spectral_features(items):
+        for item in items:
+            plot_spectraltilt.add_spectral_features([item])
+            del item["audioclip"]
+            yield item
+
+    fric_items = add_spectral_features(
+        audio_processing.stream_fric_data(summarize=False, keep_clips=True, **kwargs)
+    )
+    return {
+        "vowels": audio_processing.get_summary_table(
+            audio_processing.stream_vowel_data(**kwargs)
+        ),
+        "frics": audio_processing.get_summary_table(
+            audio_processing.stream_summaries(fric_items, functionals=args.functionals),
+            spectral_analysis.SPECTRAL_FEATURES,
+        ),
     }
-    return datasets["KS"], datasets["SD"], datasets["SL"]
 
 
-full_vowel_dataset = audio_processing.get_all_vowel_data()
-dataset_vowels_KS, dataset_vowels_SD, dataset_vowels_SL = split_dataset_by_speaker(
-    full_vowel_dataset
-)
+# Write per-clip summaries of every feature (and the fricative spectral measures),
+# with --functionals as computed by OpenSMILE instead of from the LLD frames
+def summarize(args):
+    if can_stream(args):
+        write_summary_tables(args.output_dir, stream_summary_tables(args))
+        return
+
+    manifest = get_manifest(args)
+    full_vowel_dataset, full_fric_dataset = build_datasets(args, manifest)
+    FeatureStore = import_stage_modules("feature_store").FeatureStore
+    plot_spectraltilt = import_stage_modules("plot_spectraltilt")
+
+    # Spectral tilt and moments of every fricative, as per-item features
+    plot_spectraltilt.add_spectral_features(full_fric_dataset)
+
+    write_summaries(
+        args.output_dir,
+        full_vowel_dataset,
+        FeatureStore.from_dataset(full_vowel_dataset, release_features=True),
+        full_fric_dataset,
+        FeatureStore.from_dataset(full_fric_dataset, release_features=True),
+        args.functionals,
+    )
+
+    if manifest is not None:
+        manifest.save(prune=True)
+
+
+# Hot vs neutral permutation tests and bootstrap intervals of every summarized
+# feature, per speaker and per vowel or fricative
+def stats(args):
+    manifest = get_manifest(args)
+    full_vowel_dataset, full_fric_dataset = build_datasets(args, manifest)
+    FeatureStore = import_stage_modules("feature_store").FeatureStore
+    hotneutral_stats, plot_spectraltilt = import_stage_modules(
+        "hotneutral_stats", "plot_spectraltilt"
+    )
+
+    # Spectral tilt and moments of every fricative, as per-item features
+    plot_spectraltilt.add_spectral_features(full_fric_dataset)
+
+    summaries = get_summary_tables(
+        full_vowel_dataset,
+        FeatureStore.from_dataset(full_vowel_dataset, release_features=True),
+        full_fric_dataset,
+        FeatureStore.from_dataset(full_fric_dataset, release_features=True),
+        args.functionals,
+    )
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    for name, segment in [("vowels", "vowel"), ("frics", "fricative")]:
+        for by in ["speaker", segment]:
+            results = hotneutral_stats.compare_hot_neutral(
+                summaries[name],
+                by,
+                resamples=args.resamples,
+                confidence=args.confidence,
+                seed=args.seed,
+            )
+            stats_path = args.output_dir / f"stats_{name}_by_{by}.csv"
+            results.to_csv(stats_path, index=False)
+            print(f"Wrote {len(results)} hot vs neutral comparisons to {stats_path}")
+
+    if manifest is not None:
+        manifest.save(prune=True)
+
+
+# Jitter and shimmer plots of the vowels
+def plot_vowels(args):
+    manifest = get_manifest(args)
+    full_vowel_dataset, _ = build_datasets(args, manifest, frics=False)
+    FeatureStore = import_stage_modules("feature_store").FeatureStore
+    ItemIndex = import_stage_modules("corpus").ItemIndex
+    plot_vowel_plots = import_stage_modules("plot_vowel_plots")
+
+    # The store becomes the only copy of the vowel frames
+    vowel_store = FeatureStore.from_dataset(full_vowel_dataset, release_features=True)
+
+    plot_vowel_plots.plot_vowel_measures(
+        full_vowel_dataset,
+        vowel_store,
+        manifest,
+        args.workers,
+        ItemIndex(full_vowel_dataset),
+    )
+
+    if manifest is not None:
+        manifest.save()
+
+
+# Spectral tilt plots of the fricatives
+def plot_tilt(args):
+    manifest = get_manifest(args)
+    _, full_fric_dataset = build_datasets(args, manifest, vowels=False)
+    ItemIndex = import_stage_modules("corpus").ItemIndex
+    plot_spectraltilt = import_stage_modules("plot_spectraltilt")
+
+    plot_spectraltilt.plot_spectraltilt(
+        full_fric_dataset,
+        manifest,
+        workers=args.workers,
+        index=ItemIndex(full_fric_dataset),
+    )
+
+    if manifest is not None:
+        manifest.save()
+
+
+# Every changed vowel and tilt plot as one job, to render them all on the same pool.
+# Each dataset is indexed once, the plots group its items through the index.
+def get_plot_jobs(vowel_dataset, vowel_store, fric_dataset, manifest=None):
+    ItemIndex = import_stage_modules("corpus").ItemIndex
+    plot_spectraltilt, plot_vowel_plots = import_stage_modules(
+        "plot_spectraltilt", "plot_vowel_plots"
+    )
+    return plot_vowel_plots.get_vowel_plot_jobs(
+        vowel_dataset, vowel_store, manifest, index=ItemIndex(vowel_dataset)
+    ) + plot_spectraltilt.get_spectraltilt_plot_jobs(
+        fric_dataset, manifest, index=ItemIndex(fric_dataset)
+    )
+
+
+# The whole pipeline, what running main.py without a subcommand does
+def run_all(args):
+    manifest = get_manifest(args)
+    full_vowel_dataset, full_fric_dataset = build_datasets(args, manifest)
+    FeatureStore = import_stage_modules("feature_store").FeatureStore
+    plot_rendering, plot_spectraltilt = import_stage_modules(
+        "plot_rendering", "plot_spectraltilt"
+    )
+
+    # Spectral tilt and moments of every fricative, as per-item features
+    plot_spectraltilt.add_spectral_features(full_fric_dataset)
+
+    # The store becomes the only copy of the vowel frames
+    vowel_store = FeatureStore.from_dataset(full_vowel_dataset, release_features=True)
+
+    plot_jobs = get_plot_jobs(
+        full_vowel_dataset, vowel_store, full_fric_dataset, manifest
+    )
+    plot_rendering.render_plots(plot_jobs, manifest, args.workers)
+
+    if manifest is not None:
+        manifest.save(prune=True)
+
+
+def get_shard_options(args):
+    audio_processing, feature_cache = import_stage_modules(
+        "audio_processing", "feature_cache"
+    )
+    return dict(
+        feature_cache=feature_cache.FeatureCache() if args.feature_cache else None,
+        export_clips=args.export_clips,
+        whole_recording=args.whole_recording,
+        analysis_options=audio_processing.get_analysis_options(args.columns),
+    )
+
+
+# Extract and summarize one shard of the recordings, e.g. on one node of a cluster
+def shard(args):
+    sharding = import_stage_modules("sharding")
+    shard_path = sharding.run_shard(
+        args.index, args.count, args.shard_dir, **get_shard_options(args)
+    )
+    print(f"Wrote shard {args.index} of {args.count} to {shard_path}")
+
+
+# Summaries and plots of the merged shards, the same as those of a single-node run
+def write_merged_outputs(args, datasets):
+    plot_rendering = import_stage_modules("plot_rendering")
+    vowel_dataset, vowel_store = datasets["vowels"]
+    fric_dataset, fric_store = datasets["frics"]
+    write_summaries(
+        args.output_dir, vowel_dataset, vowel_store, fric_dataset, fric_store
+    )
+    # Shards have no manifest, every plot is drawn again
+    plot_jobs = get_plot_jobs(vowel_dataset, vowel_store, fric_dataset)
+    plot_rendering.render_plots(plot_jobs, workers=args.workers)
+
+
+# Merge the partial results of every shard once they are all written
+def merge(args):
+    sharding = import_stage_modules("sharding")
+    write_merged_outputs(args, sharding.merge_shards(args.count, args.shard_dir))
+
+
+# Every shard in its own local process, then the merge, to test a sharded run
+def run_sharded(args):
+    sharding = import_stage_modules("sharding")
+    datasets = sharding.run_local_shards(
+        args.count, args.processes, args.shard_dir, **get_shard_options(args)
+    )
+    write_merged_outputs(args, datasets)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Hot vs neutral room speech analysis. Without a subcommand the "
+        "whole pipeline runs."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKERS,
+        help="processes used for feature extraction (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--export-clips",
+        action="store_true",
+        default=EXPORT_CLIPS,
+        help="also write every clip to audio_files/",
+    )
+    parser.add_argument(
+        "--no-feature-cache",
+        dest="feature_cache",
+        action="store_false",
+        default=USE_FEATURE_CACHE,
+        help="always extract features instead of using ./feature_cache",
+    )
+    parser.add_argument(
+        "--full-rebuild",
+        dest="incremental",
+        action="store_false",
+        default=INCREMENTAL,
+        help="rebuild every item and plot, ignoring build_manifest.json",
+    )
+    parser.add_argument(
+        "--whole-recording",
+        action="store_true",
+        default=WHOLE_RECORDING,
+        help="extract each source recording once and slice the clips' frames out "
+        "of it, instead of extracting every clip on its own",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=PREFETCH_DEPTH,
+        metavar="DEPTH",
+        help="cut up to DEPTH clips ahead of the feature extraction on reader "
+        "threads and report where either side stalled, needs --workers 1 and "
+        "per-clip extraction (default: %(default)s, off)",
+    )
+    parser.add_argument(
+        "--reader-threads",
+        type=int,
+        default=READER_THREADS,
+        help="threads cutting clips with --prefetch (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--columns",
+        type=lambda value: value.split(","),
+        metavar="NAME[,NAME...]",
+        help="only keep these descriptors of every clip, e.g. "
+        "jitterLocal_sma3nz,shimmerLocaldB_sma3nz (default: all of them)",
+    )
+    parser.add_argument(
+        "--timing",
+        action="store_true",
+        help="report startup and per-module import times on stderr "
+        "(use `python -X importtime main.py` for a full breakdown)",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="pipeline_trace.json",
+        type=Path,
+        metavar="TRACE_PATH",
+        help="record time and peak memory of every pipeline stage, print a summary "
+        "and write a Chrome trace (default: %(const)s). Calls in worker processes "
+        "are not recorded, add --workers 1 to see every item",
+    )
+    parser.set_defaults(func=run_all)
+
+    subparsers = parser.add_subparsers(title="subcommands")
+    subparsers.add_parser(
+        "extract", help="extract the features of every clip into the cache"
+    ).set_defaults(func=extract)
+    summarize_parser = subparsers.add_parser(
+        "summarize",
+        help="write per-clip feature summaries as CSV. With --workers 1 and "
+        "--full-rebuild (or --no-feature-cache) the clips are streamed and only a "
+        "batch of them is held in memory, by default every core extracts features "
+        "and the full datasets are built",
+    )
+    summarize_parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=SUMMARY_FILES_DIR,
+        help="where the summaries are written (default: %(default)s)",
+    )
+    summarize_parser.add_argument(
+        "--functionals",
+        action="store_true",
+        help="let OpenSMILE compute one row of eGeMAPS functionals per clip "
+        "instead of summarizing the LLD frames",
+    )
+    summarize_parser.set_defaults(func=summarize)
+    stats_parser = subparsers.add_parser(
+        "stats",
+        help="test the hot vs neutral difference of every summarized feature, per "
+        "speaker and per vowel or fricative, and write the results as CSV",
+    )
+    stats_parser.add_argument(
+        "--output-dir",
+        type=Path,
+        default=SUMMARY_FILES_DIR,
+        help="where the results are written (default: %(default)s)",
+    )
+    stats_parser.add_argument(
+        "--functionals",
+        action="store_true",
+        help="test the eGeMAPS functionals of every clip instead of the "
+        "summaries of its LLD frames",
+    )
+    stats_parser.add_argument(
+        "--resamples",
+        type=int,
+        default=RESAMPLES,
+        help="permutations and bootstrap samples per group (default: %(default)s)",
+    )
+    stats_parser.add_argument(
+        "--confidence",
+        type=float,
+        default=CONFIDENCE,
+        help="coverage of the bootstrap intervals (default: %(default)s)",
+    )
+    stats_parser.add_argument(
+        "--seed",
+        type=int,
+        default=RANDOM_SEED,
+        help="seed of the resampling (default: %(default)s)",
+    )
+    stats_parser.set_defaults(func=stats)
+    subparsers.add_parser(
+        "plot-vowels", help="draw the jitter and shimmer plots"
+    ).set_defaults(func=plot_vowels)
+    subparsers.add_parser(
+        "plot-tilt", help="draw the fricative spectral tilt plots"
+    ).set_defaults(func=plot_tilt)
+
+    # Sharded runs: `shard` on every node, then `merge` once all shards are written
+    shard_parser = subparsers.add_parser(
+        "shard", help="extract and summarize one shard of the recordings"
+    )
+    shard_parser.add_argument(
+        "--index", type=int, required=True, help="this shard, from 0 to COUNT - 1"
+    )
+    merge_parser = subparsers.add_parser(
+        "merge", help="write the summaries and plots of all shards"
+    )
+    run_sharded_parser = subparsers.add_parser(
+        "run-sharded",
+        help="run every shard in a local process and merge them, like a "
+        "multi-node run",
+    )
+    run_sharded_parser.add_argument(
+        "--processes",
+        type=int,
+        help="shards run at once (default: one process per shard)",
+    )
+    for sharded_parser, func in [
+        (shard_parser, shard),
+        (merge_parser, merge),
+        (run_sharded_parser, run_sharded),
+    ]:
+        sharded_parser.add_argument(
+            "--count", type=int, required=True, help="number of shards"
+        )
+        sharded_parser.add_argument(
+            "--shard-dir",
+            type=Path,
+            default=SHARD_FILES_DIR,
+            help="where the shards' partial results are (default: %(default)s)",
+        )
+        if sharded_parser is not shard_parser:
+            sharded_parser.add_argument(
+                "--output-dir",
+                type=Path,
+                default=SUMMARY_FILES_DIR,
+                help="where the summaries are written (default: %(default)s)",
+            )
+        sharded_parser.set_defaults(func=func)
+    return parser
 
-full_fric_dataset = audio_processing.get_all_the_fric_data()
-dataset_frics_KS, dataset_frics_SD, dataset_frics_SL = split_dataset_by_speaker(
-    full_fric_dataset
-)
 
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = get_parser()
+    try:
+        args = parser.parse_args(argv)
+        if getattr(args, "functionals", False) and args.whole_recording:
+            parser.error("--functionals cannot be sliced out of whole recordings")
+        if args.prefetch > 0 and (args.workers > 1 or args.whole_recording):
+            parser.error("--prefetch needs --workers 1 and no --whole-recording")
+    except SystemExit:
+        # --help and usage errors exit inside argparse, before args exist
+        if "--timing" in argv:
+            report_startup_time(time.perf_counter())
+        raise
+    cli_ready_time = time.perf_counter()
+    if args.profile is not None:
+        PROFILER = import_stage_modules("instrumentation").PROFILER
+        PROFILER.enable()
+    try:
+        args.func(args)
+    finally:
+        if args.timing:
+            report_startup_time(cli_ready_time)
+        if args.profile is not None:
+            PROFILER.disable()
+            PROFILER.print_summary()
+            print(
+                f"trace: {PROFILER.write_chrome_trace(args.profile)}", file=sys.stderr
+            )
 
-plot_vowel_plots.plot_jitter(full_vowel_dataset)
-plot_vowel_plots.plot_shimmer(full_vowel_dataset)
 
-plot_spectraltilt.plot_spectraltilt()
+# Guarded so the worker processes can import this module without rerunning it
+if __name__ == "__main__":
+    main()
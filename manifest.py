@@ -0,0 +1,135 @@
+from pathlib import Path
+import hashlib
+import json
+import os
+
+
+# Default location of the build manifest
+MANIFEST_PATH = Path("./build_manifest.json")
+
+# Bump when fingerprints change meaning so old manifests rebuild everything
+MANIFEST_VERSION = 1
+
+# Dataset fields that come from the annotations, everything else is derived
+ANNOTATION_FIELDS = [
+    "speaker",
+    "hotneutral",
+    "start",
+    "end",
+    "word",
+    "vowel",
+    "fricative",
+    "slice",
+    "long/short",
+]
+
+
+class Manifest:
+    """
+    Records what every annotation and plot was built from, for incremental reruns.
+
+    Each CSV row or TextGrid interval gets a fingerprint covering its annotation
+    fields, its clip type and the SHA-256 of its source WAV. The manifest maps the
+    fingerprint to the outputs the item produced (its feature cache key and the
+    exported clip, if any). Plots are recorded with a hash of the fingerprints of
+    the items they were drawn from, so a plot is only redrawn when one of its
+    inputs changed.
+
+    Parameters
+    ----------
+    path : str or Path, optional
+        Where the manifest is stored, by default ``./build_manifest.json``.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = Path(path)
+        self.sources = {}
+        self.items = {}
+        self.plots = {}
+        self._seen_items = set()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if data.get("version") != MANIFEST_VERSION:
+            return
+        self.sources = data.get("sources", {})
+        self.items = data.get("items", {})
+        self.plots = data.get("plots", {})
+
+    def save(self, prune=False):
+        """
+        Writes the manifest. With `prune`, items not seen in this run are dropped.
+        """
+        if prune and self._seen_items:
+            self.items = {
+                fingerprint: outputs
+                for fingerprint, outputs in self.items.items()
+                if fingerprint in self._seen_items
+            }
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": MANIFEST_VERSION,
+                    "sources": self.sources,
+                    "items": self.items,
+                    "plots": self.plots,
+                },
+                f,
+                indent=1,
+                sort_keys=True,
+            )
+        os.replace(tmp_path, self.path)
+
+    def fingerprint_item(self, item, clip_type, source_hash, variant=None):
+        """
+        Fingerprint of one annotation, stored on the item as ``fingerprint``.
+
+        `variant` tells apart features computed another way than all LLD frames of
+        the clip on its own, e.g. ``{"frames": "recording"}`` for frames sliced out
+        of the whole recording or ``{"columns": [...]}`` for a projection.
+        """
+        annotation = {
+            field: str(item[field]) for field in ANNOTATION_FIELDS if field in item
+        }
+        parts = [clip_type, source_hash, annotation]
+        if variant is not None:
+            parts.append(variant)
+        payload = json.dumps(parts, sort_keys=True)
+        fingerprint = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        item["fingerprint"] = fingerprint
+        self._seen_items.add(fingerprint)
+        return fingerprint
+
+    def record_source(self, source_path, source_hash):
+        self.sources[str(source_path)] = source_hash
+
+    def item_outputs(self, fingerprint):
+        """
+        Returns the outputs recorded for a fingerprint, or None if it is new.
+        """
+        return self.items.get(fingerprint)
+
+    def record_item(self, fingerprint, outputs):
+        self.items[fingerprint] = outputs
+
+    @staticmethod
+    def _inputs_hash(fingerprints):
+        payload = "\n".join(sorted(fingerprints))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def plot_is_current(self, plot_path, fingerprints):
+        """
+        True if `plot_path` exists and was drawn from exactly these items.
+        """
+        return os.path.exists(plot_path) and self.plots.get(
+            str(plot_path)
+        ) == self._inputs_hash(fingerprints)
+
+    def record_plot(self, plot_path, fingerprints):
+        self.plots[str(plot_path)] = self._inputs_hash(fingerprints)
@@ -0,0 +1,95 @@
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from instrumentation import profiled
+
+
+# Full names of the speakers of the study, other speakers are shown by their code
+SPEAKER_LABELS = {"KS": "KS (ENG)", "SD": "SD (IT)", "SL": "SL (SWE)"}
+
+
+def get_speaker_label(speaker):
+    return SPEAKER_LABELS.get(speaker, speaker)
+
+
+# Style of every value, e.g. a marker per speaker: values in `fixed` keep theirs,
+# the others cycle through `styles` in the order they are given
+def assign_styles(values, styles, fixed=None):
+    fixed = fixed or {}
+    assigned = {}
+    others = 0
+    for value in values:
+        if value in fixed:
+            assigned[value] = fixed[value]
+        else:
+            assigned[value] = styles[others % len(styles)]
+            others += 1
+    return assigned
+
+
+class PlotJob:
+    """
+    One plot to render, small enough to be sent to a worker process.
+
+    `draw(figure, *args)` fills in a fresh Figure, which is then saved to
+    `path`. Jobs carry the plotted values rather than the dataset, so the
+    clips and feature frames never have to be pickled.
+
+    Parameters
+    ----------
+    path : str
+        Where the plot is saved.
+    draw : callable
+        A module-level function drawing onto the figure.
+    args : tuple
+        Extra arguments of `draw`.
+    figsize : tuple of float
+        Size of the figure in inches.
+    fingerprints : list of str, optional
+        Fingerprints of the dataset items the plot is drawn from, recorded in
+        the manifest once the plot is saved.
+    """
+
+    def __init__(self, path, draw, args, figsize, fingerprints=None):
+        self.path = path
+        self.draw = draw
+        self.args = args
+        self.figsize = figsize
+        self.fingerprints = fingerprints
+
+
+# A Figure on the Agg canvas, outside of pyplot. Nothing but the caller refers
+# to it, so it is freed as soon as it has been saved
+def new_figure(figsize):
+    figure = Figure(figsize=figsize)
+    FigureCanvasAgg(figure)
+    return figure
+
+
+@profiled
+def render_plot(job):
+    figure = new_figure(job.figsize)
+    job.draw(figure, *job.args)
+    os.makedirs(os.path.dirname(job.path) or ".", exist_ok=True)
+    figure.savefig(job.path)
+    return job.path
+
+
+# Renders every job, one per plot, on a process pool when workers > 1. Callers
+# only hand in the plots whose inputs changed, and with a manifest each saved
+# plot is recorded so it is not redrawn next time.
+@profiled
+def render_plots(jobs, manifest=None, workers=1):
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            paths = list(executor.map(render_plot, jobs))
+    else:
+        paths = [render_plot(job) for job in jobs]
+
+    if manifest is not None:
+        for job in jobs:
+            manifest.record_plot(job.path, job.fingerprints)
+    return paths
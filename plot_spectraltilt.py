@@ -1,18 +1,32 @@
 from pathlib import Path
+import hashlib
 import os
 
-from scipy.io import wavfile
-from scipy.signal import periodogram
-from scipy.stats import linregress
-from scipy.interpolate import interp1d
 import numpy as np
 
-import pandas as pd
-import matplotlib.pyplot as plt
+from pydub import AudioSegment
+
+from audio_processing import audio_segment_samples, get_item_clips
+from corpus import ItemIndex
+from instrumentation import profiled
+from plot_rendering import (
+    PlotJob,
+    assign_styles,
+    get_speaker_label,
+    render_plot,
+    render_plots,
+)
+from spectral_analysis import (
+    PSD_CACHE,
+    PSD_NFFT,
+    SPECTRAL_FEATURES,
+    TILT_MIN_FREQ,
+    spectral_features_batch,
+)
+from wav_reader import WavReader
 
 
 PLOT_FILES_DIR = Path("./plots")
-PLOT_FILES_DIR.mkdir(exist_ok=True)
 
 
 obstruents = {
@@ -42,91 +56,295 @@ obstruents = {
     # },
 }
 
+# Line colour of every speaker and line style of every room, speakers and rooms
+# take them in alphabetical order
+SPEAKER_COLORS = ["#b22234", "#009246", "#FECC02", "#0072B2", "#6a3d9a", "#ff7f00"]
+CONDITION_LINESTYLES = ["-", "--", ":", "-."]
+
+
+# Function to load a WAV file and select only one channel if it's stereo.
+# With start/end (in seconds) only that range is read from disk
+@profiled
+def load_wav_channel(audio_path, channel=0, start=None, end=None):
+    reader = WavReader(audio_path)
+    try:
+        audio = reader.read(start, end)[:, channel]
+    finally:
+        reader.close()
+    return reader.sample_rate, audio.astype(np.float32)
+
+
+# Same as load_wav_channel, but for a clip that is already in memory
+def load_clip_channel(audio_clip, channel=0):
+    audio = audio_segment_samples(audio_clip)[:, channel]
+    return audio_clip.frame_rate, audio.astype(np.float32)
+
+
+# Loads channel 0 of a WAV path or of an in-memory clip
+def load_audio_channel(wav_path, channel=0):
+    if isinstance(wav_path, AudioSegment):
+        return load_clip_channel(wav_path, channel)
+    return load_wav_channel(wav_path, channel)
+
+
+# Every "<fricative>-<word>" label found in a fricative dataset, in dataset order
+def get_obstruent_labels(fric_dataset):
+    return list(
+        dict.fromkeys(f"{item['fricative']}-{item['word']}" for item in fric_dataset)
+    )
+
+
+# Build the obstruents mapping from the index of a processed fricative dataset,
+# mapping each label to the dataset item its clip comes from. Every speaker and
+# room of the dataset gets a line, in alphabetical order.
+def get_obstruents_from_dataset(fric_dataset, obstruent_labels=None, index=None):
+    if obstruent_labels is None:
+        obstruent_labels = list(obstruents)
+    if index is None:
+        index = ItemIndex(fric_dataset)
+    speakers = sorted(index.values("speaker"))
+    conditions = sorted(index.values("hotneutral"))
+
+    obstruent_items = {}
+    for obstruent_label in obstruent_labels:
+        fricative, word = obstruent_label.split("-", 1)
+        obstruent_items[obstruent_label] = {}
+        for speaker in speakers:
+            for hotneutral in conditions:
+                items = index.select(
+                    fricative=fricative,
+                    word=word,
+                    speaker=speaker,
+                    hotneutral=hotneutral,
+                )
+                # The last clip wins, like the exported files overwriting each other
+                if items:
+                    label = f"{get_speaker_label(speaker)} {hotneutral.capitalize()}"
+                    obstruent_items[obstruent_label][label] = items[-1]
+    return obstruent_items
+
+
+# (colour, line style) of every item's line, the same for a speaker and room in
+# every plot of the dataset's index
+def get_line_styles(index, items):
+    colors = assign_styles(sorted(index.values("speaker")), SPEAKER_COLORS)
+    linestyles = assign_styles(sorted(index.values("hotneutral")), CONDITION_LINESTYLES)
+    return [(colors[item["speaker"]], linestyles[item["hotneutral"]]) for item in items]
+
+
+# Key of an item's clip in the PSD cache
+def get_psd_cache_key(item):
+    if "fingerprint" in item:
+        return item["fingerprint"]
+    return (item["speaker"], item["hotneutral"], str(item["start"]), str(item["end"]))
+
+
+# (sample rate, PSD) of every item's clip from the shared cache, clips missing
+# from it are cut and transformed once
+def get_psd_entries(dataset, psd_cache=PSD_CACHE):
+    def load_signals(positions):
+        audio_clips = get_item_clips([dataset[position] for position in positions])
+        return [load_clip_channel(audio_clip) for audio_clip in audio_clips]
+
+    return psd_cache.get_many(
+        [get_psd_cache_key(item) for item in dataset], load_signals
+    )
+
+
+# Every spectral feature of every (sample rate, PSD) entry, one array per feature.
+# Clips with different sample rates live on different frequency grids.
+def get_spectral_features(entries, nfft=PSD_NFFT):
+    sample_rates = np.array([sample_rate for sample_rate, _ in entries])
+    features = {name: np.full(len(entries), np.nan) for name in SPECTRAL_FEATURES}
+    for sample_rate in np.unique(sample_rates):
+        positions = np.flatnonzero(sample_rates == sample_rate)
+        psd = np.stack([entries[position][1] for position in positions])
+        frequencies = np.fft.rfftfreq(nfft, d=1.0 / sample_rate)
+        batch_features = spectral_features_batch(frequencies, psd)
+        for name in SPECTRAL_FEATURES:
+            features[name][positions] = batch_features[name]
+    return features
+
+
+# Adds spectral tilt, centre of gravity, spread, skewness, kurtosis and peak
+# frequency to every item. PSDs come from the shared cache, so clips are only
+# cut and transformed once, and all measures are derived in one vectorized pass.
+@profiled
+def add_spectral_features(dataset, psd_cache=PSD_CACHE):
+    features = get_spectral_features(
+        get_psd_entries(dataset, psd_cache), psd_cache.nfft
+    )
+    for position, item in enumerate(dataset):
+        for name in SPECTRAL_FEATURES:
+            item[name] = features[name][position]
+    return dataset
+
+
+# Key of a WAV file's or an in-memory clip's PSD in the cache. A file gets a new
+# key when it is written again, a clip is known by its samples.
+def get_audio_psd_cache_key(wav_path):
+    if isinstance(wav_path, AudioSegment):
+        digest = hashlib.sha1(wav_path.raw_data).hexdigest()
+        return ("clip", digest, wav_path.frame_rate, wav_path.sample_width)
+    stat = os.stat(wav_path)
+    return ("file", os.path.abspath(wav_path), stat.st_mtime_ns, stat.st_size)
 
-# Function to load a WAV file and select only one channel if it's stereo
-def load_wav_channel(audio_path, channel=0):
-    sample_rate, audio = wavfile.read(audio_path)
-    if audio.ndim > 1:  
-        audio = audio[:, channel]
-    return sample_rate, audio.astype(np.float32)
 
+# Tilt line of every clip (WAV path or AudioSegment), fitted on its PSD from the
+# shared cache like the per-item features: (sample rate, slope, intercept)
+def get_tilt_lines(wav_paths, psd_cache=PSD_CACHE):
+    def load_signals(positions):
+        return [load_audio_channel(wav_paths[position]) for position in positions]
 
-# Calculate the spectral tilt
-def calculate_spectral_tilt(frequencies, psd):
-    # Remvoe 0 or neg values if they exist
-    valid_indices = (frequencies > 0) & (psd > 0)
-    
-    # Convert freqs to log scale
-    log_freq = np.log10(frequencies[valid_indices])
-    # Convert PSD values to log scale
-    log_psd = 10 * np.log10(psd[valid_indices])
-    
-    # Get slope and intercept
-    slope, intercept, _, _, _ = linregress(log_freq, log_psd)
-    return slope, intercept
+    entries = psd_cache.get_many(
+        [get_audio_psd_cache_key(wav_path) for wav_path in wav_paths], load_signals
+    )
+    features = get_spectral_features(entries, psd_cache.nfft)
+    return list(
+        zip(
+            [sample_rate for sample_rate, _ in entries],
+            features["spectraltilt"],
+            features["spectraltiltintercept"],
+        )
+    )
 
 
 # Sequence that calculates the spectral tilt and gets the necessary items for plotting
+@profiled
 def do_plot_calcs(wav_path):
-    # Fix audio for calculations
-    sample_rate, audio = load_wav_channel(wav_path)
-    
-    # Set lower bound for human auditory perception
-    min_freq = 20
-    # Set upper bound from Nyquist frequency
-    max_freq = sample_rate / 2
-    
-    # Calculate the psd using scipy
-    # Also returns sample frequencies used for calculating
-    frequencies, psd = periodogram(audio, fs=sample_rate)
-
-    # Returns numbers spaced evenly on a log scale based on freq bounds
-    freq_arr = np.logspace(np.log10(min_freq), np.log10(max_freq), num=1000)
-    
-    # Create interpolation function from scipy based on PSD freqs
-    interp_function = interp1d(frequencies, psd, bounds_error=False, fill_value="extrapolate")
-    # Map the interpolated PSD data to log points for the plot
-    psd_interp = interp_function(freq_arr)
-    
-    # Slope = signal power across freqs
-    slope, intercept = calculate_spectral_tilt(freq_arr, psd_interp)
-    
+    # Fix audio for calculations, the clip may already be in memory
+    [(sample_rate, slope, intercept)] = get_tilt_lines([wav_path])
+
+    # Returns numbers spaced evenly on a log scale from the lower bound to Nyquist
+    freq_arr = np.logspace(np.log10(TILT_MIN_FREQ), np.log10(sample_rate / 2), num=1000)
+
     return freq_arr, intercept, slope
 
 
-# Plot a single obstruent
-def plot_obstruent(obstruent_data, obstruent_label):
-    plt.figure(figsize=(14, 8))
-    colors = ["#b22234", "#009246", "#FECC02"]
-    styles = ["-", "--"]
+# Spectral tilt line of every clip (WAV path or AudioSegment) of one plot:
+# (label, sample rate, slope, intercept)
+def get_obstruent_lines(obstruent_data):
+    lines = get_tilt_lines(list(obstruent_data.values()))
+    return [(label, *line) for label, line in zip(obstruent_data, lines)]
+
+
+# Same for the dataset items of one plot. The lines are the items' spectraltilt
+# and spectraltiltintercept, taken from the cached PSDs if they are not set yet,
+# so a plot shows the same slopes as the summaries.
+def get_item_obstruent_lines(obstruent_items, psd_cache=PSD_CACHE):
+    items = list(obstruent_items.values())
+    missing = [item for item in items if "spectraltilt" not in item]
+    if missing:
+        add_spectral_features(missing, psd_cache)
+    entries = get_psd_entries(items, psd_cache)
+    return [
+        (label, sample_rate, item["spectraltilt"], item["spectraltiltintercept"])
+        for label, item, (sample_rate, _) in zip(obstruent_items, items, entries)
+    ]
 
-    # Do some calculations to get spectral tilt
-    for idx, (label, wav_path) in enumerate(obstruent_data.items()):
-        freq_arr, intercept, slope = do_plot_calcs(wav_path)
+
+# Draws the tilt lines of one obstruent onto a fresh figure, runs in the plot
+# workers. Without line styles, lines alternate between the rooms of one speaker.
+def draw_obstruent_plot(figure, obstruent_label, lines, line_styles=None):
+    ax = figure.subplots()
+    if line_styles is None:
+        line_styles = [
+            (
+                SPEAKER_COLORS[(idx // 2) % len(SPEAKER_COLORS)],
+                CONDITION_LINESTYLES[idx % 2],
+            )
+            for idx in range(len(lines))
+        ]
+
+    for (label, sample_rate, slope, intercept), (color, linestyle) in zip(
+        lines, line_styles
+    ):
+        freq_arr = np.logspace(
+            np.log10(TILT_MIN_FREQ), np.log10(sample_rate / 2), num=1000
+        )
 
         # Plot the regression line for spectral tilt
-        plt.plot(
+        ax.plot(
             freq_arr,
             intercept + slope * np.log10(freq_arr),
             label=f"{label} (Slope: {slope:.2f})",
-            color=colors[idx // 2],
-            linestyle=styles[idx % 2],
+            color=color,
+            linestyle=linestyle,
         )
 
-    plt.title(f"Spectral Tilt Comparison of /{obstruent_label.split("-")[0]}/ in '{obstruent_label.split("-")[1]}' between a Hot and Neutral Temperature Room")
-    plt.xlabel("Frequency [Hz]")
-    plt.ylabel("PSD [dB/Hz]")
-    plt.xscale("log")
-    plt.yscale("log")
-    plt.legend(loc='lower left', bbox_to_anchor=(0, 0))
-    plt.grid(True)
-    
+    ax.set_title(
+        f"Spectral Tilt Comparison of /{obstruent_label.split('-')[0]}/ in '{obstruent_label.split('-')[1]}' between a Hot and Neutral Temperature Room"
+    )
+    ax.set_xlabel("Frequency [Hz]")
+    ax.set_ylabel("PSD [dB/Hz]")
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.legend(loc="lower left", bbox_to_anchor=(0, 0))
+    ax.grid(True)
+
+
+# The job only carries the fitted lines, see get_obstruent_lines
+def get_obstruent_plot_job(obstruent_label, lines, fingerprints=None, line_styles=None):
+    return PlotJob(
+        get_plot_path(obstruent_label),
+        draw_obstruent_plot,
+        (obstruent_label, lines, line_styles),
+        (14, 8),
+        fingerprints,
+    )
+
+
+# Plot a single obstruent
+@profiled
+def plot_obstruent(obstruent_data, obstruent_label):
+    render_plot(
+        get_obstruent_plot_job(obstruent_label, get_obstruent_lines(obstruent_data))
+    )
+
+
+def get_plot_path(obstruent_label):
     filename = f"spectraltiltcomp_{obstruent_label}.png"
-    full_path = os.path.join(PLOT_FILES_DIR, filename)
-    plt.savefig(full_path)
-    
-    
-# Iterate over each obstruent and plot the results
-def plot_spectraltilt():
-    for obstruent_label, obstruent_data in obstruents.items():
-        plot_obstruent(obstruent_data, obstruent_label)
+    return os.path.join(PLOT_FILES_DIR, filename)
+
+
+# Jobs for the obstruent plots whose input clips changed
+def get_spectraltilt_plot_jobs(
+    fric_dataset=None, manifest=None, obstruent_labels=None, index=None
+):
+    if fric_dataset is None:
+        return [
+            get_obstruent_plot_job(obstruent_label, get_obstruent_lines(obstruent_data))
+            for obstruent_label, obstruent_data in obstruents.items()
+        ]
+
+    if index is None:
+        index = ItemIndex(fric_dataset)
+    jobs = []
+    for obstruent_label, obstruent_items in get_obstruents_from_dataset(
+        fric_dataset, obstruent_labels, index
+    ).items():
+        plot_path = get_plot_path(obstruent_label)
+        fingerprints = [item.get("fingerprint") for item in obstruent_items.values()]
+        if manifest is not None and manifest.plot_is_current(plot_path, fingerprints):
+            continue
+
+        jobs.append(
+            get_obstruent_plot_job(
+                obstruent_label,
+                get_item_obstruent_lines(obstruent_items),
+                fingerprints,
+                get_line_styles(index, obstruent_items.values()),
+            )
+        )
+    return jobs
+
+
+# Iterate over each obstruent and plot the results, one job per plot on `workers`
+# processes. With a manifest, only plots whose input clips changed are redrawn.
+# obstruent_labels picks the "<fricative>-<word>" plots, e.g. from get_obstruent_labels
+@profiled
+def plot_spectraltilt(
+    fric_dataset=None, manifest=None, obstruent_labels=None, workers=1, index=None
+):
+    jobs = get_spectraltilt_plot_jobs(fric_dataset, manifest, obstruent_labels, index)
+    render_plots(jobs, manifest, workers)
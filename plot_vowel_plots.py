@@ -1,25 +1,50 @@
 import pandas as pd
-import matplotlib.pyplot as plt
 import seaborn as sns
 
 from pathlib import Path
-from statistics import mean
 import os
 
+from corpus import ItemIndex
+from feature_store import FeatureStore
+from instrumentation import profiled
+from plot_rendering import (
+    PlotJob,
+    assign_styles,
+    get_speaker_label,
+    render_plot,
+    render_plots,
+)
+
 
 PLOT_FILES_DIR = Path("./plots")
-PLOT_FILES_DIR.mkdir(exist_ok=True)
 
+# Colours of the rooms, other conditions take the extra colours in turn
+CONDITION_COLORS = {"hot": "#D7191C", "neutral": "#0072B2"}
+EXTRA_CONDITION_COLORS = ["#009E73", "#E69F00", "#CC79A7", "#56B4E9", "#F0E442"]
 
-# Plot the data related to the vowels such as jimmer and shimmer
-def plot_vowel_data(measure_type, dataset):
-    df = pd.DataFrame(dataset)
+# Markers of the speakers, in alphabetical order of their codes
+SPEAKER_MARKERS = ["o", "s", "^", "D", "v", "P", "X", "*", "<", ">"]
 
-    # Replace the short speaker identifiers with the full ones
-    df["speaker"] = df["speaker"].replace(
-        {"KS": "KS (ENG)", "SD": "SD (IT)", "SL": "SL (SWE)"}
+# Titles of the legend sections, in place of the dataset field names
+LEGEND_TITLES = {"hotneutral": "Temperature", "speaker": "Speaker"}
+
+
+# Columns of the dataset the vowel plots are drawn from
+PLOT_COLUMNS = ["speaker", "hotneutral", "word", "vowel"]
+
+
+# Just the plotted columns of the dataset, ready for the x axis
+def get_vowel_plot_frame(measure_type, dataset):
+    df = pd.DataFrame(
+        {
+            column: [item[column] for item in dataset]
+            for column in PLOT_COLUMNS + [measure_type]
+        }
     )
 
+    # Replace the short speaker identifiers with the full ones
+    df["speaker"] = df["speaker"].map(get_speaker_label)
+
     # Sort the data for the x axis
     df["word_vowel"] = df["word"] + "__" + df["vowel"]
     df.sort_values(by=["vowel", "word"], inplace=True)
@@ -28,71 +53,142 @@ def plot_vowel_data(measure_type, dataset):
         categories=df["word_vowel"].unique(),
         ordered=True,
     )
+    return df
 
-    plt.figure(figsize=(12, 8))
-    hotneutral_palette = {"hot": "#D7191C", "neutral": "#0072B2"}
-    markers = {"KS (ENG)": "o", "SD (IT)": "s", "SL (SWE)": "^"}
+
+# Draws one vowel measure onto a fresh figure, runs in the plot workers. Speakers
+# and rooms are styled in alphabetical order, so every plot gets the same ones.
+def draw_vowel_plot(figure, measure_type, df, speakers, conditions):
+    ax = figure.subplots()
+    hotneutral_palette = assign_styles(
+        conditions, EXTRA_CONDITION_COLORS, CONDITION_COLORS
+    )
+    speaker_labels = [get_speaker_label(speaker) for speaker in speakers]
+    markers = assign_styles(speaker_labels, SPEAKER_MARKERS)
 
     sns.scatterplot(
         data=df,
         x="word_vowel",
         y=measure_type,
         hue="hotneutral",
+        hue_order=conditions,
         style="speaker",
+        style_order=speaker_labels,
         markers=markers,
         palette=hotneutral_palette,
         s=100,
+        ax=ax,
     )
 
-    plt.title(
+    ax.set_title(
         f"Mean {measure_type.capitalize()} for Each Speaker in a Hot vs Neutral Temperature Room"
     )
-    plt.ylabel(f"Mean {measure_type.capitalize()}")
-    plt.xlabel("")
-    plt.xticks(rotation=60)
-
-    handles, labels = plt.gca().get_legend_handles_labels()
-    new_labels = [
-        "Temperature",
-        "hot",
-        "neutral",
-        "Speaker",
-        "KS (ENG)",
-        "SD (IT)",
-        "SL (SWE)",
-    ]
-    new_handles = [handles[0]] + handles[1:3] + [handles[3]] + handles[4:]
-    plt.legend(new_handles, new_labels, loc="upper right", ncol=1)
-
-    plt.tight_layout()
+    ax.set_ylabel(f"Mean {measure_type.capitalize()}")
+    ax.set_xlabel("")
+    ax.tick_params(axis="x", labelrotation=60)
+
+    handles, labels = ax.get_legend_handles_labels()
+    new_labels = [LEGEND_TITLES.get(label, label) for label in labels]
+    ax.legend(handles, new_labels, loc="upper right", ncol=1)
+
+    figure.tight_layout()
+
+
+# The speakers and rooms come from the dataset's index, built if not given
+def get_vowel_plot_job(measure_type, dataset, index=None):
+    if index is None:
+        index = ItemIndex(dataset)
+    return PlotJob(
+        get_plot_path(measure_type),
+        draw_vowel_plot,
+        (
+            measure_type,
+            get_vowel_plot_frame(measure_type, dataset),
+            sorted(index.values("speaker")),
+            sorted(index.values("hotneutral")),
+        ),
+        (12, 8),
+        [item.get("fingerprint") for item in dataset],
+    )
+
 
+# Plot the data related to the vowels such as jimmer and shimmer
+@profiled
+def plot_vowel_data(measure_type, dataset):
+    render_plot(get_vowel_plot_job(measure_type, dataset))
+
+
+def get_plot_path(measure_type):
     filename = f"{measure_type}.png"
-    full_path = os.path.join(PLOT_FILES_DIR, filename)
-    plt.savefig(full_path)
+    return os.path.join(PLOT_FILES_DIR, filename)
 
 
-# Add the data values to the dataset for easy plotting
-def process_dataset(dataset, feature_data):
-    new_dataset = []
-    for i, datapoint in enumerate(dataset):
-        values = datapoint["analysisobj"].feature_data[feature_data].values
-        average_val = mean(values)
+# With a manifest, a plot whose input items are all unchanged is not redrawn
+def plot_is_current(measure_type, dataset, manifest):
+    if manifest is None:
+        return False
+    fingerprints = [item["fingerprint"] for item in dataset]
+    return manifest.plot_is_current(get_plot_path(measure_type), fingerprints)
 
-        if feature_data == "shimmerLocaldB_sma3nz":
-            datapoint["meanshimmer"] = average_val
-        elif feature_data == "jitterLocal_sma3nz":
-            datapoint["meanjitter"] = average_val
 
-        dataset[i] = datapoint
-        new_dataset.append(datapoint)
-    return new_dataset
+# Dataset keys the per-clip means are stored under
+MEASURE_KEYS = {
+    "jitterLocal_sma3nz": "meanjitter",
+    "shimmerLocaldB_sma3nz": "meanshimmer",
+}
+
 
+# Add the data values to the dataset for easy plotting
+@profiled
+def process_dataset(dataset, feature_data, store=None, statistic="mean"):
+    # Values come from the store's summary table, computed once for all columns
+    if store is None:
+        store = FeatureStore.from_dataset(dataset)
+    summary_values = store.summarize()[f"{feature_data}_{statistic}"].to_numpy()
+
+    if statistic == "mean" and feature_data in MEASURE_KEYS:
+        measure_key = MEASURE_KEYS[feature_data]
+    else:
+        measure_key = f"{statistic}_{feature_data}"
 
-def plot_jitter(dataset):
-    jitter_dataset = process_dataset(dataset, "jitterLocal_sma3nz")
-    plot_vowel_data("meanjitter", jitter_dataset)
+    new_dataset = []
+    for datapoint in dataset:
+        datapoint[measure_key] = summary_values[datapoint["clipindex"]]
+        new_dataset.append(datapoint)
+    return new_dataset
 
 
-def plot_shimmer(dataset):
-    shimmer_dataset = process_dataset(dataset, "shimmerLocaldB_sma3nz")
-    plot_vowel_data("meanshimmer", shimmer_dataset)
+# Jobs for the plots of the given measures whose inputs changed, the measure
+# values are only computed for those
+def get_vowel_plot_jobs(
+    dataset, store=None, manifest=None, measures=MEASURE_KEYS, index=None
+):
+    if index is None:
+        index = ItemIndex(dataset)
+    jobs = []
+    for feature_data in measures:
+        measure_type = MEASURE_KEYS[feature_data]
+        if plot_is_current(measure_type, dataset, manifest):
+            continue
+        measure_dataset = process_dataset(dataset, feature_data, store)
+        jobs.append(get_vowel_plot_job(measure_type, measure_dataset, index))
+    return jobs
+
+
+# Every vowel measure plot, one job per plot on `workers` processes
+@profiled
+def plot_vowel_measures(dataset, store=None, manifest=None, workers=1, index=None):
+    jobs = get_vowel_plot_jobs(dataset, store, manifest, index=index)
+    render_plots(jobs, manifest, workers)
+
+
+@profiled
+def plot_jitter(dataset, store=None, manifest=None):
+    jobs = get_vowel_plot_jobs(dataset, store, manifest, ["jitterLocal_sma3nz"])
+    render_plots(jobs, manifest)
+
+
+@profiled
+def plot_shimmer(dataset, store=None, manifest=None):
+    jobs = get_vowel_plot_jobs(dataset, store, manifest, ["shimmerLocaldB_sma3nz"])
+    render_plots(jobs, manifest)
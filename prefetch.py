@@ -0,0 +1,214 @@
+import queue
+import sys
+import threading
+import time
+
+
+# Seconds between checks of the stop flag while a reader waits on a full queue
+STOP_POLL_INTERVAL = 0.1
+
+# Queue entry of a reader that has no groups left
+_READER_DONE = object()
+
+
+class _ReaderError:
+    def __init__(self, error):
+        self.error = error
+
+
+class PrefetchStats:
+    """
+    Where a prefetching run spent its time, to tune the queue depth and readers.
+
+    Readers stall when the queue is full: the consumer is the bottleneck and a
+    deeper queue will not help. The consumer stalls when the queue is empty: the
+    readers are the bottleneck, so add reader threads (or depth, if their speed
+    varies a lot). Times add up over runs until `clear` is called.
+
+    Attributes
+    ----------
+    values : int
+        Number of values handed to the consumer.
+    read_s : float
+        Time the reader threads spent producing values, summed over threads.
+    read_stall_s : float
+        Time the reader threads waited for room in the queue, summed over threads.
+    consume_s : float
+        Time the consumer spent on the values between two reads of the queue.
+    consume_stall_s : float
+        Time the consumer waited for a value.
+    max_depth : int
+        Most values that were waiting in the queue at once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.values = 0
+            self.read_s = 0.0
+            self.read_stall_s = 0.0
+            self.consume_s = 0.0
+            self.consume_stall_s = 0.0
+            self.max_depth = 0
+
+    def add(self, values=0, max_depth=0, **seconds):
+        with self._lock:
+            self.values += values
+            self.max_depth = max(self.max_depth, max_depth)
+            for name, value in seconds.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def stats(self):
+        """
+        Returns the counters as a dict.
+        """
+        with self._lock:
+            return {
+                "values": self.values,
+                "read_s": self.read_s,
+                "read_stall_s": self.read_stall_s,
+                "consume_s": self.consume_s,
+                "consume_stall_s": self.consume_stall_s,
+                "max_depth": self.max_depth,
+            }
+
+    def print_summary(self, file=sys.stderr):
+        """
+        Prints the time of each side and how long it stalled on the other.
+        """
+        stats = self.stats()
+        print(
+            f"prefetch: {stats['values']} values, queue depth reached "
+            f"{stats['max_depth']}",
+            file=file,
+        )
+        print(
+            f"  readers:  {stats['read_s']:.3f} s busy, "
+            f"{stats['read_stall_s']:.3f} s stalled on a full queue",
+            file=file,
+        )
+        print(
+            f"  consumer: {stats['consume_s']:.3f} s busy, "
+            f"{stats['consume_stall_s']:.3f} s stalled on an empty queue",
+            file=file,
+        )
+
+
+# Shared by the prefetching dataset builders, see audio_processing
+PREFETCH_STATS = PrefetchStats()
+
+
+def _put(out_queue, value, stop, stats):
+    stall_start = time.perf_counter()
+    while not stop.is_set():
+        try:
+            out_queue.put(value, timeout=STOP_POLL_INTERVAL)
+            break
+        except queue.Full:
+            continue
+    stats.add(
+        read_stall_s=time.perf_counter() - stall_start, max_depth=out_queue.qsize()
+    )
+
+
+def _read_groups(next_group, produce, out_queue, stop, stats):
+    while not stop.is_set():
+        group = next_group()
+        if group is _READER_DONE:
+            break
+        try:
+            values = produce(group)
+            try:
+                while not stop.is_set():
+                    read_start = time.perf_counter()
+                    try:
+                        value = next(values)
+                    except StopIteration:
+                        break
+                    finally:
+                        stats.add(read_s=time.perf_counter() - read_start)
+                    _put(out_queue, value, stop, stats)
+            finally:
+                # Also when stopped early, so the group releases what it holds
+                values.close()
+        except Exception as error:
+            _put(out_queue, _ReaderError(error), stop, stats)
+            return
+    _put(out_queue, _READER_DONE, stop, stats)
+
+
+def prefetch(groups, produce, depth, threads=1, stats=PREFETCH_STATS):
+    """
+    Yields the values of ``produce(group)`` for every group, produced ahead on
+    reader threads while the caller works on the values already yielded.
+
+    Every group is read by one thread from start to end, so a group can hold state
+    such as an open recording. Values of one group come in order, values of
+    different groups are interleaved as the threads produce them. At most `depth`
+    values wait in the queue, which bounds the memory held by the readers.
+
+    Parameters
+    ----------
+    groups : iterable
+        Units of work, e.g. the items of one recording.
+    produce : callable
+        Generator function of one group, run on a reader thread.
+    depth : int
+        Size of the queue between the readers and the caller.
+    threads : int, optional
+        Number of reader threads, by default 1.
+    stats : PrefetchStats, optional
+        Where busy and stall times are added, by default `PREFETCH_STATS`.
+
+    Raises
+    ------
+    Exception
+        Whatever `produce` raised on a reader thread, raised again in the caller.
+    """
+    out_queue = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+    group_iterator = iter(groups)
+    group_lock = threading.Lock()
+
+    def next_group():
+        with group_lock:
+            return next(group_iterator, _READER_DONE)
+
+    readers = [
+        threading.Thread(
+            target=_read_groups,
+            args=(next_group, produce, out_queue, stop, stats),
+            name=f"prefetch-reader-{i}",
+            daemon=True,
+        )
+        for i in range(max(1, threads))
+    ]
+    for reader in readers:
+        reader.start()
+
+    running = len(readers)
+    try:
+        consume_start = time.perf_counter()
+        while running:
+            stall_start = time.perf_counter()
+            stats.add(consume_s=stall_start - consume_start)
+            value = out_queue.get()
+            consume_start = time.perf_counter()
+            stats.add(consume_stall_s=consume_start - stall_start)
+
+            if value is _READER_DONE:
+                running -= 1
+            elif isinstance(value, _ReaderError):
+                raise value.error
+            else:
+                stats.add(values=1)
+                yield value
+    finally:
+        # Also reached when the caller stops early or fails, readers must not
+        # stay blocked on the full queue
+        stop.set()
+        for reader in readers:
+            reader.join()
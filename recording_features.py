@@ -0,0 +1,128 @@
+import math
+
+import numpy as np
+import opensmile
+import pandas as pd
+
+from audio_analysis import AudioAnalysis
+from instrumentation import profiled
+
+
+# Clip end used in the feature cache key of a whole recording, never a real clip end
+WHOLE_RECORDING_END = math.inf
+
+
+class RecordingFeatures:
+    """
+    The LLD frames of a whole recording, indexed by their start and end times.
+
+    OpenSMILE runs once over the full ``{speaker}_{condition}.wav`` and every
+    annotation takes its frames from the result instead of being extracted on its
+    own. Frames are evenly spaced, so their start times are sorted and finding the
+    frames of a clip is a binary search, O(log n) per clip.
+
+    OpenSMILE only starts a frame when the audio reaches past it by the span of
+    its longest window, which shows in the last frame of the recording ending
+    later than the others. A clip gets the frames starting inside it with that
+    much of the clip left, the frames an extraction on the clip alone would give,
+    up to less than one hop of alignment. As OpenSMILE sees the audio around the
+    clip, values of the clip's first and last frames can differ slightly.
+
+    Parameters
+    ----------
+    feature_data : pd.DataFrame
+        LLD frames of the whole recording, as returned by `opensmile.Smile`.
+    """
+
+    def __init__(self, feature_data):
+        self.columns = list(feature_data.columns)
+        self.values = feature_data.to_numpy(dtype=np.float32)
+        self.starts = feature_data.index.get_level_values("start").asi8
+        self.ends = feature_data.index.get_level_values("end").asi8
+        # Audio needed past the start of a frame, what the last frame spans
+        self.tail_ns = int(self.ends[-1] - self.starts[-1]) if len(self.starts) else 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def frame_range(self, start, end):
+        """
+        Rows [first, last) of the frames of the clip [start, end] (in seconds).
+        """
+        start_ns = round(float(start) * 1e9)
+        end_ns = round(float(end) * 1e9)
+        first = np.searchsorted(self.starts, start_ns, side="left")
+        last = np.searchsorted(self.starts, end_ns - self.tail_ns, side="right")
+        return first, max(first, last)
+
+    def clip_feature_data(self, start, end, file=None):
+        """
+        Returns the frames of [start, end] (in seconds) as a feature DataFrame.
+
+        The frame times are made relative to `start`, like those of an extraction
+        on the clip alone, and `file` goes into the ``file`` level of the index.
+        """
+        first, last = self.frame_range(start, end)
+        start_ns = round(float(start) * 1e9)
+        frame_starts = self.starts[first:last] - start_ns
+        frame_ends = self.ends[first:last] - start_ns
+        if len(frame_ends):
+            # Like the last frame of any extraction, it spans the longest window
+            frame_ends[-1] = frame_starts[-1] + self.tail_ns
+        starts = pd.to_timedelta(frame_starts, unit="ns")
+        ends = pd.to_timedelta(frame_ends, unit="ns")
+        if file is not None:
+            index = pd.MultiIndex.from_arrays(
+                [[str(file)] * len(starts), starts, ends],
+                names=["file", "start", "end"],
+            )
+        else:
+            index = pd.MultiIndex.from_arrays([starts, ends], names=["start", "end"])
+        # A copy, so the clip does not keep the whole recording's frames alive
+        return pd.DataFrame(
+            self.values[first:last].copy(), index=index, columns=self.columns
+        )
+
+
+# Key of a whole recording's features in the feature cache
+def get_recording_cache_key(feature_cache, recording_path, audio_analysis):
+    return feature_cache.make_key(
+        recording_path,
+        0,
+        WHOLE_RECORDING_END,
+        audio_analysis.opensmile_feature_set,
+        audio_analysis.opensmile_feature_level,
+        audio_analysis.feature_columns,
+        audio_analysis.feature_dtype,
+    )
+
+
+# Runs OpenSMILE once over a whole recording, or loads its frames from the cache.
+# analysis_options are passed on to AudioAnalysis, e.g. a column projection.
+@profiled
+def extract_recording_features(
+    recording_path, feature_cache=None, analysis_options=None
+):
+    audio_analysis = AudioAnalysis(**(analysis_options or {}))
+    if (
+        audio_analysis.opensmile_feature_level
+        != opensmile.FeatureLevel.LowLevelDescriptors
+    ):
+        raise ValueError("Only LLD frames can be sliced out of a whole recording")
+    audio_analysis.audio_file_path = recording_path
+
+    cache_key = None
+    if feature_cache is not None:
+        cache_key = get_recording_cache_key(
+            feature_cache, recording_path, audio_analysis
+        )
+        feature_data = feature_cache.load(cache_key)
+        if feature_data is not None:
+            return RecordingFeatures(feature_data)
+
+    audio_analysis.extract_features()
+    if audio_analysis.feature_data is None:
+        raise RuntimeError(f"Failed to extract the features of {recording_path}")
+    if cache_key is not None:
+        feature_cache.store(cache_key, audio_analysis.feature_data)
+    return RecordingFeatures(audio_analysis.feature_data)
@@ -0,0 +1,293 @@
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import hashlib
+import json
+import os
+
+import numpy as np
+from pydub import AudioSegment
+
+from audio_processing import (
+    ORIGINAL_AUDIO_DIR,
+    iter_fric_annotations,
+    iter_vowel_annotations,
+    process_data_items,
+)
+from corpus import Corpus
+from feature_store import FeatureStore
+from instrumentation import profiled
+from plot_spectraltilt import add_spectral_features
+
+
+# Where every shard writes its partial result
+SHARD_DIR = Path("./shards")
+
+# Bump when the partial result layout changes, merging mixed versions fails
+SHARD_FORMAT_VERSION = 1
+
+# The two datasets of a run, with the clip type of their items
+DATASETS = [("vowels", "vowel"), ("frics", "fric")]
+
+# Item fields computed by the pipeline rather than read from the annotations or
+# stored in the partial results as JSON
+DERIVED_FIELDS = {
+    "analysisobj",
+    "audioclip",
+    "audiofilepath",
+    "clipindex",
+    "fingerprint",
+}
+
+
+# Shard of a recording, the same on every machine and in every run. Every clip
+# of a recording goes to the same shard, so each recording is read by one node.
+def get_shard_index(speaker, condition, shard_count):
+    digest = hashlib.sha256(f"{speaker}_{condition}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count
+
+
+def get_shard_path(shard_index, shard_count, output_dir=SHARD_DIR):
+    return Path(output_dir) / f"shard_{shard_index:04d}_of_{shard_count:04d}.npz"
+
+
+# Every annotation of the corpus, in the order of a single-node run
+def get_annotations(corpus=None):
+    if corpus is None:
+        corpus = Corpus.discover(ORIGINAL_AUDIO_DIR)
+    return {
+        "vowels": list(iter_vowel_annotations(corpus=corpus)),
+        "frics": list(iter_fric_annotations(corpus)),
+    }
+
+
+# Clips the tilt plots are drawn from: like those plots, the last clip of every
+# (fricative, word, speaker, room). They all come from one recording, so the last
+# one of a shard is the last one overall.
+def get_plot_clip_positions(fric_items):
+    last_for_key = {
+        (item["fricative"], item["word"], item["speaker"], item["hotneutral"]): i
+        for i, item in enumerate(fric_items)
+    }
+    return sorted(last_for_key.values())
+
+
+def _item_fields(item):
+    fields = {}
+    for name, value in item.items():
+        if name in DERIVED_FIELDS:
+            continue
+        # Spectral features are numpy scalars, stored exactly as Python floats
+        fields[name] = value.item() if isinstance(value, np.generic) else value
+    return fields
+
+
+def _clip_arrays(audio_clips):
+    data = [
+        np.frombuffer(audio_clip.raw_data, dtype=np.uint8) for audio_clip in audio_clips
+    ]
+    lengths = np.array([len(clip_data) for clip_data in data], dtype=np.int64)
+    offsets = np.zeros(len(data) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return {
+        "clip_data": np.concatenate(data) if data else np.zeros(0, dtype=np.uint8),
+        "clip_offsets": offsets,
+        "clip_formats": np.array(
+            [
+                (audio_clip.frame_rate, audio_clip.sample_width, audio_clip.channels)
+                for audio_clip in audio_clips
+            ],
+            dtype=np.int64,
+        ).reshape(-1, 3),
+    }
+
+
+def _load_clips(arrays):
+    data = arrays["clip_data"]
+    offsets = arrays["clip_offsets"]
+    return [
+        AudioSegment(
+            data=data[offsets[i] : offsets[i + 1]].tobytes(),
+            frame_rate=int(frame_rate),
+            sample_width=int(sample_width),
+            channels=int(channels),
+        )
+        for i, (frame_rate, sample_width, channels) in enumerate(arrays["clip_formats"])
+    ]
+
+
+@profiled
+def run_shard(
+    shard_index,
+    shard_count,
+    output_dir=SHARD_DIR,
+    feature_cache=None,
+    export_clips=False,
+    whole_recording=False,
+    analysis_options=None,
+    corpus=None,
+):
+    """
+    Extracts and summarizes the clips of one shard and writes its partial result.
+
+    The shard gets the annotations of the recordings `get_shard_index` assigns to
+    it, numbered by their position in a single-node run. The partial result holds,
+    per dataset, those positions, the annotation fields and spectral features of
+    the items, their frames as a `FeatureStore`, and the fricative clips the tilt
+    plots are drawn from, so merging needs neither the audio nor OpenSMILE.
+
+    Parameters
+    ----------
+    shard_index : int
+        This shard, from 0 to `shard_count` - 1.
+    shard_count : int
+        Number of shards the annotations are split into.
+    output_dir : str or Path, optional
+        Where the partial result is written, by default ``./shards``.
+    feature_cache : FeatureCache, optional
+        Cache of extracted features, may be shared by the shards.
+    export_clips : bool, optional
+        Also write the shard's clips to audio_files/.
+    whole_recording : bool, optional
+        Extract whole recordings and slice the clips out of them.
+    analysis_options : dict, optional
+        AudioAnalysis settings, see `audio_processing.get_analysis_options`.
+    corpus : Corpus, optional
+        The recordings, found under original_audio by default.
+
+    Returns
+    -------
+    Path
+        The partial result file.
+    """
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Shard {shard_index} is not one of {shard_count} shards")
+
+    arrays = {
+        "version": np.array(SHARD_FORMAT_VERSION),
+        "shard": np.array([shard_index, shard_count]),
+    }
+    for name, items in get_annotations(corpus).items():
+        positions = [
+            position
+            for position, item in enumerate(items)
+            if get_shard_index(item["speaker"], item["hotneutral"], shard_count)
+            == shard_index
+        ]
+        shard_items = [items[position] for position in positions]
+        process_data_items(
+            shard_items,
+            dict(DATASETS)[name],
+            in_memory=True,
+            export_clips=export_clips,
+            feature_cache=feature_cache,
+            whole_recording=whole_recording,
+            analysis_options=analysis_options,
+        )
+
+        clip_positions = []
+        if name == "frics":
+            # Spectral tilt and moments of every fricative, as per-item features
+            add_spectral_features(shard_items)
+            clip_positions = get_plot_clip_positions(shard_items)
+        store = FeatureStore.from_dataset(shard_items, release_features=True)
+
+        arrays[f"{name}_positions"] = np.array(positions, dtype=np.int64)
+        arrays[f"{name}_items"] = np.array(
+            json.dumps([_item_fields(item) for item in shard_items])
+        )
+        for key, values in store.to_arrays().items():
+            arrays[f"{name}_store_{key}"] = values
+        arrays[f"{name}_clip_positions"] = np.array(clip_positions, dtype=np.int64)
+        for key, values in _clip_arrays(
+            [shard_items[i]["audioclip"] for i in clip_positions]
+        ).items():
+            arrays[f"{name}_{key}"] = values
+
+    shard_path = get_shard_path(shard_index, shard_count, output_dir)
+    shard_path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first so a merge never reads half a shard
+    tmp_path = shard_path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, shard_path)
+    return shard_path
+
+
+def _load_dataset(arrays, name):
+    items = json.loads(str(arrays[f"{name}_items"]))
+    store = FeatureStore.from_arrays(
+        {
+            key[len(f"{name}_store_") :]: arrays[key]
+            for key in arrays.files
+            if key.startswith(f"{name}_store_")
+        }
+    )
+    clip_arrays = {
+        key: arrays[f"{name}_{key}"]
+        for key in ["clip_data", "clip_offsets", "clip_formats"]
+    }
+    for position, audio_clip in zip(
+        arrays[f"{name}_clip_positions"], _load_clips(clip_arrays)
+    ):
+        items[position]["audioclip"] = audio_clip
+    return arrays[f"{name}_positions"], items, store
+
+
+@profiled
+def merge_shards(shard_count, output_dir=SHARD_DIR):
+    """
+    Merges the partial results of every shard into the datasets of a single-node
+    run: the same items in the same order, with the same frames.
+
+    Returns
+    -------
+    dict of str to tuple
+        ``{"vowels": (items, store), "frics": (items, store)}``. Every item has a
+        ``clipindex`` into its store, the fricatives drawn in the tilt plots also
+        have their ``audioclip``.
+
+    Raises
+    ------
+    FileNotFoundError
+        If a shard has not written its partial result.
+    ValueError
+        If the partial results do not add up to one run, e.g. they were written
+        with different shard counts or annotations.
+    """
+    shards = []
+    for shard_index in range(shard_count):
+        shard_path = get_shard_path(shard_index, shard_count, output_dir)
+        with np.load(shard_path) as arrays:
+            if int(arrays["version"]) != SHARD_FORMAT_VERSION:
+                raise ValueError(f"{shard_path} was written by another version")
+            shards.append({name: _load_dataset(arrays, name) for name, _ in DATASETS})
+
+    datasets = {}
+    for name, _ in DATASETS:
+        positions = np.concatenate([shard[name][0] for shard in shards])
+        if not np.array_equal(np.sort(positions), np.arange(len(positions))):
+            raise ValueError(f"The shards' {name} do not make up one run")
+        items = [item for shard in shards for item in shard[name][1]]
+        store = FeatureStore.concatenate(shard[name][2] for shard in shards)
+
+        # Back into single-node order
+        order = np.argsort(positions, kind="stable")
+        items = [items[i] for i in order]
+        for clip_index, item in enumerate(items):
+            item["clipindex"] = clip_index
+        datasets[name] = (items, store.take(order))
+    return datasets
+
+
+# Local stand-in for a multi-node run: every shard runs in its own process, then
+# the partial results are merged like they would be on the head node
+def run_local_shards(
+    shard_count, processes=None, output_dir=SHARD_DIR, **shard_options
+):
+    run = partial(
+        run_shard, shard_count=shard_count, output_dir=output_dir, **shard_options
+    )
+    with ProcessPoolExecutor(max_workers=processes or shard_count) as executor:
+        list(executor.map(run, range(shard_count)))
+    return merge_shards(shard_count, output_dir)
@@ -0,0 +1,212 @@
+from collections import OrderedDict
+
+import numpy as np
+from scipy.signal import periodogram, welch
+
+
+# Lower bound for human auditory perception, the tilt fit starts here
+TILT_MIN_FREQ = 20
+# Number of log-spaced bands the PSD is averaged into before fitting the tilt
+TILT_BANDS = 48
+
+# FFT length of the cached PSDs (bin spacing is sample_rate / PSD_NFFT)
+PSD_NFFT = 4096
+# How many clip PSDs the shared cache keeps before evicting the oldest
+PSD_CACHE_SIZE = 2048
+
+# Per-clip measures derived from a PSD by spectral_features_batch
+SPECTRAL_FEATURES = [
+    "spectraltilt",
+    "spectraltiltintercept",
+    "cog",
+    "spectralspread",
+    "spectralskewness",
+    "spectralkurtosis",
+    "peakfrequency",
+]
+
+
+# Averages PSD bins into log-spaced bands between min_freq and max_freq.
+# Bands without any bin (narrower than the bin spacing) come out as NaN.
+def band_average_psd(frequencies, psd, min_freq, max_freq, n_bands=TILT_BANDS):
+    edges = np.logspace(np.log10(min_freq), np.log10(max_freq), n_bands + 1)
+    centers = np.sqrt(edges[:-1] * edges[1:])
+
+    # The bins are sorted, so every band is a contiguous run of them. Averaged row
+    # by row rather than with a matrix product, so a clip's bands do not depend
+    # on the other clips of the batch.
+    band_of_bin = np.digitize(frequencies, edges) - 1
+    band_starts = np.searchsorted(band_of_bin, np.arange(n_bands + 1))
+    band_psd = np.full((len(psd), n_bands), np.nan)
+    for band, (start, end) in enumerate(zip(band_starts[:-1], band_starts[1:])):
+        if end > start:
+            band_psd[:, band] = psd[:, start:end].mean(axis=1)
+    return centers, band_psd
+
+
+# Closed-form least-squares fit of dB PSD against log10 frequency for every clip
+# at once. Returns the slope (dB per decade) and intercept of each clip.
+def fit_tilt_batch(centers, band_psd):
+    x = np.broadcast_to(np.log10(centers), band_psd.shape)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        y = 10 * np.log10(band_psd)
+    # Leave out empty bands and bands with no power
+    weights = np.isfinite(y).astype(np.float64)
+    x = np.where(weights > 0, x, 0.0)
+    y = np.where(weights > 0, y, 0.0)
+
+    n = weights.sum(axis=1)
+    sum_x = (weights * x).sum(axis=1)
+    sum_y = (weights * y).sum(axis=1)
+    sum_xx = (weights * x * x).sum(axis=1)
+    sum_xy = (weights * x * y).sum(axis=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slopes = (n * sum_xy - sum_x * sum_y) / (n * sum_xx - sum_x**2)
+        intercepts = (sum_y - slopes * sum_x) / n
+    return slopes, intercepts
+
+
+# PSD of one clip on the grid np.fft.rfftfreq(nfft, 1 / sample_rate).
+# "periodogram" zero-pads clips up to nfft and averages non-overlapping nfft-long
+# boxcar segments (Bartlett's method) for longer ones; "welch" uses Hann windows
+# of up to nfft samples with 50% overlap.
+def compute_psd(signal, sample_rate, method="periodogram", nfft=PSD_NFFT):
+    if method == "welch":
+        _, psd = welch(
+            signal, fs=sample_rate, nperseg=min(nfft, len(signal)), nfft=nfft
+        )
+    elif method == "periodogram":
+        if len(signal) <= nfft:
+            _, psd = periodogram(signal, fs=sample_rate, nfft=nfft)
+        else:
+            _, psd = welch(
+                signal,
+                fs=sample_rate,
+                window="boxcar",
+                nperseg=nfft,
+                noverlap=0,
+                nfft=nfft,
+            )
+    else:
+        raise ValueError(f"Unknown PSD method: {method}")
+    return psd
+
+
+class PSDCache:
+    """
+    A bounded cache of per-clip PSDs, shared by every spectral measure.
+
+    PSDs are computed once per clip with `compute_psd` on a common frequency grid,
+    so the PSDs of many clips stack into one matrix. When more than `max_entries`
+    clips are cached, the least recently used ones are evicted.
+
+    Parameters
+    ----------
+    method : {"periodogram", "welch"}, optional
+        How the PSD is estimated, by default "periodogram".
+    nfft : int, optional
+        FFT length, which sets the frequency resolution, by default `PSD_NFFT`.
+    max_entries : int, optional
+        Maximum number of cached PSDs, by default `PSD_CACHE_SIZE`.
+    """
+
+    def __init__(self, method="periodogram", nfft=PSD_NFFT, max_entries=PSD_CACHE_SIZE):
+        self.method = method
+        self.nfft = nfft
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_many(self, keys, load_signals):
+        """
+        Returns the (sample_rate, psd) of every key, computing the missing ones.
+
+        Parameters
+        ----------
+        keys : list of hashable
+            One key per clip.
+        load_signals : callable
+            Called once with the positions of the missing keys, returns a list of
+            (sample_rate, mono signal) for them.
+        """
+        entries = [None] * len(keys)
+        missing = []
+        for position, key in enumerate(keys):
+            entry = self._entries.get(key)
+            if entry is None:
+                missing.append(position)
+            else:
+                self._entries.move_to_end(key)
+                entries[position] = entry
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            for position, (sample_rate, signal) in zip(missing, load_signals(missing)):
+                psd = compute_psd(signal, sample_rate, self.method, self.nfft)
+                entries[position] = (sample_rate, psd)
+                self._put(keys[position], entries[position])
+        return entries
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# Shared by every spectral measure in this process
+PSD_CACHE = PSDCache()
+
+
+# Spectral tilt and moments of many clips from their PSDs, in one vectorized pass.
+# Moments use the PSD as weights over the whole spectrum like Praat does (power
+# 2): centre of gravity, standard deviation (spread), skewness and excess
+# kurtosis. The tilt is fitted from min_freq up, see band_average_psd.
+def spectral_features_batch(
+    frequencies, psd, min_freq=TILT_MIN_FREQ, n_bands=TILT_BANDS
+):
+    total_power = psd.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weights = psd / total_power
+        # Summed row by row rather than with a matrix product, so a clip's values
+        # do not depend on the other clips of the batch
+        cog = (weights * frequencies[None, :]).sum(axis=1)
+        deviation = frequencies[None, :] - cog[:, None]
+        variance = (weights * deviation**2).sum(axis=1)
+        spread = np.sqrt(variance)
+        skewness = (weights * deviation**3).sum(axis=1) / spread**3
+        kurtosis = (weights * deviation**4).sum(axis=1) / variance**2 - 3
+
+    centers, band_psd = band_average_psd(
+        frequencies, psd, min_freq, frequencies[-1], n_bands
+    )
+    slopes, intercepts = fit_tilt_batch(centers, band_psd)
+
+    return {
+        "spectraltilt": slopes,
+        "spectraltiltintercept": intercepts,
+        "cog": cog,
+        "spectralspread": spread,
+        "spectralskewness": skewness,
+        "spectralkurtosis": kurtosis,
+        "peakfrequency": frequencies[np.argmax(psd, axis=1)],
+    }
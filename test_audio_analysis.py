@@ -0,0 +1,151 @@
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+import audio_analysis
+from audio_analysis import AudioAnalysis, SmileExtractorPool
+from audio_processing import create_audio_data_object
+
+
+class FailingPool:
+    """
+    Stands in for SMILE_POOL, every extraction with it fails.
+    """
+
+    def __init__(self):
+        self.extractions = 0
+
+    @contextmanager
+    def borrow(self, feature_set, feature_level):
+        self.extractions += 1
+        raise RuntimeError("OpenSMILE failed")
+        yield
+
+
+@pytest.fixture
+def failing_pool(monkeypatch):
+    pool = FailingPool()
+    monkeypatch.setattr(audio_analysis, "SMILE_POOL", pool)
+    return pool
+
+
+def make_clip(seconds=0.2, sample_rate=16000):
+    samples = (np.sin(np.arange(int(seconds * sample_rate)) / 5) * 8000).astype(
+        np.int16
+    )
+    return AudioSegment(
+        samples.tobytes(), frame_rate=sample_rate, sample_width=2, channels=1
+    )
+
+
+def test_failed_extraction_is_not_retried(failing_pool):
+    analysis = AudioAnalysis()
+    analysis.load_signal(np.zeros(1600, dtype=np.float32), 16000)
+    assert analysis.feature_data is None
+    assert analysis.feature_data is None
+    analysis.release_audio()
+    assert failing_pool.extractions == 1
+
+    # An explicit call still tries again
+    analysis.extract_features()
+    assert failing_pool.extractions == 2
+
+
+def test_create_audio_data_object_extracts_a_bad_clip_once(failing_pool):
+    analysis = create_audio_data_object("clip.wav", make_clip())
+    assert analysis.feature_data is None
+    assert failing_pool.extractions == 1
+
+
+def test_setting_features_clears_the_failure(failing_pool):
+    analysis = AudioAnalysis()
+    analysis.load_signal(np.zeros(1600, dtype=np.float32), 16000)
+    analysis.extract_features()
+    analysis.feature_data = None
+    assert analysis.feature_data is None
+    assert failing_pool.extractions == 2
+
+
+def test_extracts_features_of_a_clip():
+    analysis = create_audio_data_object("clip.wav", make_clip(), release_audio=False)
+    assert len(analysis.feature_data) > 0
+    assert (analysis.feature_data.dtypes == np.float32).all()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    built = []
+
+    def build(feature_set, feature_level):
+        built.append((feature_set, feature_level))
+        return object()
+
+    monkeypatch.setattr(audio_analysis.opensmile, "Smile", build)
+    pool = SmileExtractorPool()
+    pool.built = built
+    return pool
+
+
+def test_pool_reuses_idle_extractors(pool):
+    with pool.borrow("eGeMAPSv02", "lld") as first:
+        pass
+    with pool.borrow("eGeMAPSv02", "lld") as second:
+        pass
+    assert second is first
+    assert pool.stats() == {"hits": 1, "misses": 1, "idle": 1}
+
+
+def test_pool_lends_an_extractor_to_one_borrower(pool):
+    with pool.borrow("eGeMAPSv02", "lld") as first:
+        with pool.borrow("eGeMAPSv02", "lld") as second:
+            assert second is not first
+        with pool.borrow("eGeMAPSv02", "functionals") as other:
+            assert other is not second
+    assert len(pool.built) == 3
+    assert pool.stats()["idle"] == 3
+
+    pool.clear()
+    assert pool.stats() == {"hits": 0, "misses": 0, "idle": 0}
+
+
+def test_pool_takes_extractors_back_after_errors(pool):
+    with pytest.raises(ValueError):
+        with pool.borrow("eGeMAPSv02", "lld"):
+            raise ValueError
+    assert pool.stats()["idle"] == 1
+
+
+def test_threads_never_share_an_extractor(pool):
+    in_use = set()
+    shared = []
+    lock = threading.Lock()
+
+    def borrow_many():
+        for _ in range(200):
+            with pool.borrow("eGeMAPSv02", "lld") as smile:
+                with lock:
+                    shared.append(id(smile) in in_use)
+                    in_use.add(id(smile))
+                with lock:
+                    in_use.discard(id(smile))
+
+    threads = [threading.Thread(target=borrow_many) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not any(shared)
+    assert len(pool.built) <= 4
+
+
+def test_analyses_borrow_from_the_shared_pool(monkeypatch):
+    pool = SmileExtractorPool()
+    monkeypatch.setattr(audio_analysis, "SMILE_POOL", pool)
+    features = [
+        create_audio_data_object("clip.wav", make_clip()).feature_data for _ in range(3)
+    ]
+    assert pool.stats() == {"hits": 2, "misses": 1, "idle": 1}
+    assert all(data.equals(features[0]) for data in features)
@@ -0,0 +1,189 @@
+import numpy as np
+import pytest
+from pydub import AudioSegment
+from scipy.io import wavfile
+
+import audio_processing
+from audio_processing import SourceAudioCache, get_item_clips, process_data_items
+from benchmark import generate_corpus
+from sharding import get_annotations
+
+
+SAMPLE_RATE = 16000
+
+
+# Two short recordings under ./original_audio, the pipeline reads them from there
+@pytest.fixture
+def audio_dir(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    (tmp_path / "original_audio").mkdir()
+    for name in ["KS_hot", "KS_neutral"]:
+        samples = rng.integers(-20000, 20000, size=SAMPLE_RATE, dtype=np.int16)
+        wavfile.write(tmp_path / "original_audio" / f"{name}.wav", SAMPLE_RATE, samples)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+# Records every recording the cache opens and whether it was closed again
+@pytest.fixture
+def readers(monkeypatch):
+    opened = []
+
+    class TrackedReader(audio_processing.WavReader):
+        def __init__(self, path):
+            super().__init__(path)
+            self.closed = False
+            opened.append(self)
+
+        def close(self):
+            self.closed = True
+            super().close()
+
+    monkeypatch.setattr(audio_processing, "WavReader", TrackedReader)
+    return opened
+
+
+def make_item(condition, start, end, speaker="KS"):
+    return {"speaker": speaker, "hotneutral": condition, "start": start, "end": end}
+
+
+ITEMS = [
+    make_item("hot", 0.1, 0.2),
+    make_item("neutral", 0.0, 0.05),
+    make_item("hot", 0.5, 0.75),
+    make_item("hot", 0.25, 0.3),
+]
+
+
+def test_clips_match_pydub(audio_dir):
+    cache = SourceAudioCache()
+    cache.expect(ITEMS)
+    for item in ITEMS:
+        recording = AudioSegment.from_wav(
+            audio_dir / "original_audio" / f"KS_{item['hotneutral']}.wav"
+        )
+        clip = cache.get_clip("KS", item["hotneutral"], item["start"], item["end"])
+        assert clip == recording[item["start"] * 1000 : item["end"] * 1000]
+
+
+def test_each_recording_is_opened_once(audio_dir, readers):
+    cache = SourceAudioCache()
+    cache.expect(ITEMS)
+    cache.get_clip("KS", "hot", 0.1, 0.2)
+    cache.get_clip("KS", "hot", 0.5, 0.75)
+    assert len(readers) == 1 and not readers[0].closed
+
+    # Closed with the last of its announced clips
+    cache.get_clip("KS", "hot", 0.25, 0.3)
+    assert readers[0].closed
+    cache.get_clip("KS", "neutral", 0.0, 0.05)
+    assert len(readers) == 2 and readers[1].closed
+
+
+def test_unannounced_clips_are_not_kept_open(audio_dir, readers):
+    cache = SourceAudioCache()
+    cache.get_clip("KS", "hot", 0.1, 0.2)
+    cache.get_clip("KS", "hot", 0.1, 0.2)
+    assert len(readers) == 2
+    assert all(reader.closed for reader in readers)
+
+
+def test_close_releases_pending_recordings(audio_dir, readers):
+    cache = SourceAudioCache()
+    cache.expect(ITEMS)
+    cache.get_clip("KS", "hot", 0.1, 0.2)
+    cache.close()
+    assert readers[0].closed
+
+    # Nothing is pending any more, a later clip is not kept open
+    cache.get_clip("KS", "hot", 0.5, 0.75)
+    assert readers[1].closed
+
+
+def test_item_clips_open_each_recording_once(audio_dir, readers):
+    clips = get_item_clips(ITEMS)
+    assert len(readers) == 2
+    assert all(reader.closed for reader in readers)
+    for item, clip in zip(ITEMS, clips):
+        assert clip == audio_processing.cut_audio(
+            audio_processing.get_audio_path("KS", item["hotneutral"]), item
+        )
+
+
+# A small synthetic corpus, the pipeline reads it from the working directory
+@pytest.fixture(scope="module")
+def corpus_dir(tmp_path_factory):
+    corpus_dir = tmp_path_factory.mktemp("corpus")
+    generate_corpus(corpus_dir, speakers=1, conditions=2, minutes=0.1)
+    return corpus_dir
+
+
+# Features of every item, stacked into one array
+def get_features(items):
+    return np.concatenate(
+        [item["analysisobj"].feature_data.to_numpy() for item in items]
+    )
+
+
+def test_signal_matches_the_wav_file(audio_dir):
+    path = audio_dir / "original_audio" / "KS_hot.wav"
+    sample_rate, samples = wavfile.read(path)
+    signal = samples.astype(np.float32) / 2**15
+    clip = AudioSegment.from_wav(path)
+    assert clip.frame_rate == sample_rate
+    np.testing.assert_array_equal(audio_processing.audio_segment_signal(clip), signal)
+
+
+def test_in_memory_matches_the_wav_round_trip(corpus_dir, monkeypatch):
+    monkeypatch.chdir(corpus_dir)
+    items = get_annotations()["frics"]
+    in_memory = process_data_items(
+        [dict(item) for item in items], "fric", in_memory=True, export_clips=False
+    )
+    assert not (corpus_dir / "audio_files").exists()
+
+    round_trip = process_data_items([dict(item) for item in items], "fric")
+    assert all(item["audiofilepath"].exists() for item in round_trip)
+    np.testing.assert_allclose(get_features(in_memory), get_features(round_trip))
+
+
+@pytest.mark.parametrize("chunksize", [None, 1, 5])
+def test_workers_match_the_serial_run(corpus_dir, monkeypatch, chunksize):
+    monkeypatch.chdir(corpus_dir)
+    items = get_annotations()["vowels"]
+    serial = process_data_items(
+        [dict(item) for item in items], in_memory=True, export_clips=False
+    )
+    parallel_items = [dict(item) for item in items]
+    item_ids = [id(item) for item in parallel_items]
+    parallel = process_data_items(
+        parallel_items,
+        in_memory=True,
+        export_clips=False,
+        workers=2,
+        chunksize=chunksize,
+    )
+
+    # The caller's dicts are filled in, in their own order
+    assert parallel is parallel_items
+    assert [id(item) for item in parallel] == item_ids
+    assert [item["audiofilepath"] for item in parallel] == [
+        item["audiofilepath"] for item in serial
+    ]
+    for item, serial_item in zip(parallel, serial):
+        assert item["analysisobj"].feature_data.equals(
+            serial_item["analysisobj"].feature_data
+        )
+
+
+# Items sharing a clip path export it once, with the clip of the last of them
+def test_shared_clip_paths_are_exported_once():
+    items = [
+        {"word": "bath", "speaker": "KS", "hotneutral": "hot"},
+        {"word": "sea", "speaker": "KS", "hotneutral": "hot"},
+        {"word": "bath", "speaker": "KS", "hotneutral": "hot"},
+    ]
+    export_indices = audio_processing._get_export_indices
+    assert export_indices(items, "vowel", in_memory=False, export_clips=False) == {1, 2}
+    assert export_indices(items, "vowel", in_memory=True, export_clips=True) == {1, 2}
+    assert export_indices(items, "vowel", in_memory=True, export_clips=False) == set()
@@ -0,0 +1,45 @@
+import csv
+
+import pytest
+
+from audio_processing import get_clip_path, get_fricative_start_stops
+from benchmark import CORPUS_MARKER, generate_corpus
+from corpus import Corpus
+
+
+def test_regenerating_replaces_a_larger_corpus(tmp_path):
+    generate_corpus(tmp_path, speakers=4, conditions=3, minutes=0.2)
+    corpus = generate_corpus(tmp_path, speakers=2, conditions=2, minutes=0.1)
+
+    recordings = Corpus.discover(tmp_path / "original_audio")
+    assert len(recordings) == corpus["recordings"] == 4
+    assert recordings.speakers == ["KS", "SD"]
+    assert recordings.conditions == ["hot", "neutral"]
+    assert (tmp_path / CORPUS_MARKER).exists()
+
+
+def test_refuses_a_directory_it_did_not_generate(tmp_path):
+    (tmp_path / "notes.txt").touch()
+    with pytest.raises(FileExistsError):
+        generate_corpus(tmp_path)
+    assert (tmp_path / "notes.txt").exists()
+
+
+def test_every_token_has_its_own_clip(tmp_path):
+    corpus = generate_corpus(tmp_path, speakers=1, conditions=2, minutes=0.3)
+
+    with open(tmp_path / "test_dataset.csv", newline="", encoding="utf-8") as f:
+        vowels = list(csv.DictReader(f))
+    fricatives = [
+        fricative
+        for recording in Corpus.discover(tmp_path / "original_audio")
+        for fricative in get_fricative_start_stops(
+            recording.textgrid_path, recording.condition, recording.speaker
+        )
+    ]
+    assert len(vowels) == corpus["vowel_intervals"]
+    assert len(fricatives) == corpus["fricative_intervals"]
+
+    for items, clip_type in [(vowels, "vowel"), (fricatives, "fric")]:
+        paths = {get_clip_path(item, clip_type) for item in items}
+        assert len(paths) == len(items)
@@ -0,0 +1,163 @@
+import pytest
+
+from corpus import Corpus, ItemIndex
+from plot_rendering import get_speaker_label
+from plot_spectraltilt import get_line_styles, get_obstruents_from_dataset
+
+
+# Empty stand-ins are enough, discover only looks at the file names
+@pytest.fixture
+def audio_dir(tmp_path):
+    textgrid_dir = tmp_path / "TextGrids"
+    textgrid_dir.mkdir()
+    for name in ["SL_neutral", "KS_hot", "KS_neutral", "SD_hot", "notes", "a_b_c"]:
+        (tmp_path / f"{name}.wav").touch()
+    for name in ["KS_hot", "KS_hot_vowels", "KS_neutral", "SD_hot_extra", "XX_cold"]:
+        (textgrid_dir / f"{name}.TextGrid").touch()
+    (tmp_path / "KS_hot.txt").touch()
+    return tmp_path
+
+
+def test_discover_finds_every_recording(audio_dir):
+    corpus = Corpus.discover(audio_dir)
+    # Condition by condition, speakers in alphabetical order within each
+    assert [(r.speaker, r.condition) for r in corpus] == [
+        ("KS", "hot"),
+        ("SD", "hot"),
+        ("KS", "neutral"),
+        ("SL", "neutral"),
+    ]
+    assert len(corpus) == 4
+    assert corpus.speakers == ["KS", "SD", "SL"]
+    assert corpus.conditions == ["hot", "neutral"]
+
+
+def test_discover_pairs_the_textgrids(audio_dir):
+    recordings = {(r.speaker, r.condition): r for r in Corpus.discover(audio_dir)}
+    textgrid_dir = audio_dir / "TextGrids"
+
+    ks_hot = recordings[("KS", "hot")]
+    assert ks_hot.audio_path == audio_dir / "KS_hot.wav"
+    assert ks_hot.textgrid_path == textgrid_dir / "KS_hot.TextGrid"
+    assert ks_hot.extra_textgrid_paths == [textgrid_dir / "KS_hot_vowels.TextGrid"]
+
+    sd_hot = recordings[("SD", "hot")]
+    assert sd_hot.textgrid_path is None
+    assert sd_hot.extra_textgrid_paths == [textgrid_dir / "SD_hot_extra.TextGrid"]
+
+    assert [
+        (r.speaker, r.condition)
+        for r in Corpus.discover(audio_dir).annotated_recordings()
+    ] == [("KS", "hot"), ("KS", "neutral")]
+
+
+def test_discover_without_textgrids(tmp_path):
+    (tmp_path / "KS_hot.wav").touch()
+    [recording] = Corpus.discover(tmp_path)
+    assert recording.textgrid_path is None
+    assert recording.extra_textgrid_paths == []
+    assert len(Corpus.discover(tmp_path / "missing")) == 0
+
+
+ITEMS = [
+    {"speaker": "KS", "hotneutral": "hot", "vowel": "a", "word": "bath"},
+    {"speaker": "SD", "hotneutral": "hot", "fricative": "s", "word": "just"},
+    {"speaker": "KS", "hotneutral": "neutral", "vowel": "a", "word": "bath"},
+    {"speaker": "KS", "hotneutral": "hot", "fricative": "s", "word": "just"},
+    {"speaker": "SL", "hotneutral": "neutral", "vowel": "i", "word": "sea"},
+]
+
+
+def test_item_index_groups():
+    index = ItemIndex(ITEMS)
+    assert len(index) == len(ITEMS)
+    assert index.values("speaker") == ["KS", "SD", "SL"]
+    assert index.values("fricative") == ["s"]
+    assert index.group("speaker", "KS") == [ITEMS[0], ITEMS[2], ITEMS[3]]
+    assert index.group("speaker", "XX") == []
+    assert index.groups("hotneutral") == {
+        "hot": [ITEMS[0], ITEMS[1], ITEMS[3]],
+        "neutral": [ITEMS[2], ITEMS[4]],
+    }
+
+
+def test_item_index_select():
+    index = ItemIndex(ITEMS)
+    for criteria in [
+        {"speaker": "KS", "hotneutral": "hot"},
+        {"word": "just", "fricative": "s"},
+        {"speaker": "KS", "word": "sea"},
+        {"vowel": "a", "hotneutral": "neutral", "speaker": "KS"},
+        {},
+    ]:
+        expected = [
+            item
+            for item in ITEMS
+            if all(item.get(field) == value for field, value in criteria.items())
+        ]
+        assert index.select(**criteria) == expected
+
+
+def test_item_index_extend():
+    index = ItemIndex(ITEMS[:2], fields=["speaker"])
+    index.extend(ITEMS[2:])
+    assert index.group("speaker", "KS") == [ITEMS[0], ITEMS[2], ITEMS[3]]
+    with pytest.raises(KeyError):
+        index.values("word")
+
+
+FRICATIVES = [
+    {"speaker": "SD", "hotneutral": "hot", "fricative": "s", "word": "just", "n": 0},
+    {"speaker": "KS", "hotneutral": "hot", "fricative": "s", "word": "just", "n": 1},
+    {"speaker": "KS", "hotneutral": "hot", "fricative": "s", "word": "just", "n": 2},
+    {"speaker": "KS", "hotneutral": "neutral", "fricative": "s", "word": "sea", "n": 3},
+    {
+        "speaker": "KS",
+        "hotneutral": "neutral",
+        "fricative": "s",
+        "word": "just",
+        "n": 4,
+    },
+    {"speaker": "SL", "hotneutral": "neutral", "fricative": "f", "word": "fee", "n": 5},
+]
+
+
+# The clip of every speaker and room on each obstruent plot, the last one wins
+def scan_obstruents(dataset, labels):
+    obstruent_items = {label: {} for label in labels}
+    for item in dataset:
+        label = f"{item['fricative']}-{item['word']}"
+        if label in obstruent_items:
+            line = (item["speaker"], item["hotneutral"])
+            obstruent_items[label][line] = item
+    return obstruent_items
+
+
+def test_obstruents_come_from_the_index():
+    index = ItemIndex(FRICATIVES)
+    labels = ["s-just", "s-sea", "f-fee", "z-zoo"]
+    obstruent_items = get_obstruents_from_dataset(FRICATIVES, labels, index)
+
+    expected = scan_obstruents(FRICATIVES, labels)
+    for label in labels:
+        # Lines in alphabetical order of speaker and room
+        lines = sorted(expected[label])
+        assert list(obstruent_items[label]) == [
+            f"{get_speaker_label(speaker)} {hotneutral.capitalize()}"
+            for speaker, hotneutral in lines
+        ]
+        assert list(obstruent_items[label].values()) == [
+            expected[label][line] for line in lines
+        ]
+    assert obstruent_items == get_obstruents_from_dataset(FRICATIVES, labels)
+
+
+# A speaker and room look the same on every plot, whichever clips it shows
+def test_line_styles_follow_the_whole_dataset():
+    index = ItemIndex(FRICATIVES)
+    styles = get_line_styles(index, FRICATIVES)
+    by_line = {}
+    for item, style in zip(FRICATIVES, styles):
+        assert by_line.setdefault((item["speaker"], item["hotneutral"]), style) == style
+    assert len(set(styles)) == len(by_line)
+    assert get_line_styles(index, FRICATIVES[5:]) == styles[5:]
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_cache import FeatureCache
+
+
+FEATURE_SET = "eGeMAPSv02"
+FEATURE_LEVEL = "lld"
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "KS_hot.wav"
+    path.write_bytes(b"RIFF recording")
+    return path
+
+
+def make_features(frames=4, dtype=np.float32, seed=0):
+    rng = np.random.default_rng(seed)
+    # Frame times in ns, like OpenSMILE's index
+    starts = pd.to_timedelta(np.arange(frames) * 10**7, unit="ns")
+    index = pd.MultiIndex.from_arrays(
+        [starts, starts + pd.Timedelta(2 * 10**7, unit="ns")], names=["start", "end"]
+    )
+    return pd.DataFrame(
+        rng.normal(size=(frames, 2)).astype(dtype),
+        index=index,
+        columns=["Loudness_sma3", "jitterLocal_sma3nz"],
+    )
+
+
+def make_key(cache, source, start=0.5, **kwargs):
+    return cache.make_key(
+        source, start, start + 0.1, FEATURE_SET, FEATURE_LEVEL, **kwargs
+    )
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_entries_keep_their_dtype(tmp_path, source, dtype):
+    cache = FeatureCache(tmp_path / "cache")
+    features = make_features(dtype=dtype)
+    key = make_key(cache, source, dtype=dtype)
+    cache.store(key, features)
+
+    loaded = cache.load(key)
+    assert (loaded.dtypes == dtype).all()
+    np.testing.assert_array_equal(loaded.to_numpy(), features.to_numpy())
+    assert (loaded.index == features.index).all()
+
+
+def test_keys_tell_options_apart(tmp_path, source):
+    cache = FeatureCache(tmp_path / "cache")
+    key = make_key(cache, source)
+    assert make_key(cache, source, dtype=np.float32) == key
+    assert make_key(cache, source, dtype=np.float64) != key
+    assert make_key(cache, source, columns=["Loudness_sma3"]) != key
+    assert make_key(cache, source, start=0.6) != key
+
+    source.write_bytes(b"RIFF another recording")
+    assert make_key(cache, source) != key
+
+
+def test_missing_entry_is_a_miss(tmp_path, source):
+    cache = FeatureCache(tmp_path / "cache")
+    assert cache.load(make_key(cache, source)) is None
+    assert cache.stats()["misses"] == 1
+
+
+# Entries of the cache on disk, oldest first
+def entry_paths(cache):
+    return [path for _, _, path in sorted(cache._entries())]
+
+
+def test_filling_the_cache_scans_it_once(tmp_path, source, monkeypatch):
+    cache = FeatureCache(tmp_path / "cache")
+    scans = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, "_entries", lambda: scans.append(1) or entries())
+
+    for i in range(50):
+        cache.store(make_key(cache, source, start=i), make_features(seed=i))
+    assert len(scans) == 1
+    assert cache._total_bytes == sum(path.stat().st_size for path in entry_paths(cache))
+
+
+def test_eviction_keeps_the_most_recent_entries(tmp_path, source):
+    cache = FeatureCache(tmp_path / "cache")
+    cache.store(make_key(cache, source, start=0), make_features())
+    entry_bytes = cache._total_bytes
+    cache.max_bytes = 10 * entry_bytes + entry_bytes // 2
+
+    keys = [make_key(cache, source, start=i) for i in range(1, 40)]
+    for key in keys:
+        cache.store(key, make_features())
+        assert cache._total_bytes <= cache.max_bytes
+        assert cache._total_bytes == sum(
+            path.stat().st_size for path in entry_paths(cache)
+        )
+    # The newest entries survive, nothing over the cap was left behind
+    assert cache.load(keys[-1]) is not None
+    assert cache.load(make_key(cache, source, start=0)) is None
+    assert len(entry_paths(cache)) <= 10
+
+
+def test_clear_resets_the_size(tmp_path, source):
+    cache = FeatureCache(tmp_path / "cache")
+    cache.store(make_key(cache, source), make_features())
+    assert cache.clear() == 1
+    assert cache.stats()["entries"] == 0
+    cache.store(make_key(cache, source), make_features())
+    assert cache._total_bytes == entry_paths(cache)[0].stat().st_size
@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_store import METADATA_COLUMNS, SUMMARY_PERCENTILES, FeatureStore
+
+
+COLUMNS = ["Loudness_sma3", "F0semitoneFrom27.5Hz_sma3nz", "jitterLocal_sma3nz"]
+
+# Frames per clip: empty clips, single frames and a long one between the others
+CLIP_LENGTHS = [5, 0, 1, 37, 2, 0, 120, 3, 1, 64]
+
+
+# Random frames with ties, negative values, unvoiced (zero) frames in the nz
+# columns, a clip without any voiced frame and a few NaN values
+def make_store(seed=0):
+    rng = np.random.default_rng(seed)
+    offsets = np.zeros(len(CLIP_LENGTHS) + 1, dtype=np.int64)
+    np.cumsum(CLIP_LENGTHS, out=offsets[1:])
+    n_frames = offsets[-1]
+
+    frames = np.round(rng.normal(0, 10, (n_frames, len(COLUMNS))), 1)
+    frames = frames.astype(np.float32)
+    frames[rng.random(n_frames) < 0.3, 1:] = 0
+    frames[offsets[3] : offsets[4], 2] = 0
+    frames[rng.random(n_frames) < 0.02, 0] = np.nan
+
+    frame_times = np.stack([np.arange(n_frames), np.arange(n_frames) + 1], axis=1)
+    metadata = {
+        name: np.array([f"{name}{i}" for i in range(len(CLIP_LENGTHS))])
+        for name in METADATA_COLUMNS
+    }
+    return FeatureStore(COLUMNS, frames, frame_times * 10**7, offsets, metadata)
+
+
+# Statistics of one clip's column, computed on its own with numpy
+def expected_statistics(values, voiced_only, percentiles):
+    values = values.astype(np.float64)
+    if voiced_only:
+        values = values[values != 0]
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return {"count": 0, **{stat: np.nan for stat in ["mean", "std", "median"]}}
+
+    statistics = {
+        "count": len(values),
+        "mean": np.mean(values),
+        "std": np.std(values),
+        "median": np.median(values),
+    }
+    for q in percentiles:
+        statistics[f"p{q:g}"] = np.percentile(values, q)
+    return statistics
+
+
+@pytest.mark.parametrize("percentiles", [SUMMARY_PERCENTILES, (0, 5, 33.3, 100)])
+def test_summarize_matches_numpy(percentiles):
+    store = make_store()
+    summary = store.summarize(percentiles)
+
+    assert summary["clipindex"].tolist() == list(range(len(CLIP_LENGTHS)))
+    for name in METADATA_COLUMNS:
+        assert summary[name].tolist() == store.metadata[name].tolist()
+
+    for clip_index in range(len(store)):
+        for position, column in enumerate(COLUMNS):
+            expected = expected_statistics(
+                store.clip_frames(clip_index)[:, position],
+                column.endswith("nz"),
+                percentiles,
+            )
+            for stat, value in expected.items():
+                np.testing.assert_allclose(
+                    summary[f"{column}_{stat}"][clip_index],
+                    value,
+                    rtol=1e-12,
+                    atol=1e-12,
+                    err_msg=f"{column}_{stat} of clip {clip_index}",
+                )
+
+
+def test_summarize_is_reused():
+    store = make_store()
+    assert store.summarize() is store.summarize(list(SUMMARY_PERCENTILES))
+
+
+def test_summarize_empty_store():
+    store = make_store().take([1, 5])
+    summary = store.summarize()
+    assert len(summary) == 2
+    assert summary[f"{COLUMNS[0]}_count"].tolist() == [0, 0]
+    assert summary[f"{COLUMNS[0]}_p90"].isna().all()
+
+
+@pytest.mark.parametrize("reduction", ["mean", "sum", "min", "max"])
+def test_clip_reduce_matches_numpy(reduction):
+    store = make_store()
+    reduced = store.clip_reduce(COLUMNS[1:], reduction)
+    assert reduced.shape == (len(CLIP_LENGTHS), 2)
+    for clip_index, length in enumerate(CLIP_LENGTHS):
+        if length == 0:
+            assert np.isnan(reduced[clip_index]).all()
+            continue
+        frames = store.clip_frames(clip_index, COLUMNS[1:]).astype(np.float64)
+        np.testing.assert_allclose(
+            reduced[clip_index], getattr(np, reduction)(frames, axis=0), rtol=1e-12
+        )
+
+
+def test_group_reduce_averages_the_clips():
+    store = make_store()
+    store.metadata["speaker"] = np.array(["KS", "SD"] * 5)
+    store.metadata["hotneutral"] = np.array(["hot"] * 4 + ["neutral"] * 6)
+    grouped = store.group_reduce(["speaker", "hotneutral"], COLUMNS[1])
+
+    per_clip = pd.DataFrame(
+        {
+            "speaker": store.metadata["speaker"],
+            "hotneutral": store.metadata["hotneutral"],
+            COLUMNS[1]: store.clip_reduce(COLUMNS[1])[:, 0],
+        }
+    )
+    # Clips without frames are left out, like pandas skips their NaN
+    expected = per_clip.groupby(["speaker", "hotneutral"], as_index=False).mean()
+    assert grouped[["speaker", "hotneutral"]].equals(
+        expected[["speaker", "hotneutral"]]
+    )
+    np.testing.assert_allclose(grouped[COLUMNS[1]], expected[COLUMNS[1]])
+
+
+def assert_same_clips(store, expected, clip_indices):
+    assert store.columns == expected.columns
+    assert len(store) == len(clip_indices)
+    for position, clip_index in enumerate(clip_indices):
+        np.testing.assert_array_equal(
+            store.clip_frames(position), expected.clip_frames(clip_index)
+        )
+        assert store.clip_feature_data(position).equals(
+            expected.clip_feature_data(clip_index)
+        )
+        for name in METADATA_COLUMNS:
+            assert store.metadata[name][position] == expected.metadata[name][clip_index]
+
+
+def test_take_and_concatenate():
+    store = make_store()
+    clip_indices = [6, 1, 3, 3, 0]
+    assert_same_clips(store.take(clip_indices), store, clip_indices)
+
+    parts = [store.take([0, 1, 2]), store.take([]), store.take([3, 4, 5, 6, 7, 8, 9])]
+    assert_same_clips(FeatureStore.concatenate(parts), store, range(len(store)))
+
+    other = FeatureStore(
+        ["x"],
+        np.zeros((1, 1), np.float32),
+        np.zeros((1, 2)),
+        [0, 1],
+        store.take([0]).metadata,
+    )
+    with pytest.raises(ValueError):
+        FeatureStore.concatenate([store, other])
+
+
+def test_arrays_round_trip():
+    store = make_store()
+    arrays = store.to_arrays()
+    assert_same_clips(FeatureStore.from_arrays(arrays), store, range(len(store)))
+
+
+class Analysis:
+    def __init__(self, feature_data):
+        self.feature_data = feature_data
+
+
+def test_from_dataset_indexes_the_clips():
+    store = make_store()
+    dataset = [
+        {
+            "analysisobj": Analysis(store.clip_feature_data(clip_index)),
+            **{name: store.metadata[name][clip_index] for name in METADATA_COLUMNS},
+        }
+        for clip_index in range(len(store))
+    ]
+    # A clip whose extraction failed has no frames
+    dataset[4]["analysisobj"].feature_data = None
+
+    built = FeatureStore.from_dataset(dataset, release_features=True)
+    assert [item["clipindex"] for item in dataset] == list(range(len(store)))
+    assert all(item["analysisobj"].feature_data is None for item in dataset)
+    assert built.clip_lengths[4] == 0
+    assert_same_clips(built.take([0, 1, 2, 3]), store, [0, 1, 2, 3])
+    assert_same_clips(built.take([5, 6, 7, 8, 9]), store, [5, 6, 7, 8, 9])
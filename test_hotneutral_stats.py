@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from hotneutral_stats import (
+    HotNeutralTest,
+    bootstrap_indices,
+    compare_hot_neutral,
+    permutation_indices,
+)
+
+
+RESAMPLES = 200
+SEED = 3
+
+
+def make_values(seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(size=(9, 3))
+    values[:4, 1] += 1.5
+    # Feature 2 has no value in the hot room, feature 0 misses one clip
+    values[:4, 2] = np.nan
+    values[6, 0] = np.nan
+    hot = np.arange(9) < 4
+    return values, hot
+
+
+# Difference in means of one relabeling, NaN when a room has no value
+def loop_difference(values, hot):
+    differences = []
+    for feature in values.T:
+        hot_values = feature[hot][~np.isnan(feature[hot])]
+        neutral_values = feature[~hot][~np.isnan(feature[~hot])]
+        if len(hot_values) == 0 or len(neutral_values) == 0:
+            differences.append(np.nan)
+        else:
+            differences.append(hot_values.mean() - neutral_values.mean())
+    return np.array(differences)
+
+
+# Plain permutation test, one relabeling at a time from the same index draws
+def loop_p_values(values, hot, rng, resamples):
+    n = len(hot)
+    n_hot = hot.sum()
+    observed = np.abs(loop_difference(values, hot))
+    extreme = np.zeros(values.shape[1])
+    finite = np.zeros(values.shape[1])
+    for permutation in permutation_indices(rng, resamples, n):
+        relabeled = np.zeros(n, dtype=bool)
+        relabeled[permutation[:n_hot]] = True
+        differences = np.abs(loop_difference(values, relabeled))
+        for feature in range(values.shape[1]):
+            if np.isfinite(differences[feature]):
+                finite[feature] += 1
+                extreme[feature] += differences[feature] >= observed[feature] - 1e-12
+    p_values = (1 + extreme) / (1 + finite)
+    p_values[~np.isfinite(observed)] = np.nan
+    return p_values
+
+
+# Percentile bootstrap with np.percentile, one sample at a time
+def loop_interval(values, hot, rng, resamples, confidence=0.95):
+    hot_positions = np.flatnonzero(hot)
+    neutral_positions = np.flatnonzero(~hot)
+    hot_samples = hot_positions[bootstrap_indices(rng, resamples, len(hot_positions))]
+    neutral_samples = neutral_positions[
+        bootstrap_indices(rng, resamples, len(neutral_positions))
+    ]
+
+    differences = []
+    for hot_sample, neutral_sample in zip(hot_samples, neutral_samples):
+        differences.append(
+            loop_difference(
+                np.concatenate([values[hot_sample], values[neutral_sample]]),
+                np.arange(len(hot_sample) + len(neutral_sample)) < len(hot_sample),
+            )
+        )
+    differences = np.array(differences)
+
+    tail = 100 * (1 - confidence) / 2
+    bounds = []
+    for feature in differences.T:
+        feature = feature[np.isfinite(feature)]
+        bounds.append(
+            np.percentile(feature, [tail, 100 - tail]) if len(feature) else [np.nan] * 2
+        )
+    return np.array(bounds).T
+
+
+def test_difference_leaves_out_missing_values():
+    values, hot = make_values()
+    mean_hot, mean_neutral = HotNeutralTest(values, hot).difference()
+    np.testing.assert_allclose(mean_hot - mean_neutral, loop_difference(values, hot))
+    assert np.isnan(mean_hot[2])
+
+
+@pytest.mark.parametrize("batch", [RESAMPLES, 64])
+def test_p_values_match_a_loop(batch):
+    values, hot = make_values()
+    p_values = HotNeutralTest(values, hot).permutation_p_values(
+        np.random.default_rng(SEED), RESAMPLES, batch=batch
+    )
+    expected = loop_p_values(values, hot, np.random.default_rng(SEED), RESAMPLES)
+    np.testing.assert_allclose(p_values, expected)
+    assert np.isnan(p_values[2])
+    assert p_values[1] < 0.05
+
+
+def test_interval_matches_np_percentile():
+    values, hot = make_values()
+    ci_low, ci_high = HotNeutralTest(values, hot).bootstrap_interval(
+        np.random.default_rng(SEED), RESAMPLES, batch=RESAMPLES
+    )
+    expected_low, expected_high = loop_interval(
+        values, hot, np.random.default_rng(SEED), RESAMPLES
+    )
+    np.testing.assert_allclose(ci_low, expected_low)
+    np.testing.assert_allclose(ci_high, expected_high)
+    assert np.isnan(ci_low[2]) and np.isnan(ci_high[2])
+    assert ci_low[1] > 0
+
+
+def make_summary():
+    values, hot = make_values()
+    summary = pd.DataFrame(values, columns=["a_mean", "b_mean", "c_mean"])
+    summary["hotneutral"] = np.where(hot, "hot", "neutral")
+    summary["speaker"] = "KS"
+    summary["a_count"] = 10
+    # A speaker recorded in the hot room only
+    only_hot = summary.iloc[:3].assign(speaker="SD")
+    return pd.concat([summary, only_hot], ignore_index=True)
+
+
+def test_compare_hot_neutral():
+    summary = make_summary()
+    result = compare_hot_neutral(summary, "speaker", resamples=RESAMPLES, seed=SEED)
+
+    # No row for the speaker without neutral clips, frame counts are not tested
+    assert list(result["speaker"]) == ["KS"] * 3
+    assert list(result["feature"]) == ["a_mean", "b_mean", "c_mean"]
+    assert list(result["n_hot"]) == [4, 4, 0]
+    assert list(result["n_neutral"]) == [4, 5, 5]
+
+    values, hot = make_values()
+    rng = np.random.default_rng(SEED)
+    np.testing.assert_allclose(
+        result["p_value"], loop_p_values(values, hot, rng, RESAMPLES)
+    )
+    expected_low, expected_high = loop_interval(values, hot, rng, RESAMPLES)
+    np.testing.assert_allclose(result["ci_low"], expected_low)
+    np.testing.assert_allclose(result["ci_high"], expected_high)
+    np.testing.assert_allclose(result["difference"], loop_difference(values, hot))
+
+
+def test_compare_without_neutral_clips():
+    summary = make_summary()
+    result = compare_hot_neutral(summary[summary["speaker"] == "SD"], "speaker")
+    assert result.empty
+    assert list(result.columns)[:2] == ["speaker", "feature"]
@@ -0,0 +1,119 @@
+import json
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import instrumentation
+from instrumentation import StageProfiler, describe_call, profiled
+
+
+@pytest.fixture
+def profiler(monkeypatch):
+    profiler = StageProfiler()
+    monkeypatch.setattr(instrumentation, "PROFILER", profiler)
+    yield profiler
+    profiler.disable()
+
+
+@profiled
+def allocate(item, megabytes):
+    return np.ones(megabytes * 2**20 // 8).sum()
+
+
+@profiled
+def process(items, megabytes=4):
+    return [allocate(item, megabytes) for item in items]
+
+
+ITEMS = [
+    {"speaker": "KS", "hotneutral": "hot", "word": "bath", "start": 1.0},
+    {"speaker": "SD", "hotneutral": "neutral", "word": "sea", "start": 2.0},
+]
+
+
+def test_disabled_profiler_records_nothing(profiler):
+    process(ITEMS)
+    assert profiler.spans == []
+
+
+def test_spans_nest(profiler):
+    profiler.enable()
+    process(ITEMS)
+    profiler.disable()
+
+    inner = [span for span in profiler.spans if span["name"].endswith("allocate")]
+    [outer] = [span for span in profiler.spans if span["name"].endswith("process")]
+    assert [span["depth"] for span in inner] == [1, 1]
+    assert outer["depth"] == 0
+    assert [span["args"]["item"] for span in inner] == [
+        "KS hot bath 1.0",
+        "SD neutral sea 2.0",
+    ]
+    assert outer["wall_ns"] >= sum(span["wall_ns"] for span in inner)
+
+    # The 4 MiB array of every call, which the enclosing call includes
+    assert all(span["peak_bytes"] >= 4 * 2**20 for span in inner)
+    assert outer["peak_bytes"] >= max(span["peak_bytes"] for span in inner)
+
+
+def test_stage_summary(profiler):
+    profiler.enable(trace_memory=False)
+    process(ITEMS)
+    process(ITEMS[:1])
+    profiler.disable()
+
+    summary = {row["stage"]: row for row in profiler.stage_summary()}
+    allocate_row = summary["test_instrumentation.allocate"]
+    assert allocate_row["calls"] == 3
+    assert allocate_row["peak_mib"] is None
+    assert allocate_row["slowest_item"] in ["KS hot bath 1.0", "SD neutral sea 2.0"]
+    assert summary["test_instrumentation.process"]["calls"] == 2
+    # Slowest stages first
+    assert list(summary)[0] == "test_instrumentation.process"
+
+
+def test_threads_have_their_own_stacks(profiler):
+    profiler.enable(trace_memory=False)
+    threads = [threading.Thread(target=process, args=(ITEMS, 1)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    profiler.disable()
+
+    depths = {}
+    for span in profiler.spans:
+        depths.setdefault(span["name"], set()).add(span["depth"])
+    assert depths == {
+        "test_instrumentation.process": {0},
+        "test_instrumentation.allocate": {1},
+    }
+
+
+def test_chrome_trace(profiler, tmp_path):
+    profiler.enable()
+    process(ITEMS)
+    profiler.disable()
+
+    path = profiler.write_chrome_trace(tmp_path / "trace.json")
+    with open(path, encoding="utf-8") as f:
+        events = json.load(f)["traceEvents"]
+    assert len(events) == len(profiler.spans) == 3
+    for event, span in zip(events, profiler.spans):
+        assert event["ph"] == "X"
+        assert event["name"] == span["name"]
+        assert event["dur"] == span["wall_ns"] / 1000
+        assert event["args"]["peak_kib"] == span["peak_bytes"] / 1024
+
+
+class Analysis:
+    audio_file_path = Path("audio_files/vowels/bath_KS_hot.wav")
+
+
+def test_calls_are_described_by_their_item():
+    assert describe_call((ITEMS[0], "vowel"), {}) == "KS hot bath 1.0"
+    assert describe_call((), {"path": Path("KS_hot.wav")}) == "KS_hot.wav"
+    assert describe_call((Analysis(),), {}) == str(Analysis.audio_file_path)
+    assert describe_call((1, 2), {}) is None
@@ -0,0 +1,16 @@
+import pytest
+
+from main import main
+
+
+@pytest.mark.parametrize("argv", [["--help"], ["--workers", "x"], ["summarize", "-h"]])
+def test_timing_is_reported_when_argparse_exits(argv, capsys):
+    with pytest.raises(SystemExit):
+        main(["--timing"] + argv)
+    assert "startup:" in capsys.readouterr().err
+
+
+def test_no_timing_without_the_flag(capsys):
+    with pytest.raises(SystemExit):
+        main(["--help"])
+    assert "startup:" not in capsys.readouterr().err
@@ -0,0 +1,151 @@
+import json
+
+import pytest
+
+import audio_processing
+from audio_processing import process_data_items
+from benchmark import generate_corpus
+from feature_cache import FeatureCache
+from manifest import MANIFEST_VERSION, Manifest
+from sharding import get_annotations
+
+
+ITEM = {
+    "speaker": "KS",
+    "hotneutral": "hot",
+    "start": 1.25,
+    "end": 1.5,
+    "word": "bath",
+    "vowel": "a",
+}
+
+
+def fingerprint(manifest, item=ITEM, clip_type="vowel", source_hash="abc", **kwargs):
+    return manifest.fingerprint_item(dict(item), clip_type, source_hash, **kwargs)
+
+
+def test_fingerprints_follow_the_inputs(tmp_path):
+    manifest = Manifest(tmp_path / "manifest.json")
+    original = fingerprint(manifest)
+    assert fingerprint(manifest) == original
+
+    # Derived fields are not part of the annotation
+    derived = dict(ITEM, audiofilepath="audio_files/vowels/bath.wav", clipindex=3)
+    assert fingerprint(manifest, derived) == original
+
+    assert fingerprint(manifest, dict(ITEM, end=1.51)) != original
+    assert fingerprint(manifest, dict(ITEM, word="bass")) != original
+    assert fingerprint(manifest, clip_type="fric") != original
+    assert fingerprint(manifest, source_hash="abd") != original
+    assert fingerprint(manifest, variant={"frames": "recording"}) != original
+    assert fingerprint(manifest, variant={"columns": ["Loudness_sma3"]}) != original
+
+
+def test_save_and_load(tmp_path):
+    path = tmp_path / "manifest.json"
+    manifest = Manifest(path)
+    kept = fingerprint(manifest)
+    manifest.record_item(kept, {"features": "key", "clip": None})
+    manifest.record_item("stale", {"features": "old", "clip": None})
+    manifest.record_source("original_audio/KS_hot.wav", "abc")
+    manifest.save(prune=True)
+
+    loaded = Manifest(path)
+    assert loaded.items == {kept: {"features": "key", "clip": None}}
+    assert loaded.sources == {"original_audio/KS_hot.wav": "abc"}
+    assert loaded.item_outputs("stale") is None
+
+
+@pytest.mark.parametrize(
+    "contents",
+    ["{not json", json.dumps({"version": MANIFEST_VERSION + 1, "items": {"a": {}}})],
+)
+def test_unreadable_manifests_start_empty(tmp_path, contents):
+    path = tmp_path / "manifest.json"
+    path.write_text(contents)
+    assert Manifest(path).items == {}
+
+
+def test_plots_are_current_for_the_same_inputs(tmp_path):
+    manifest = Manifest(tmp_path / "manifest.json")
+    plot_path = tmp_path / "plot.png"
+    manifest.record_plot(plot_path, ["b", "a"])
+    # Not drawn yet
+    assert not manifest.plot_is_current(plot_path, ["a", "b"])
+
+    plot_path.touch()
+    assert manifest.plot_is_current(plot_path, ["a", "b"])
+    assert not manifest.plot_is_current(plot_path, ["a", "b", "c"])
+    assert not manifest.plot_is_current(plot_path, ["a"])
+
+
+@pytest.fixture
+def corpus_dir(tmp_path, monkeypatch):
+    generate_corpus(tmp_path, speakers=1, conditions=2, minutes=0.1)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+# Counts the clips cut by the dataset builders
+@pytest.fixture
+def cut_clips(monkeypatch):
+    cut = []
+    attach_audio_clip = audio_processing.attach_audio_clip
+
+    def counting(item, *args, **kwargs):
+        cut.append((item["speaker"], item["hotneutral"], item["start"]))
+        return attach_audio_clip(item, *args, **kwargs)
+
+    monkeypatch.setattr(audio_processing, "attach_audio_clip", counting)
+    return cut
+
+
+def build(items):
+    manifest = Manifest()
+    items = process_data_items(
+        [dict(item) for item in items],
+        in_memory=True,
+        export_clips=False,
+        feature_cache=FeatureCache(),
+        manifest=manifest,
+    )
+    manifest.save(prune=True)
+    return items
+
+
+def get_features(items):
+    return [item["analysisobj"].feature_data for item in items]
+
+
+def test_reruns_only_redo_changed_items(corpus_dir, cut_clips):
+    items = get_annotations()["vowels"]
+    first = build(items)
+    assert len(cut_clips) == len(items)
+
+    cut_clips.clear()
+    second = build(items)
+    assert cut_clips == []
+    assert all(a.equals(b) for a, b in zip(get_features(first), get_features(second)))
+
+    # One edited annotation
+    items[3] = dict(items[3], end=float(items[3]["end"]) - 0.01)
+    build(items)
+    assert cut_clips == [("KS", items[3]["hotneutral"], items[3]["start"])]
+
+
+def test_changed_recordings_redo_their_items(corpus_dir, cut_clips):
+    items = get_annotations()["vowels"]
+    build(items)
+
+    path = corpus_dir / "original_audio" / "KS_hot.wav"
+    data = bytearray(path.read_bytes())
+    data[-2:] = b"\x01\x01"
+    path.write_bytes(bytes(data))
+
+    cut_clips.clear()
+    build(items)
+    assert sorted(cut_clips) == sorted(
+        (item["speaker"], item["hotneutral"], item["start"])
+        for item in items
+        if item["hotneutral"] == "hot"
+    )
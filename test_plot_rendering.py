@@ -0,0 +1,117 @@
+import gc
+import weakref
+
+import pytest
+
+from audio_processing import process_data_items
+from benchmark import generate_corpus
+from feature_cache import FeatureCache
+from feature_store import FeatureStore
+from manifest import Manifest
+from plot_rendering import PlotJob, assign_styles, render_plots
+from plot_spectraltilt import get_obstruent_labels, get_spectraltilt_plot_jobs
+from plot_vowel_plots import get_vowel_plot_jobs
+from sharding import get_annotations
+
+FIGURES = []
+
+
+# Module level, so the jobs can be sent to the worker processes
+def draw_line(figure, values):
+    FIGURES.append(weakref.ref(figure))
+    figure.subplots().plot(values)
+
+
+def make_jobs(tmp_path):
+    return [
+        PlotJob(
+            str(tmp_path / "plots" / f"line{i}.png"), draw_line, ([1, i, 2],), (4, 3)
+        )
+        for i in range(3)
+    ]
+
+
+def test_workers_render_the_same_plots(tmp_path):
+    serial = render_plots(make_jobs(tmp_path / "serial"))
+    parallel = render_plots(make_jobs(tmp_path / "parallel"), workers=2)
+    assert len(parallel) == 3
+    for serial_path, parallel_path in zip(serial, parallel):
+        with open(serial_path, "rb") as f, open(parallel_path, "rb") as g:
+            assert f.read() == g.read()
+
+
+def test_figures_are_freed(tmp_path):
+    FIGURES.clear()
+    render_plots(make_jobs(tmp_path))
+    gc.collect()
+    assert len(FIGURES) == 3
+    assert all(figure() is None for figure in FIGURES)
+
+
+def test_styles_cycle_after_the_fixed_ones():
+    styles = assign_styles(["KS", "AB", "SD", "CD", "EF"], ["o", "s"], {"KS": "^"})
+    assert styles == {"KS": "^", "AB": "o", "SD": "s", "CD": "o", "EF": "s"}
+
+
+@pytest.fixture(scope="module")
+def corpus_dir(tmp_path_factory):
+    corpus_dir = tmp_path_factory.mktemp("corpus")
+    generate_corpus(corpus_dir, speakers=2, conditions=2, minutes=0.1)
+    return corpus_dir
+
+
+# Datasets of a small corpus built with a manifest, as an incremental run does
+@pytest.fixture
+def built(corpus_dir, monkeypatch):
+    monkeypatch.chdir(corpus_dir)
+    manifest = Manifest()
+    datasets = {
+        name: process_data_items(
+            items,
+            clip_type,
+            in_memory=True,
+            export_clips=False,
+            feature_cache=FeatureCache(),
+            manifest=manifest,
+        )
+        for (name, items), clip_type in zip(
+            get_annotations().items(), ["vowel", "fric"]
+        )
+    }
+    return datasets, manifest
+
+
+def test_only_changed_vowel_plots_are_redrawn(built):
+    datasets, manifest = built
+    vowels = datasets["vowels"]
+    store = FeatureStore.from_dataset(vowels)
+    jobs = get_vowel_plot_jobs(vowels, store, manifest)
+    assert len(jobs) == 2
+    render_plots(jobs, manifest)
+    assert get_vowel_plot_jobs(vowels, store, manifest) == []
+
+    # Every vowel is on both plots
+    vowels[0]["fingerprint"] = "changed"
+    assert len(get_vowel_plot_jobs(vowels, store, manifest)) == 2
+
+
+def test_only_changed_tilt_plots_are_redrawn(built):
+    datasets, manifest = built
+    frics = datasets["frics"]
+    labels = get_obstruent_labels(frics)[:3]
+    jobs = get_spectraltilt_plot_jobs(frics, manifest, labels)
+    assert len(jobs) == 3
+    render_plots(jobs, manifest, workers=2)
+    assert get_spectraltilt_plot_jobs(frics, manifest, labels) == []
+
+    # The last clip of a speaker and room is the one on the plot
+    fricative, word = labels[1].split("-", 1)
+    plotted = [
+        item
+        for item in frics
+        if (item["fricative"], item["word"]) == (fricative, word)
+        and (item["speaker"], item["hotneutral"]) == ("KS", "hot")
+    ][-1]
+    plotted["fingerprint"] = "changed"
+    [job] = get_spectraltilt_plot_jobs(frics, manifest, labels)
+    assert job.path.endswith(f"spectraltiltcomp_{labels[1]}.png")
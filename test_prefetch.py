@@ -0,0 +1,117 @@
+import threading
+
+import pytest
+
+import audio_processing
+from audio_processing import (
+    get_analysis_options,
+    get_fricative_start_stops,
+    get_item_clips,
+    process_data_items,
+)
+from benchmark import generate_corpus
+from prefetch import PrefetchStats, prefetch
+from sharding import get_annotations
+
+
+GROUPS = [[(group, i) for i in range(size)] for group, size in enumerate([5, 0, 3, 8])]
+
+
+def produce(group):
+    yield from group
+
+
+@pytest.mark.parametrize("threads", [1, 3])
+@pytest.mark.parametrize("depth", [1, 4])
+def test_values_of_a_group_stay_in_order(threads, depth):
+    stats = PrefetchStats()
+    values = list(prefetch(GROUPS, produce, depth, threads, stats=stats))
+
+    assert sorted(values) == sorted(value for group in GROUPS for value in group)
+    for group in GROUPS:
+        assert [value for value in values if value in group] == group
+    assert stats.values == len(values)
+    assert stats.max_depth <= depth
+
+
+def test_one_thread_keeps_the_group_order():
+    values = list(prefetch(GROUPS, produce, 2, stats=PrefetchStats()))
+    assert values == [value for group in GROUPS for value in group]
+
+
+def test_reader_errors_reach_the_caller():
+    def failing(group):
+        yield group[0]
+        raise ValueError("unreadable recording")
+
+    with pytest.raises(ValueError, match="unreadable recording"):
+        list(prefetch(GROUPS[:1], failing, 2, stats=PrefetchStats()))
+
+
+# A consumer that stops early must not leave a group half read and open
+def test_stopping_early_closes_the_groups():
+    closed = []
+    started = threading.Event()
+
+    def endless(group):
+        try:
+            started.set()
+            while True:
+                yield group
+        finally:
+            closed.append(group)
+
+    values = prefetch(["a", "b"], endless, 1, threads=2, stats=PrefetchStats())
+    assert next(values) in ["a", "b"]
+    started.wait()
+    values.close()
+    assert sorted(closed) == ["a", "b"]
+
+
+@pytest.fixture(scope="module")
+def corpus_dir(tmp_path_factory):
+    corpus_dir = tmp_path_factory.mktemp("corpus")
+    generate_corpus(corpus_dir, speakers=1, conditions=2, minutes=0.1)
+    return corpus_dir
+
+
+def test_stopping_early_closes_the_recordings(corpus_dir, monkeypatch):
+    caches = []
+
+    class TrackedCache(audio_processing.SourceAudioCache):
+        def __init__(self):
+            super().__init__()
+            caches.append(self)
+
+    monkeypatch.chdir(corpus_dir)
+    monkeypatch.setattr(audio_processing, "SourceAudioCache", TrackedCache)
+    items = get_fricative_start_stops(
+        "original_audio/TextGrids/KS_hot.TextGrid", "hot", "KS"
+    )
+    assert len(items) > 1
+
+    clips = audio_processing._read_recording_clips(
+        list(enumerate(items)), "fric", export_indices=set()
+    )
+    assert "audioclip" in next(clips)
+    assert caches[0]._recordings
+    clips.close()
+    assert not caches[0]._recordings
+
+
+def test_prefetching_matches_serial(corpus_dir, monkeypatch):
+    monkeypatch.chdir(corpus_dir)
+    items = get_annotations()["frics"]
+    expected = get_item_clips(items)
+
+    process_data_items(
+        items,
+        "fric",
+        in_memory=True,
+        export_clips=False,
+        analysis_options=get_analysis_options(["Loudness_sma3"]),
+        prefetch_depth=2,
+        reader_threads=2,
+    )
+    assert [item["audioclip"] for item in items] == expected
+    assert all(item["analysisobj"].feature_data is not None for item in items)
@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import audio_processing
+from audio_processing import (
+    create_audio_data_object,
+    get_analysis_options,
+    get_item_clip,
+    process_data_items,
+)
+from benchmark import generate_corpus
+from feature_cache import FeatureCache
+from recording_features import RecordingFeatures, extract_recording_features
+from sharding import get_annotations
+
+
+HOP_NS = 10**7
+WINDOW_NS = 2 * HOP_NS
+# The last frame spans the longest window, like OpenSMILE's
+TAIL_NS = 5 * HOP_NS
+
+
+def make_recording(frames=100):
+    starts = np.arange(frames, dtype=np.int64) * HOP_NS
+    ends = starts + WINDOW_NS
+    ends[-1] = starts[-1] + TAIL_NS
+    index = pd.MultiIndex.from_arrays(
+        [pd.to_timedelta(starts, unit="ns"), pd.to_timedelta(ends, unit="ns")],
+        names=["start", "end"],
+    )
+    values = np.stack([np.arange(frames), -np.arange(frames)], axis=1)
+    return pd.DataFrame(values, index=index, columns=["a", "b"], dtype=np.float32)
+
+
+# The frames starting inside the clip with the longest window still in it
+def scan_frame_range(starts, start, end):
+    rows = [
+        row
+        for row, frame_start in enumerate(starts)
+        if frame_start >= round(start * 1e9)
+        and frame_start + TAIL_NS <= round(end * 1e9)
+    ]
+    return (rows[0], rows[-1] + 1) if rows else None
+
+
+CLIPS = [
+    (0.0, 0.25),
+    (0.1, 0.4),
+    (0.105, 0.4),
+    (0.1, 0.15),
+    (0.1, 0.149),
+    (0.3, 0.3),
+    (0.95, 1.5),
+    (2.0, 3.0),
+]
+
+
+@pytest.mark.parametrize("start, end", CLIPS)
+def test_frame_range_matches_a_scan(start, end):
+    recording = RecordingFeatures(make_recording())
+    assert recording.tail_ns == TAIL_NS
+    first, last = recording.frame_range(start, end)
+    expected = scan_frame_range(recording.starts, start, end)
+    if expected is None:
+        assert first == last
+    else:
+        assert (first, last) == expected
+
+
+def test_clip_frames_are_relative_to_the_clip():
+    recording = RecordingFeatures(make_recording())
+    clip = recording.clip_feature_data(0.1, 0.4, file="clip.wav")
+
+    assert list(clip.index.names) == ["file", "start", "end"]
+    assert (clip.index.get_level_values("file") == "clip.wav").all()
+    starts = clip.index.get_level_values("start").asi8
+    ends = clip.index.get_level_values("end").asi8
+    np.testing.assert_array_equal(starts, np.arange(len(clip)) * HOP_NS)
+    np.testing.assert_array_equal(ends[:-1], starts[:-1] + WINDOW_NS)
+    assert ends[-1] == starts[-1] + TAIL_NS
+    np.testing.assert_array_equal(clip["a"], np.arange(10, 10 + len(clip)))
+
+    # The clip owns its values
+    clip.iloc[0, 0] = -1.0
+    assert recording.values[10, 0] == 10
+
+
+def test_empty_clips():
+    recording = RecordingFeatures(make_recording())
+    clip = recording.clip_feature_data(0.3, 0.3)
+    assert len(clip) == 0
+    assert list(clip.columns) == ["a", "b"]
+
+
+@pytest.fixture(scope="module")
+def corpus_dir(tmp_path_factory):
+    corpus_dir = tmp_path_factory.mktemp("corpus")
+    generate_corpus(corpus_dir, speakers=1, conditions=2, minutes=0.1)
+    return corpus_dir
+
+
+ANALYSIS_OPTIONS = get_analysis_options(
+    ["Loudness_sma3", "F0semitoneFrom27.5Hz_sma3nz"]
+)
+
+
+# On the hop grid a clip gets the frames of an extraction on its own, and away
+# from its edges OpenSMILE computes the same values
+@pytest.mark.parametrize("start, end", [(0.0, 0.25), (1.0, 1.3), (3.0, 3.333)])
+def test_sliced_clips_match_clip_extraction(corpus_dir, monkeypatch, start, end):
+    monkeypatch.chdir(corpus_dir)
+    recording = extract_recording_features(
+        "original_audio/KS_hot.wav", analysis_options=ANALYSIS_OPTIONS
+    )
+    item = {"speaker": "KS", "hotneutral": "hot", "start": start, "end": end}
+    expected = create_audio_data_object(
+        "clip.wav", get_item_clip(item), analysis_options=ANALYSIS_OPTIONS
+    ).feature_data
+    sliced = recording.clip_feature_data(start, end)
+
+    assert len(sliced) == len(expected)
+    np.testing.assert_array_equal(
+        sliced.index.get_level_values("start").asi8,
+        expected.index.get_level_values("start").asi8,
+    )
+    # The clip's own last frame ends with its audio, off the hop grid
+    np.testing.assert_array_equal(
+        sliced.index.get_level_values("end").asi8[:-1],
+        expected.index.get_level_values("end").asi8[:-1],
+    )
+    np.testing.assert_allclose(
+        sliced.to_numpy()[2:-2], expected.to_numpy()[2:-2], atol=1e-5
+    )
+
+
+def test_each_recording_is_extracted_once(corpus_dir, monkeypatch):
+    monkeypatch.chdir(corpus_dir)
+    extracted = []
+
+    def counting(recording_path, *args, **kwargs):
+        extracted.append(str(recording_path))
+        return extract_recording_features(recording_path, *args, **kwargs)
+
+    monkeypatch.setattr(audio_processing, "extract_recording_features", counting)
+
+    def build():
+        return process_data_items(
+            get_annotations()["vowels"],
+            in_memory=True,
+            export_clips=False,
+            feature_cache=FeatureCache(),
+            whole_recording=True,
+            analysis_options=ANALYSIS_OPTIONS,
+        )
+
+    items = build()
+    assert sorted(extracted) == [
+        "original_audio/KS_hot.wav",
+        "original_audio/KS_neutral.wav",
+    ]
+    assert all(len(item["analysisobj"].feature_data) > 0 for item in items)
+
+    # The second run loads the recordings' frames from the cache
+    cached = build()
+    for item, cached_item in zip(items, cached):
+        assert item["analysisobj"].feature_data.equals(
+            cached_item["analysisobj"].feature_data
+        )
@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+
+from audio_processing import get_analysis_options, process_data_items
+from benchmark import generate_corpus
+from feature_store import FeatureStore
+from plot_spectraltilt import add_spectral_features
+from sharding import (
+    DATASETS,
+    _item_fields,
+    get_annotations,
+    get_plot_clip_positions,
+    get_shard_index,
+    get_shard_path,
+    merge_shards,
+    run_local_shards,
+    run_shard,
+)
+
+
+SHARD_COUNT = 3
+
+
+# A small synthetic corpus, the pipeline reads it from the working directory
+@pytest.fixture(scope="module")
+def corpus_dir(tmp_path_factory):
+    corpus_dir = tmp_path_factory.mktemp("corpus")
+    generate_corpus(corpus_dir, speakers=3, conditions=2, minutes=0.1)
+    return corpus_dir
+
+
+# The datasets of a single-node run, built like run_shard builds its part
+@pytest.fixture(scope="module")
+def single_node(corpus_dir):
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(corpus_dir)
+        datasets = {}
+        for name, items in get_annotations().items():
+            process_data_items(
+                items, dict(DATASETS)[name], in_memory=True, export_clips=False
+            )
+            if name == "frics":
+                add_spectral_features(items)
+            store = FeatureStore.from_dataset(items, release_features=True)
+            datasets[name] = (items, store)
+        return datasets
+
+
+@pytest.fixture(scope="module")
+def merged(corpus_dir, tmp_path_factory):
+    output_dir = tmp_path_factory.mktemp("shards")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(corpus_dir)
+        for shard_index in range(SHARD_COUNT):
+            run_shard(shard_index, SHARD_COUNT, output_dir)
+    return output_dir, merge_shards(SHARD_COUNT, output_dir)
+
+
+def test_every_shard_gets_recordings(single_node):
+    items, _ = single_node["vowels"]
+    shards = {
+        get_shard_index(item["speaker"], item["hotneutral"], SHARD_COUNT)
+        for item in items
+    }
+    assert len(shards) > 1
+
+
+@pytest.mark.parametrize("name", [name for name, _ in DATASETS])
+def test_merge_matches_single_node(single_node, merged, name):
+    items, store = single_node[name]
+    merged_items, merged_store = merged[1][name]
+
+    assert [_item_fields(item) for item in merged_items] == [
+        _item_fields(item) for item in items
+    ]
+    assert [item["clipindex"] for item in merged_items] == list(range(len(items)))
+
+    assert merged_store.columns == store.columns
+    np.testing.assert_array_equal(merged_store.offsets, store.offsets)
+    np.testing.assert_array_equal(merged_store.frames, store.frames)
+    np.testing.assert_array_equal(merged_store.frame_times, store.frame_times)
+    for key, values in store.metadata.items():
+        np.testing.assert_array_equal(merged_store.metadata[key], values)
+    assert merged_store.summarize().equals(store.summarize())
+
+
+def test_merge_keeps_the_plotted_clips(single_node, merged):
+    items, _ = single_node["frics"]
+    merged_items, _ = merged[1]["frics"]
+    positions = get_plot_clip_positions(items)
+    assert positions
+    for position in positions:
+        assert merged_items[position]["audioclip"] == items[position]["audioclip"]
+
+
+def test_merge_needs_every_shard(merged):
+    output_dir, _ = merged
+    with pytest.raises(FileNotFoundError):
+        merge_shards(SHARD_COUNT + 1, output_dir)
+
+
+def test_merge_rejects_shards_of_other_runs(merged, tmp_path):
+    output_dir, _ = merged
+    # Shards of a two-shard run, one of which is really shard 0 of three
+    get_shard_path(0, 2, tmp_path).write_bytes(
+        get_shard_path(0, SHARD_COUNT, output_dir).read_bytes()
+    )
+    get_shard_path(1, 2, tmp_path).write_bytes(
+        get_shard_path(0, SHARD_COUNT, output_dir).read_bytes()
+    )
+    with pytest.raises(ValueError):
+        merge_shards(2, tmp_path)
+
+
+# Options are passed on by name, whichever of them are given
+def test_local_shards_take_options_by_name(single_node, corpus_dir, tmp_path):
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(corpus_dir)
+        datasets = run_local_shards(
+            SHARD_COUNT,
+            processes=2,
+            output_dir=tmp_path,
+            analysis_options=get_analysis_options(["Loudness_sma3"]),
+        )
+
+    items, store = single_node["vowels"]
+    merged_items, merged_store = datasets["vowels"]
+    assert merged_store.columns == ["Loudness_sma3"]
+    np.testing.assert_array_equal(
+        merged_store.frames[:, 0],
+        store.frames[:, store.column_positions(["Loudness_sma3"])[0]],
+    )
+    assert len(merged_items) == len(items)
@@ -0,0 +1,245 @@
+import os
+
+import numpy as np
+import pytest
+from pydub import AudioSegment
+from scipy.io import wavfile
+from scipy.signal import periodogram
+from scipy.stats import linregress
+
+import plot_spectraltilt
+from plot_spectraltilt import (
+    add_spectral_features,
+    get_item_obstruent_lines,
+    get_psd_cache_key,
+    get_tilt_lines,
+    load_audio_channel,
+)
+
+from spectral_analysis import (
+    SPECTRAL_FEATURES,
+    TILT_MIN_FREQ,
+    PSDCache,
+    band_average_psd,
+    compute_psd,
+    fit_tilt_batch,
+    spectral_features_batch,
+)
+
+
+SAMPLE_RATE = 16000
+NFFT = 512
+FREQUENCIES = np.fft.rfftfreq(NFFT, d=1.0 / SAMPLE_RATE)
+
+
+# PSDs falling off by `slope` dB per decade, with some noise and a silent clip
+def make_psds(slopes=(-6.0, -12.0, 3.0), seed=0):
+    rng = np.random.default_rng(seed)
+    frequencies = np.maximum(FREQUENCIES, FREQUENCIES[1])
+    psds = [
+        10 ** (slope * np.log10(frequencies) / 10)
+        * rng.uniform(0.8, 1.2, len(frequencies))
+        for slope in slopes
+    ]
+    return np.stack(psds + [np.zeros(len(frequencies))])
+
+
+def test_bands_average_their_bins():
+    psd = make_psds()
+    centers, band_psd = band_average_psd(FREQUENCIES, psd, TILT_MIN_FREQ, 8000, 24)
+    edges = np.logspace(np.log10(TILT_MIN_FREQ), np.log10(8000), 25)
+    np.testing.assert_allclose(centers, np.sqrt(edges[:-1] * edges[1:]))
+
+    for band in range(24):
+        in_band = (FREQUENCIES >= edges[band]) & (FREQUENCIES < edges[band + 1])
+        if in_band.any():
+            np.testing.assert_allclose(
+                band_psd[:, band], psd[:, in_band].mean(axis=1), rtol=1e-12
+            )
+        else:
+            # Narrower than the bin spacing
+            assert np.isnan(band_psd[:, band]).all()
+
+
+def test_tilt_fit_matches_linregress():
+    centers, band_psd = band_average_psd(
+        FREQUENCIES, make_psds()[:-1], TILT_MIN_FREQ, 8000
+    )
+    slopes, intercepts = fit_tilt_batch(centers, band_psd)
+    for clip, (slope, intercept) in enumerate(zip(slopes, intercepts)):
+        valid = np.isfinite(band_psd[clip]) & (band_psd[clip] > 0)
+        expected = linregress(
+            np.log10(centers[valid]), 10 * np.log10(band_psd[clip, valid])
+        )
+        assert slope == pytest.approx(expected.slope, rel=1e-9)
+        assert intercept == pytest.approx(expected.intercept, rel=1e-9)
+
+
+def test_tilt_recovers_the_slope():
+    features = spectral_features_batch(FREQUENCIES, make_psds())
+    np.testing.assert_allclose(features["spectraltilt"][:3], [-6, -12, 3], atol=0.5)
+    # No power, no tilt
+    assert np.isnan(features["spectraltilt"][3])
+
+
+# A clip's measures do not depend on the clips it is batched with
+def test_batches_are_row_independent():
+    psd = make_psds()
+    together = spectral_features_batch(FREQUENCIES, psd)
+    for clip in range(len(psd)):
+        alone = spectral_features_batch(FREQUENCIES, psd[clip : clip + 1])
+        for name, values in alone.items():
+            np.testing.assert_array_equal(values, together[name][clip : clip + 1])
+
+
+@pytest.fixture
+def wav_path(tmp_path):
+    path = tmp_path / "clip.wav"
+    write_tone(path)
+    return path
+
+
+def write_tone(path, frequency=440.0, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(SAMPLE_RATE // 4) / SAMPLE_RATE
+    signal = np.sin(2 * np.pi * frequency * t) + 0.1 * rng.normal(size=len(t))
+    wavfile.write(path, SAMPLE_RATE, (signal * 8000).astype(np.int16))
+
+
+# Plot lines come from the cached PSDs, like the summaries
+def test_tilt_lines_are_cached(wav_path):
+    psd_cache = PSDCache(nfft=NFFT)
+    [line] = get_tilt_lines([wav_path], psd_cache)
+    assert get_tilt_lines([wav_path], psd_cache) == [line]
+    assert psd_cache.stats()["hits"] == 1 and psd_cache.stats()["misses"] == 1
+
+    # A clip in memory is known by its samples, not by the object
+    clip = AudioSegment.from_wav(wav_path)
+    assert get_tilt_lines([clip], psd_cache) == [line]
+    assert get_tilt_lines([clip[:]], psd_cache) == [line]
+    assert psd_cache.stats()["misses"] == 2
+
+    # The same line as the features of the clip's PSD
+    sample_rate, signal = load_audio_channel(wav_path)
+    psd = compute_psd(signal, sample_rate, nfft=NFFT)
+    features = spectral_features_batch(FREQUENCIES, psd[None, :])
+    assert line == (
+        SAMPLE_RATE,
+        features["spectraltilt"][0],
+        features["spectraltiltintercept"][0],
+    )
+
+
+def test_rewritten_files_get_new_psds(wav_path):
+    psd_cache = PSDCache(nfft=NFFT)
+    [line] = get_tilt_lines([wav_path], psd_cache)
+    write_tone(wav_path, frequency=2000.0, seed=1)
+    stat = os.stat(wav_path)
+    os.utime(wav_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert get_tilt_lines([wav_path], psd_cache) != [line]
+    assert psd_cache.stats()["misses"] == 2
+
+
+def load_signals(positions):
+    return [(SAMPLE_RATE, np.full(64, position + 1.0)) for position in positions]
+
+
+def test_psd_cache_evicts_the_least_recently_used():
+    psd_cache = PSDCache(nfft=NFFT, max_entries=2)
+    loaded = []
+
+    def load(positions):
+        loaded.extend(keys[position] for position in positions)
+        return load_signals(positions)
+
+    keys = ["a", "b"]
+    psd_cache.get_many(keys, load)
+    keys = ["a", "c"]
+    psd_cache.get_many(keys, load)
+    # "b" was used least recently
+    keys = ["b", "a"]
+    entries = psd_cache.get_many(keys, load)
+    assert loaded == ["a", "b", "c", "b"]
+    assert len(psd_cache) == 2
+    assert psd_cache.stats()["hits"] == 2
+    assert all(sample_rate == SAMPLE_RATE for sample_rate, _ in entries)
+
+    psd_cache.clear()
+    assert psd_cache.stats() == {"entries": 0, "max_entries": 2, "hits": 0, "misses": 0}
+
+
+@pytest.mark.parametrize("length", [100, NFFT, 3 * NFFT + 17])
+def test_psd_methods(length):
+    rng = np.random.default_rng(length)
+    signal = rng.normal(size=length)
+    periodogram_psd = compute_psd(signal, SAMPLE_RATE, "periodogram", NFFT)
+    welch_psd = compute_psd(signal, SAMPLE_RATE, "welch", NFFT)
+    assert periodogram_psd.shape == welch_psd.shape == FREQUENCIES.shape
+
+    if length <= NFFT:
+        _, expected = periodogram(signal, fs=SAMPLE_RATE, nfft=NFFT)
+        np.testing.assert_allclose(periodogram_psd, expected)
+    # Both estimate the same (white) power spectral density
+    assert periodogram_psd[1:-1].mean() == pytest.approx(
+        welch_psd[1:-1].mean(), rel=0.2
+    )
+    with pytest.raises(ValueError):
+        compute_psd(signal, SAMPLE_RATE, "multitaper", NFFT)
+
+
+# Moments of one PSD, computed on their own with the PSD as weights
+def expected_moments(psd):
+    weights = psd / psd.sum()
+    cog = np.sum(weights * FREQUENCIES)
+    variance = np.sum(weights * (FREQUENCIES - cog) ** 2)
+    return {
+        "cog": cog,
+        "spectralspread": np.sqrt(variance),
+        "spectralskewness": np.sum(weights * (FREQUENCIES - cog) ** 3) / variance**1.5,
+        "spectralkurtosis": np.sum(weights * (FREQUENCIES - cog) ** 4) / variance**2
+        - 3,
+        "peakfrequency": FREQUENCIES[np.argmax(psd)],
+    }
+
+
+def test_moments_match_numpy():
+    psd = make_psds()
+    features = spectral_features_batch(FREQUENCIES, psd)
+    for clip in range(len(psd) - 1):
+        for name, value in expected_moments(psd[clip]).items():
+            assert features[name][clip] == pytest.approx(value, rel=1e-9), name
+    assert set(features) == set(SPECTRAL_FEATURES)
+
+
+def test_psd_keys_of_items():
+    item = {"speaker": "KS", "hotneutral": "hot", "start": 1.25, "end": 1.5}
+    assert get_psd_cache_key(item) == ("KS", "hot", "1.25", "1.5")
+    assert get_psd_cache_key(dict(item, start=1.3)) != get_psd_cache_key(item)
+    # The manifest's fingerprint already covers the annotation and recording
+    assert get_psd_cache_key(dict(item, fingerprint="abc")) == "abc"
+
+
+def test_items_share_their_psds_with_the_plots(wav_path, monkeypatch):
+    clip = AudioSegment.from_wav(wav_path)
+    monkeypatch.setattr(
+        plot_spectraltilt, "get_item_clips", lambda items: [clip] * len(items)
+    )
+    items = [
+        {"speaker": "KS", "hotneutral": "hot", "start": 0.0, "end": 0.25},
+        {"speaker": "KS", "hotneutral": "neutral", "start": 0.0, "end": 0.25},
+    ]
+    psd_cache = PSDCache(nfft=NFFT)
+    add_spectral_features(items, psd_cache)
+    assert psd_cache.stats()["misses"] == 2
+    assert items[0]["spectraltilt"] == items[1]["spectraltilt"]
+
+    lines = get_item_obstruent_lines({"KS Hot": items[0]}, psd_cache)
+    assert lines == [
+        (
+            "KS Hot",
+            SAMPLE_RATE,
+            items[0]["spectraltilt"],
+            items[0]["spectraltiltintercept"],
+        )
+    ]
+    assert psd_cache.stats()["misses"] == 2
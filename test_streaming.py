@@ -0,0 +1,52 @@
+import pytest
+
+from audio_processing import (
+    get_all_the_fric_data,
+    get_summary_table,
+    stream_fric_data,
+)
+from benchmark import generate_corpus
+from feature_store import FeatureStore
+from main import can_stream, get_parser
+
+
+@pytest.fixture(scope="module")
+def corpus_dir(tmp_path_factory):
+    corpus_dir = tmp_path_factory.mktemp("corpus")
+    generate_corpus(corpus_dir, speakers=1, conditions=2, minutes=0.1)
+    return corpus_dir
+
+
+def test_streamed_items_drop_their_clips(corpus_dir, monkeypatch):
+    monkeypatch.chdir(corpus_dir)
+    items = list(stream_fric_data(summarize=False))
+    assert items
+    assert not any("audioclip" in item for item in items)
+    assert all(item["analysisobj"].feature_data is not None for item in items)
+
+    kept = list(stream_fric_data(summarize=False, keep_clips=True))
+    assert all("audioclip" in item for item in kept)
+
+
+def test_streamed_summaries_match_the_dataset(corpus_dir, monkeypatch):
+    monkeypatch.chdir(corpus_dir)
+    dataset = get_all_the_fric_data(in_memory=True, export_clips=False)
+    expected = FeatureStore.from_dataset(dataset).summarize()
+
+    summary = get_summary_table(stream_fric_data())
+    assert summary.equals(expected)
+
+
+# Incremental runs keep a manifest, which only the dataset builders update
+@pytest.mark.parametrize(
+    "options, streams",
+    [
+        (["--workers", "1"], False),
+        (["--workers", "1", "--full-rebuild"], True),
+        (["--workers", "1", "--no-feature-cache"], True),
+        (["--workers", "2", "--full-rebuild"], False),
+        (["--workers", "1", "--full-rebuild", "--whole-recording"], False),
+    ],
+)
+def test_only_serial_full_rebuilds_stream(options, streams):
+    assert can_stream(get_parser().parse_args(options + ["summarize"])) == streams
@@ -0,0 +1,135 @@
+import os
+
+import pytest
+import textgrids
+
+from audio_processing import get_fricative_start_stops
+from textgrid_index import (
+    TierIndex,
+    clear_textgrid_cache,
+    get_tier_index,
+    load_textgrid,
+)
+
+
+# Contiguous word intervals, like Praat writes them
+BOUNDS = [0.0, 0.4, 1.0, 1.25, 2.0, 3.5]
+LABELS = ["the", "", "bath", "sea", "just"]
+
+
+def make_tier(bounds=BOUNDS, labels=LABELS):
+    tier = textgrids.Tier()
+    for label, start, end in zip(labels, bounds[:-1], bounds[1:]):
+        tier.append(textgrids.Interval(label, start, end))
+    return tier
+
+
+# The scans the index replaces
+def scan_containing(tier, start, end):
+    matches = [word for word in tier if start > word.xmin and end < word.xmax]
+    return matches[-1] if matches else None
+
+
+def scan_overlapping(tier, start, end):
+    return [word for word in tier if word.xmax > start and word.xmin < end]
+
+
+# Every bound, points just beside them, points inside and outside the tier
+TIMES = sorted(
+    set(BOUNDS + [b + d for b in BOUNDS for d in (-1e-9, 1e-9)] + [-1.0, 0.7, 5.0])
+)
+
+
+def test_containing_matches_a_scan():
+    tier = make_tier()
+    index = TierIndex(tier)
+    for start in TIMES:
+        for end in TIMES:
+            if end >= start:
+                assert index.containing(start, end) is scan_containing(
+                    tier, start, end
+                ), (start, end)
+
+
+def test_containing_excludes_the_bounds():
+    index = TierIndex(make_tier())
+    assert index.containing(1.0, 1.1) is None
+    assert index.containing(1.1, 1.25) is None
+    assert index.containing(1.05, 1.2).text == "bath"
+    # Spanning two words
+    assert index.containing(1.2, 1.3) is None
+
+
+def test_at_prefers_the_later_interval_on_a_bound():
+    index = TierIndex(make_tier())
+    assert index.at(1.0).text == "bath"
+    assert index.at(0.7).text == ""
+    assert index.at(3.5).text == "just"
+    assert index.at(-0.1) is None
+    assert index.at(3.6) is None
+
+
+def test_overlapping_matches_a_scan():
+    tier = make_tier()
+    index = TierIndex(tier)
+    for start in TIMES:
+        for end in TIMES:
+            if end >= start:
+                assert index.overlapping(start, end) == scan_overlapping(
+                    tier, start, end
+                ), (start, end)
+
+
+def test_unsorted_intervals_are_sorted():
+    tier = make_tier()
+    index = TierIndex(list(reversed(tier)))
+    assert [word.xmin for word in index.intervals] == BOUNDS[:-1]
+    assert index.containing(2.1, 3.0).text == "just"
+
+
+def write_textgrid(path, labels=LABELS):
+    praat_audio_textgrid = textgrids.TextGrid()
+    praat_audio_textgrid.xmin = BOUNDS[0]
+    praat_audio_textgrid.xmax = BOUNDS[-1]
+    praat_audio_textgrid["ORT-MAU"] = make_tier(labels=labels)
+    praat_audio_textgrid["fricatives"] = make_tier(
+        [0.0, 1.1, 1.2, 2.2, 2.3, 3.5], ["", "th", "", "s", ""]
+    )
+    praat_audio_textgrid.write(str(path))
+
+
+@pytest.fixture
+def textgrid_path(tmp_path):
+    clear_textgrid_cache()
+    path = tmp_path / "KS_hot.TextGrid"
+    write_textgrid(path)
+    yield path
+    clear_textgrid_cache()
+
+
+def test_textgrids_are_parsed_once(textgrid_path):
+    assert load_textgrid(textgrid_path) is load_textgrid(str(textgrid_path))
+    index = get_tier_index(textgrid_path, "ORT-MAU")
+    assert get_tier_index(textgrid_path, "ORT-MAU") is index
+    assert get_tier_index(textgrid_path, "fricatives") is not index
+
+
+def test_changed_textgrids_are_parsed_again(textgrid_path):
+    index = get_tier_index(textgrid_path, "ORT-MAU")
+    write_textgrid(textgrid_path, ["the", "", "bass", "sea", "just"])
+    # The rewrite can land in the same mtime tick, move the time on
+    stat = os.stat(textgrid_path)
+    os.utime(textgrid_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    changed = get_tier_index(textgrid_path, "ORT-MAU")
+    assert changed is not index
+    assert changed.containing(1.05, 1.2).text == "bass"
+
+
+def test_fricatives_get_their_words(textgrid_path):
+    fricatives = get_fricative_start_stops(textgrid_path, "hot", "KS")
+    assert [(item["fricative"], item["word"]) for item in fricatives] == [
+        ("th", "bath"),
+        ("s", "just"),
+    ]
+    assert fricatives[0]["start"] == 1.1 and fricatives[0]["end"] == 1.2
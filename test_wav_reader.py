@@ -0,0 +1,158 @@
+import struct
+
+import numpy as np
+import pytest
+from pydub import AudioSegment
+from scipy.io import wavfile
+
+from audio_processing import export_audio_clip
+from wav_reader import WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM, WavReader
+
+
+SAMPLE_RATE = 44100
+
+# 1000.68 ms of audio, so pydub's whole-millisecond length ends past the last frame
+FRAMES = 44130
+
+# (start, end) in seconds: sub-millisecond bounds, the very start, ranges ending
+# in the padded last millisecond, past the end and an empty one
+RANGES = [
+    (0.0, 0.25),
+    (0.1234567, 0.3456789),
+    (0.5, 0.5004),
+    (0.9, 1.0),
+    (0.95, 1.0007),
+    (0.99, 2.0),
+    (1.0006, 1.5),
+    (0.3, 0.3),
+]
+
+# (format tag, bits per sample) of every supported sample format
+FORMATS = [
+    (WAVE_FORMAT_PCM, 8),
+    (WAVE_FORMAT_PCM, 16),
+    (WAVE_FORMAT_PCM, 24),
+    (WAVE_FORMAT_PCM, 32),
+    (WAVE_FORMAT_IEEE_FLOAT, 32),
+    (WAVE_FORMAT_IEEE_FLOAT, 64),
+]
+
+
+# Random samples as scipy.io.wavfile returns them, 24-bit left-justified in int32
+def make_samples(format_tag, bits, channels, seed=0):
+    rng = np.random.default_rng(seed)
+    shape = (FRAMES, channels)
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        # Beyond full scale too, read_segment clips those
+        return rng.uniform(-1.2, 1.2, shape).astype(f"<f{bits // 8}")
+    if bits == 8:
+        return rng.integers(0, 256, shape, dtype=np.uint8)
+    if bits == 24:
+        return rng.integers(-(2**23), 2**23, shape, dtype=np.int32) << 8
+    return rng.integers(
+        -(2 ** (bits - 1)), 2 ** (bits - 1), shape, dtype=f"<i{bits // 8}"
+    )
+
+
+# Writes the samples with a LIST chunk before the data, which readers must skip
+def write_wav(path, samples, format_tag, bits):
+    channels = samples.shape[1]
+    if bits == 24:
+        data = (samples >> 8).astype("<i4").view(np.uint8).reshape(-1, 4)[:, :3]
+    else:
+        data = samples
+    data = np.ascontiguousarray(data).tobytes()
+
+    block_align = channels * bits // 8
+    fmt = struct.pack(
+        "<HHIIHH",
+        format_tag,
+        channels,
+        SAMPLE_RATE,
+        SAMPLE_RATE * block_align,
+        block_align,
+        bits,
+    )
+    info = b"INFOISFT\x06\x00\x00\x00tests\x00"
+    chunks = (
+        b"fmt "
+        + struct.pack("<I", len(fmt))
+        + fmt
+        + b"LIST"
+        + struct.pack("<I", len(info))
+        + info
+        + b"data"
+        + struct.pack("<I", len(data))
+        + data
+    )
+    path.write_bytes(b"RIFF" + struct.pack("<I", 4 + len(chunks)) + b"WAVE" + chunks)
+
+
+@pytest.fixture(
+    params=FORMATS, ids=lambda f: f"{'float' if f[0] == 3 else 'pcm'}{f[1]}"
+)
+def sample_format(request):
+    return request.param
+
+
+@pytest.fixture(params=[1, 2], ids=["mono", "stereo"])
+def wav_file(request, tmp_path, sample_format):
+    format_tag, bits = sample_format
+    samples = make_samples(format_tag, bits, request.param)
+    path = tmp_path / "recording.wav"
+    write_wav(path, samples, format_tag, bits)
+    return path, format_tag
+
+
+def test_read_frames_matches_scipy(wav_file):
+    path, _ = wav_file
+    rate, expected = wavfile.read(path)
+    reader = WavReader(path)
+    assert reader.sample_rate == rate
+    assert len(reader) == len(expected)
+
+    frames = reader.read_frames()
+    assert frames.dtype == expected.dtype
+    np.testing.assert_array_equal(frames, expected.reshape(frames.shape))
+    np.testing.assert_array_equal(
+        reader.read_frames(1000, 2345), expected.reshape(frames.shape)[1000:2345]
+    )
+    reader.close()
+
+
+@pytest.mark.parametrize("start, end", RANGES)
+def test_read_segment_matches_pydub(wav_file, start, end):
+    path, format_tag = wav_file
+    reader = WavReader(path)
+    segment = reader.read_segment(start, end)
+    reader.close()
+
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        # pydub cannot read float WAVs, they are cut like the 32-bit PCM recording
+        # of the same full-scale samples
+        _, samples = wavfile.read(path)
+        samples = samples.reshape(FRAMES, -1).astype(np.float64)
+        scaled = np.clip(samples, -1.0, 1.0) * (2**31 - 1)
+        path = path.with_name("recording_pcm32.wav")
+        write_wav(path, scaled.astype("<i4"), WAVE_FORMAT_PCM, 32)
+
+    expected = AudioSegment.from_wav(path)[start * 1000 : end * 1000]
+    assert segment.frame_rate == expected.frame_rate
+    assert segment.channels == expected.channels
+    assert segment.sample_width == expected.sample_width
+    assert segment.raw_data == expected.raw_data
+
+
+# Exported clips are written by pydub itself, without calling ffmpeg
+def test_exported_clip_reads_back_without_ffmpeg(tmp_path, monkeypatch):
+    monkeypatch.setattr(AudioSegment, "converter", str(tmp_path / "no-ffmpeg"))
+    samples = np.arange(-800, 800, dtype=np.int16)
+    clip = AudioSegment(
+        samples.tobytes(), frame_rate=SAMPLE_RATE, sample_width=2, channels=1
+    )
+    path = tmp_path / "audio_files" / "clip.wav"
+    export_audio_clip(clip, path)
+
+    reader = WavReader(path)
+    np.testing.assert_array_equal(reader.read_frames()[:, 0], samples)
+    reader.close()
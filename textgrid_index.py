@@ -0,0 +1,92 @@
+from bisect import bisect_left, bisect_right
+import os
+
+import textgrids
+
+from instrumentation import profiled
+
+
+# Parsed TextGrids and tier indexes, keyed by path and modification time
+_TEXTGRID_CACHE = {}
+_TIER_INDEX_CACHE = {}
+
+
+def _cache_key(path_to_textgrid):
+    path = os.path.abspath(path_to_textgrid)
+    return path, os.stat(path).st_mtime_ns
+
+
+# Parse a TextGrid once and reuse it until the file changes
+@profiled
+def load_textgrid(path_to_textgrid):
+    key = _cache_key(path_to_textgrid)
+    praat_audio_textgrid = _TEXTGRID_CACHE.get(key)
+    if praat_audio_textgrid is None:
+        praat_audio_textgrid = textgrids.TextGrid(path_to_textgrid)
+        _TEXTGRID_CACHE[key] = praat_audio_textgrid
+    return praat_audio_textgrid
+
+
+# Sorted interval index for one tier of a (cached) TextGrid
+def get_tier_index(path_to_textgrid, tier_name):
+    key = (_cache_key(path_to_textgrid), tier_name)
+    tier_index = _TIER_INDEX_CACHE.get(key)
+    if tier_index is None:
+        tier_index = TierIndex(load_textgrid(path_to_textgrid)[tier_name])
+        _TIER_INDEX_CACHE[key] = tier_index
+    return tier_index
+
+
+def clear_textgrid_cache():
+    _TEXTGRID_CACHE.clear()
+    _TIER_INDEX_CACHE.clear()
+
+
+class TierIndex:
+    """
+    Interval index over one TextGrid interval tier.
+
+    Praat interval tiers are sorted and never overlap, so both the start and end
+    times are sorted and every query is a binary search, O(log n) per lookup
+    instead of a scan over the whole tier.
+
+    Parameters
+    ----------
+    tier : textgrids.Tier
+        The interval tier to index.
+    """
+
+    def __init__(self, tier):
+        self.intervals = sorted(tier, key=lambda interval: interval.xmin)
+        self.starts = [interval.xmin for interval in self.intervals]
+        self.ends = [interval.xmax for interval in self.intervals]
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def containing(self, start, end):
+        """
+        Returns the interval strictly containing [start, end], or None.
+        """
+        # Last interval starting before `start`, the only one that can contain it
+        position = bisect_left(self.starts, start) - 1
+        if position >= 0 and end < self.ends[position]:
+            return self.intervals[position]
+        return None
+
+    def at(self, time):
+        """
+        Returns the interval covering `time`, or None.
+        """
+        position = bisect_right(self.starts, time) - 1
+        if position >= 0 and time <= self.ends[position]:
+            return self.intervals[position]
+        return None
+
+    def overlapping(self, start, end):
+        """
+        Returns every interval overlapping [start, end], in time order.
+        """
+        first = bisect_right(self.ends, start)
+        last = bisect_left(self.starts, end)
+        return self.intervals[first:last]
@@ -0,0 +1,196 @@
+import struct
+
+import numpy as np
+from pydub import AudioSegment
+
+
+# WAVE format tags
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Sample dtype of every supported (format, bits per sample), 24-bit is read as bytes
+SAMPLE_DTYPES = {
+    (WAVE_FORMAT_PCM, 8): np.dtype("u1"),
+    (WAVE_FORMAT_PCM, 16): np.dtype("<i2"),
+    (WAVE_FORMAT_PCM, 24): np.dtype("u1"),
+    (WAVE_FORMAT_PCM, 32): np.dtype("<i4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype("<f4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 64): np.dtype("<f8"),
+}
+
+
+class WavReader:
+    """
+    Reads ranges of frames from a WAV file without decoding the rest of it.
+
+    The header is parsed for the sample format, channel layout and the position
+    of the data chunk, which is then memory-mapped. Only the pages of the frames
+    that are read are loaded from disk, so cutting a short clip out of a
+    multi-hour recording costs about as much as reading the clip.
+
+    Parameters
+    ----------
+    path : str or Path
+        The WAV file, PCM (8, 16, 24 or 32-bit) or IEEE float (32 or 64-bit).
+
+    Raises
+    ------
+    ValueError
+        If the file is not a RIFF WAV file or its sample format is unsupported.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._parse_header(f)
+
+        dtype = SAMPLE_DTYPES[(self.format_tag, self.bits_per_sample)]
+        if self.bits_per_sample == 24:
+            shape = (self.frames, self.channels, 3)
+        else:
+            shape = (self.frames, self.channels)
+        if self.frames == 0:
+            # Empty files cannot be mapped
+            self._samples = np.zeros(shape, dtype=dtype)
+        else:
+            self._samples = np.memmap(
+                path, dtype=dtype, mode="r", offset=self.data_offset, shape=shape
+            )
+
+    def _parse_header(self, f):
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise ValueError(f"{self.path} is not a RIFF WAV file")
+        f.seek(0, 2)
+        file_size = f.tell()
+
+        position = 12
+        fmt = None
+        while position + 8 <= file_size:
+            f.seek(position)
+            chunk_id, chunk_size = struct.unpack("<4sI", f.read(8))
+            if chunk_id == b"fmt ":
+                fmt = f.read(chunk_size)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError(f"{self.path} has no fmt chunk before its data")
+                self.data_offset = position + 8
+                # Streamed files may leave the data size unset, read what is there
+                data_size = min(chunk_size, file_size - self.data_offset)
+                break
+            # Chunks are padded to an even size
+            position += 8 + chunk_size + (chunk_size % 2)
+        else:
+            raise ValueError(f"{self.path} has no data chunk")
+
+        (
+            self.format_tag,
+            self.channels,
+            self.sample_rate,
+            _,
+            self.block_align,
+            self.bits_per_sample,
+        ) = struct.unpack("<HHIIHH", fmt[:16])
+        if self.format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+            # The first two bytes of the sub-format GUID are the actual format tag
+            self.format_tag = struct.unpack("<H", fmt[24:26])[0]
+        if (self.format_tag, self.bits_per_sample) not in SAMPLE_DTYPES:
+            raise ValueError(
+                f"Unsupported WAV format {self.format_tag:#06x} with "
+                f"{self.bits_per_sample} bits per sample in {self.path}"
+            )
+
+        self.sample_width = self.bits_per_sample // 8
+        self.frames = data_size // self.block_align
+
+    def __len__(self):
+        return self.frames
+
+    @property
+    def duration(self):
+        return self.frames / self.sample_rate
+
+    def frame_range(self, start, end):
+        """
+        Frames covering [start, end] (in seconds), rounded like slicing a pydub
+        AudioSegment in milliseconds. Like pydub, the range is clipped to the
+        recording's length in whole milliseconds, which can end up to a
+        millisecond past the last frame.
+        """
+        length_ms = round(1000 * (self.frames / self.sample_rate))
+        frames_per_ms = self.sample_rate / 1000.0
+        start_frame = int(min(float(start) * 1000, length_ms) * frames_per_ms)
+        end_frame = int(min(float(end) * 1000, length_ms) * frames_per_ms)
+        return start_frame, end_frame
+
+    def read_frames(self, start_frame=0, end_frame=None):
+        """
+        Returns frames [start_frame, end_frame) as a (frames, channels) array,
+        with the same dtype and values as `scipy.io.wavfile.read`.
+        """
+        samples = self._samples[start_frame:end_frame]
+        if self.bits_per_sample != 24:
+            return np.array(samples)
+        # 24-bit samples are returned left-justified in int32
+        widened = np.zeros(samples.shape[:2] + (4,), dtype=np.uint8)
+        widened[..., 1:] = samples
+        return widened.view("<i4")[..., 0]
+
+    def read(self, start=None, end=None):
+        """
+        Returns the frames of [start, end] (in seconds), the whole file by default.
+        """
+        if start is None and end is None:
+            return self.read_frames()
+        start_frame, end_frame = self.frame_range(
+            0 if start is None else start, self.duration if end is None else end
+        )
+        return self.read_frames(start_frame, min(end_frame, self.frames))
+
+    def read_segment(self, start, end):
+        """
+        Returns [start, end] (in seconds) as an AudioSegment with the same samples
+        as ``AudioSegment.from_wav(path)[start * 1000 : end * 1000]``.
+
+        Float recordings, which pydub cannot read, become 32-bit PCM clips.
+        """
+        start_frame, end_frame = self.frame_range(start, end)
+        samples = self.read_frames(start_frame, end_frame)
+        sample_width = self.sample_width
+
+        if self.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+            # Scaled in float64, full scale in float32 rounds up to 2**31
+            scaled = np.clip(samples.astype(np.float64), -1.0, 1.0) * (2**31 - 1)
+            samples = scaled.astype("<i4")
+            sample_width = 4
+        elif self.bits_per_sample == 8:
+            # pydub stores 8-bit audio as signed
+            samples = (samples.astype(np.int16) - 128).astype(np.int8)
+        elif self.bits_per_sample == 24:
+            # pydub widens 24-bit audio with the sign in the low byte
+            samples = samples | np.where(samples < 0, 0xFF, 0).astype("<i4")
+            sample_width = 4
+
+        # A range ending in the last millisecond is padded with silence like
+        # pydub does, unless it holds no frame at all
+        missing_frames = end_frame - start_frame - len(samples)
+        if missing_frames > 0 and len(samples):
+            silence = np.zeros((missing_frames, self.channels), dtype=samples.dtype)
+            samples = np.concatenate([samples, silence])
+
+        return AudioSegment(
+            data=np.ascontiguousarray(samples).tobytes(),
+            sample_width=sample_width,
+            frame_rate=self.sample_rate,
+            channels=self.channels,
+        )
+
+    def close(self):
+        """
+        Unmaps the file. Arrays returned earlier stay valid, they are copies.
+        """
+        mmap = getattr(self._samples, "_mmap", None)
+        self._samples = None
+        if mmap is not None:
+            mmap.close()